@@ -31,10 +31,21 @@ from .armature import (
     NKT_OT_mixamo_rename_bones,
     NKT_OT_mixamo_prepare_anim_rig
 )
+from .pruning import NKT_OT_prune_character_actions
+from .reduction import NKT_OT_reduce_character_actions
+# Imported for its 'run_manifest' worker task, registered on import.
+from . import pipeline  # noqa: F401
+from .channels import clear_channel_indices, on_depsgraph_update
+from .jobs import (
+    NKT_OT_job_control,
+    NKT_OT_job_monitor,
+    run_jobs
+)
 from .ui import (
     NKT_PT_toolshelf,
     ACTION_UL_character_actions,
-    NKT_PT_character_panel
+    NKT_PT_character_panel,
+    NKT_PT_jobs_panel
 )
 
 
@@ -54,6 +65,8 @@ classes = (
     NKT_OT_remove_character_action,
     NKT_OT_load_character_animation,
     NKT_OT_character_action_move,
+    NKT_OT_prune_character_actions,
+    NKT_OT_reduce_character_actions,
 
     NKT_OT_character_push_to_nla,
     NKT_OT_character_quick_export,
@@ -61,6 +74,9 @@ classes = (
     NKT_OT_add_rootbone,
     NKT_OT_add_rootmotion,
 
+    NKT_OT_job_control,
+    NKT_OT_job_monitor,
+
     NKT_OT_search_character,
     NKT_OT_character_menu,
     NKT_OT_character_actions_menu,
@@ -68,6 +84,7 @@ classes = (
     NKT_PT_toolshelf,
     ACTION_UL_character_actions,
     NKT_PT_character_panel,
+    NKT_PT_jobs_panel,
 )
 
 bl_info = {
@@ -80,6 +97,16 @@ bl_info = {
 }
 
 
+# Handlers after which the cached channel indices and dense samplings may
+# point at freed actions: file loads and undo steps reallocate them.
+cache_handlers = (
+    bpy.app.handlers.load_pre,
+    bpy.app.handlers.load_post,
+    bpy.app.handlers.undo_post,
+    bpy.app.handlers.redo_post
+)
+
+
 def register():
     for cls in classes:
         register_class(cls)
@@ -88,9 +115,21 @@ def register():
         type=NKT_Settings,
         name="Novkreed Tool Settings"
     )
+    for handlers in cache_handlers:
+        handlers.append(clear_channel_indices)
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
 
 
 def unregister():
+    if bpy.app.timers.is_registered(run_jobs):
+        bpy.app.timers.unregister(run_jobs)
+    for handlers in cache_handlers:
+        if clear_channel_indices in handlers:
+            handlers.remove(clear_channel_indices)
+    if on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    clear_channel_indices()
+
     for cls in classes:
         unregister_class(cls)
 
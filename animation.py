@@ -1,15 +1,34 @@
 import os
 import bpy
+import tempfile
 
 from bpy.types import Operator, OperatorFileListElement
 from bpy.props import (
+    BoolProperty,
     CollectionProperty,
     EnumProperty,
+    FloatProperty,
+    IntProperty,
     StringProperty
 )
 from bpy_extras.io_utils import ImportHelper
 
 from .armature import prepare_anim_rig
+from .baker import isolated_evaluation
+from .cache import ImportCache
+from .channels import clear_channel_indices
+from .fbxanim import load_fbx_action
+from .jobs import run_steps, scale_progress, submit_job
+from .nla import sync_nla_tracks
+from .profiles import get_active_profile
+from .pruning import format_prune_stats, prune_action
+from .skeleton import (
+    Skeleton,
+    check_file_skeleton,
+    check_skeleton,
+    hash_rest_pose
+)
+from .workers import iter_worker_tasks, split_jobs, worker_task
 
 
 class NKT_OT_add_character_animation(Operator):
@@ -126,6 +145,312 @@ class NKT_OT_remove_character_action(Operator):
         return self.execute(context=context)
 
 
+def import_animation_file(
+    context,
+    filepath,
+    use_direct_prepare=True,
+    skeleton=None
+):
+    """
+    Imports an FBX animation, prepares its rig and names the action after
+    the file. Returns the imported objects, the action and an error message
+    (None on success). With a character skeleton, files whose skeleton does
+    not match are rejected before the rig is prepared.
+    """
+    action_name = os.path.splitext(os.path.basename(filepath))[0]
+    bpy.ops.object.select_all(action='DESELECT')
+
+    bpy.ops.import_scene.fbx(
+        filepath=filepath,
+        ignore_leaf_bones=True,
+        automatic_bone_orientation=True
+    )
+    imported_objs = list(context.selected_objects)
+    imported_armature = next(
+        (obj for obj in imported_objs if obj.type == 'ARMATURE'),
+        None
+    )
+    if imported_armature is None:
+        return imported_objs, None, (
+            "Imported animation is not valid. No armature found " +
+            "in {}".format(filepath)
+        )
+
+    imported_action = imported_armature.animation_data.action
+    if not imported_action:
+        return imported_objs, None, (
+            "Imported animation is not valid in {}.".format(filepath)
+        )
+
+    if skeleton:
+        mismatch = check_skeleton(skeleton, Skeleton.from_armature(
+            imported_armature, get_active_profile(context)))
+        if mismatch:
+            return imported_objs, None, (
+                "Incompatible skeleton in {}: {}".format(filepath, mismatch)
+            )
+
+    # The imported meshes need not deform while the hip is rebaked.
+    with isolated_evaluation(imported_armature):
+        prepare_anim_rig(context, imported_armature, use_direct_prepare)
+
+    imported_action.name = action_name
+    if len(imported_action.groups) > 0:
+        imported_action.groups[0].name = "NKT Imported"
+
+    return imported_objs, imported_action, None
+
+
+@worker_task('import_animations')
+def import_animations_task(args):
+    """
+    Worker task that imports and prepares args['files'] and writes the
+    resulting actions into the args['library'] .blend file. Files that do
+    not fit the args['skeleton'] hierarchy (if set) are rejected.
+    """
+    context = bpy.context
+    settings = context.scene.nkt_settings
+    settings.bone_map_profile = args['bone_map_profile']
+    settings.bone_map_file = args['bone_map_file']
+    skeleton = None
+    if args['skeleton'] is not None:
+        skeleton = Skeleton(args['skeleton'])
+
+    actions = set()
+    imported = []
+    errors = []
+    for filepath in args['files']:
+        _, action, error = import_animation_file(
+            context, filepath, args['use_direct_prepare'], skeleton)
+        if error:
+            errors.append(error)
+        else:
+            actions.add(action)
+            imported.append((filepath, action.name))
+
+    bpy.data.libraries.write(args['library'], actions, fake_user=True)
+    return {'imported': imported, 'errors': errors}
+
+
+def iter_import_animations_parallel(
+    filepaths,
+    worker_count,
+    use_direct_prepare,
+    skeleton=None
+):
+    """
+    Generator importing the animation files on background workers and
+    appending the prepared actions. Yields progress while the workers run
+    and returns a dict of the appended action per file path and a list of
+    error messages. See import_animation_file for skeleton.
+    """
+    settings = bpy.context.scene.nkt_settings
+    with tempfile.TemporaryDirectory(prefix='nkt_import_') as temp_dir:
+        args_list = [
+            {
+                'files': chunk,
+                'library': os.path.join(
+                    temp_dir, 'actions_{}.blend'.format(i)),
+                'use_direct_prepare': use_direct_prepare,
+                'skeleton': skeleton.parents if skeleton else None,
+                'bone_map_profile': settings.bone_map_profile,
+                'bone_map_file': bpy.path.abspath(settings.bone_map_file)
+            }
+            for i, chunk in enumerate(split_jobs(filepaths, worker_count))
+        ]
+
+        actions = {}
+        errors = []
+        results = yield from iter_worker_tasks('import_animations', args_list)
+        for args, (result, log) in zip(args_list, results):
+            if result is None:
+                errors.append(
+                    "Import worker failed for {}:\n{}"
+                    .format(", ".join(args['files']), log)
+                )
+                continue
+            errors.extend(result['errors'])
+
+            names = [name for _, name in result['imported']]
+            with bpy.data.libraries.load(args['library']) as (
+                data_from, data_to
+            ):
+                data_to.actions = names
+            for (filepath, _), action in zip(
+                result['imported'], data_to.actions
+            ):
+                action.use_fake_user = False
+                actions[filepath] = action
+
+    return actions, errors
+
+
+def iter_import_files(filepaths, options, report, skeleton=None):
+    """
+    Generator importing and preparing the files, one file per step. Returns
+    a dict of the imported action per file path. See import_animation_file
+    for skeleton.
+    """
+    context = bpy.context
+    actions = {}
+    count = max(1, len(filepaths))
+
+    if options['use_animation_only']:
+        armature = context.scene.nkt_settings.get_active_character().armature
+        fps = context.scene.render.fps / context.scene.render.fps_base
+        for i, filepath in enumerate(filepaths):
+            action_name = os.path.splitext(os.path.basename(filepath))[0]
+            try:
+                actions[filepath] = load_fbx_action(
+                    filepath=filepath,
+                    armature=armature,
+                    action_name=action_name,
+                    fps=fps
+                )
+            except ValueError as error:
+                report({'ERROR'}, str(error))
+            yield (i + 1) / count
+        return actions
+
+    if options['use_parallel'] and len(filepaths) > 1:
+        actions, errors = yield from iter_import_animations_parallel(
+            filepaths,
+            options['worker_count'],
+            options['use_direct_prepare'],
+            skeleton
+        )
+        for error in errors:
+            report({'ERROR'}, error)
+        return actions
+
+    remove_list = []
+    try:
+        for i, filepath in enumerate(filepaths):
+            imported_objs, imported_action, error = import_animation_file(
+                context, filepath, options['use_direct_prepare'], skeleton)
+            remove_list.extend(imported_objs)
+            if error:
+                report({'ERROR'}, error)
+            else:
+                actions[filepath] = imported_action
+            yield (i + 1) / count
+    finally:
+        # Delete Imported Armatures, also when the job is cancelled
+        bpy.ops.object.delete({"selected_objects": remove_list})
+
+    # Remove Cleared Keyframe Actions - Mixamo Fix
+    bpy.ops.anim.clear_useless_actions(only_unused=False)
+    clear_channel_indices()
+    return actions
+
+
+def iter_load_animations(filepaths, options, report):
+    """
+    Generator loading the animation files as character actions of the
+    active character, yielding the progress after every file. options holds
+    the settings of NKT_OT_load_character_animation.
+    """
+    context = bpy.context
+    character = context.scene.nkt_settings.get_active_character()
+    current_mode = context.object.mode
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    # Reject files with another skeleton before paying for their import.
+    skeleton = None
+    rejected = {}
+    if options['check_skeleton']:
+        profile = get_active_profile(context)
+        skeleton = Skeleton.from_armature(
+            character.armature, ignored={character.root_bone_name})
+        for path in filepaths:
+            mismatch = check_file_skeleton(path, skeleton, profile)
+            if mismatch:
+                rejected[path] = mismatch
+        filepaths = [path for path in filepaths if path not in rejected]
+
+    actions = {}
+    cache = None
+    if options['use_cache']:
+        cache = ImportCache(max_size=options['cache_size'] << 20)
+        import_options = get_import_options(character, options)
+        keys = {}
+        for path in filepaths:
+            keys[path] = cache.get_key(path, import_options)
+            action_name = os.path.splitext(os.path.basename(path))[0]
+            action = cache.load_action(keys[path], action_name)
+            if action:
+                actions[path] = action
+        yield 0.1
+
+    imported = yield from scale_progress(
+        iter_import_files(
+            [path for path in filepaths if path not in actions],
+            options,
+            report,
+            skeleton
+        ),
+        0.1,
+        0.9
+    )
+    actions.update(imported)
+    prune_lines = []
+    if options['use_pruning']:
+        for path, action in imported.items():
+            stats = prune_action(
+                action, options['prune_tolerance'], options['remove_rest'])
+            prune_lines.append(format_prune_stats(action.name, stats))
+    if cache:
+        for path, action in imported.items():
+            cache.store_action(keys[path], action)
+        cache.save()
+
+    for path in filepaths:
+        if path in actions:
+            bpy.ops.nkt.character_add_animation(
+                target_name=actions[path].name)
+
+    bpy.context.view_layer.objects.active = character.armature
+    bpy.ops.object.mode_set(mode=current_mode)
+    if prune_lines:
+        report({'INFO'}, "Pruned channels:\n" + "\n".join(prune_lines))
+    if rejected:
+        report(
+            {'WARNING'},
+            "Skipped {} incompatible file(s):\n{}".format(
+                len(rejected),
+                "\n".join(
+                    "{}: {}".format(os.path.basename(path), mismatch)
+                    for path, mismatch in rejected.items()
+                )
+            )
+        )
+    report({'INFO'}, "Animations Imported Successfully")
+
+
+def get_import_options(character, options):
+    """Returns the options that change the result of importing a file"""
+    import_options = {
+        'bone_map': get_active_profile().get_key(),
+        'hip_bone_name': character.hip_bone_name,
+        'use_direct_prepare': options['use_direct_prepare'],
+        'use_animation_only': options['use_animation_only'],
+        'use_pruning': options['use_pruning']
+    }
+    if options['use_pruning']:
+        import_options['prune_tolerance'] = options['prune_tolerance']
+        import_options['remove_rest'] = options['remove_rest']
+    if options['use_animation_only']:
+        # These actions are sampled at the scene rate and solved against
+        # the rest pose of the character's rig.
+        render = bpy.context.scene.render
+        armature = character.armature
+        import_options['skeleton'] = Skeleton.from_armature(
+            armature).fingerprint
+        import_options['rest_pose'] = hash_rest_pose(armature)
+        import_options['fps'] = render.fps / render.fps_base
+    return import_options
+
+
 class NKT_OT_load_character_animation(Operator, ImportHelper):
     bl_idname = 'nkt.character_load_animation'
     bl_label = "Load Character Animations"
@@ -134,72 +459,133 @@ class NKT_OT_load_character_animation(Operator, ImportHelper):
     filter_glob: StringProperty(default="*.fbx", options={'HIDDEN'})
     files: CollectionProperty(type=OperatorFileListElement)
     directory: StringProperty(subtype='DIR_PATH')
+    use_direct_prepare: BoolProperty(
+        name="Direct Rig Fix",
+        description=(
+            "Fix the imported scale and rotation by transforming the hip " +
+            "channels directly instead of baking them."
+        ),
+        default=True
+    )
+    use_parallel: BoolProperty(
+        name="Parallel Import",
+        description=(
+            "Import the files on background Blender processes and append " +
+            "the prepared actions."
+        ),
+        default=False
+    )
+    worker_count: IntProperty(
+        name="Workers",
+        description="The number of background Blender processes to use.",
+        default=max(1, (os.cpu_count() or 2) // 2),
+        min=1,
+        max=64
+    )
+    use_animation_only: BoolProperty(
+        name="Animation Only",
+        description=(
+            "Read only the bone animation curves of binary FBX files, " +
+            "without importing any objects. Keys are resampled on every " +
+            "frame; weighted tangents are read as unweighted."
+        ),
+        default=False
+    )
+    check_skeleton: BoolProperty(
+        name="Check Skeleton",
+        description=(
+            "Skip files whose bone names or hierarchy do not match the " +
+            "character's skeleton."
+        ),
+        default=True
+    )
+    use_pruning: BoolProperty(
+        name="Prune Channels",
+        description=(
+            "Remove the constant and rest pose channels of the imported " +
+            "actions."
+        ),
+        default=True
+    )
+    prune_tolerance: FloatProperty(
+        name="Prune Tolerance",
+        description=(
+            "The maximum change of a channel over the action for it to " +
+            "count as constant."
+        ),
+        default=1e-4,
+        min=0.0,
+        precision=6
+    )
+    remove_rest: BoolProperty(
+        name="Remove Rest Channels",
+        description=(
+            "Remove the transform channels that stay at their rest pose " +
+            "value, instead of reducing them to a single value."
+        ),
+        default=True
+    )
+    use_cache: BoolProperty(
+        name="Use Import Cache",
+        description=(
+            "Reuse the prepared actions of files that were imported before " +
+            "with the same options."
+        ),
+        default=True
+    )
+    cache_size: IntProperty(
+        name="Cache Size (MB)",
+        description="The maximum disk space used by the import cache.",
+        default=2048,
+        min=0
+    )
+    use_job: BoolProperty(
+        name="Run in Background",
+        description=(
+            "Import as a job that keeps the interface responsive and can " +
+            "be cancelled."
+        ),
+        default=False
+    )
 
     def execute(self, context):
-        settings = context.scene.nkt_settings
-        character = settings.get_active_character()
-
         if len(self.files) <= 0:
             self.report({'ERROR'}, "No files provided.")
             return {'CANCELLED'}
 
-        current_mode = context.object.mode
-        bpy.ops.object.mode_set(mode='OBJECT')
-        remove_list = []
-        for file in self.files:
-            filename = file.name
-            file_basename = os.path.basename(filename)
-            action_name, ext = os.path.splitext(file_basename)
-            bpy.ops.object.select_all(action='DESELECT')
-            # self.report({'INFO'}, "Action: {}".format(action_name))
-
-            bpy.ops.import_scene.fbx(
-                filepath=os.path.join(self.directory, filename),
-                ignore_leaf_bones=True,
-                automatic_bone_orientation=True
-            )
-            imported_objs = context.selected_objects
-            imported_armature = next(
-                (obj for obj in imported_objs if obj.type == 'ARMATURE'),
-                None
-            )
-            if imported_armature is None:
-                self.report(
-                    {'ERROR'},
-                    "Imported animation is not valid. No armature found " +
-                    "in {}".format(filename)
-                )
-                bpy.ops.object.delete({'selected_objects': imported_objs})
-                continue
-
-            imported_action = imported_armature.animation_data.action
-            if not imported_action:
-                self.report(
-                    {'ERROR'},
-                    "Imported animation is not valid in {}.".format(filename)
-                )
-                bpy.ops.object.delete({'selected_objects': imported_objs})
-                continue
-
-            remove_list.extend(imported_objs)
-            prepare_anim_rig(context, imported_armature)
-
-            imported_action.name = action_name
-            if len(imported_action.groups) > 0:
-                imported_action.groups[0].name = "NKT Imported"
-
-            bpy.ops.nkt.character_add_animation(
-                target_name=imported_action.name)
-
-        # Delete Imported Armatures
-        bpy.ops.object.delete({"selected_objects": remove_list})
-        context.view_layer.objects.active = character.armature
+        try:
+            get_active_profile(context)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
 
-        # Remove Cleared Keyframe Actions - Mixamo Fix
-        bpy.ops.anim.clear_useless_actions(only_unused=False)
-        bpy.ops.object.mode_set(mode=current_mode)
+        filepaths = [
+            os.path.join(self.directory, file.name) for file in self.files
+        ]
+        options = {
+            name: getattr(self, name) for name in (
+                'use_direct_prepare',
+                'use_parallel',
+                'worker_count',
+                'use_animation_only',
+                'check_skeleton',
+                'use_pruning',
+                'prune_tolerance',
+                'remove_rest',
+                'use_cache',
+                'cache_size'
+            )
+        }
 
-        self.report({'INFO'}, "Animations Imported Successfully")
+        if self.use_job:
+            submit_job(
+                "Load Animations",
+                lambda report: iter_load_animations(
+                    filepaths, options, report)
+            )
+            bpy.ops.nkt.job_monitor('INVOKE_DEFAULT')
+        else:
+            run_steps(iter_load_animations(filepaths, options, self.report))
         return {'FINISHED'}
 
 
@@ -234,29 +620,27 @@ class NKT_OT_character_action_move(Operator):
 class NKT_OT_character_push_to_nla(Operator):
     bl_idname = 'nkt.character_push_to_nla'
     bl_label = "Push actions to NLA"
-    bl_description = "Clear armature animation data and push all character action to NLA tracks."
+    bl_description = (
+        "Sync the NLA tracks of the armature with the character actions, " +
+        "one track per action."
+    )
 
     def execute(self, context):
         settings = context.scene.nkt_settings
         character = settings.get_active_character()
         armature = character.armature
 
-        if len(character.actions) < 0:
+        if len(character.actions) <= 0:
             self.report({'ERROR'}, "No actions linked to character.")
             return {'CANCELLED'}
 
-        armature.animation_data_clear()
-
-        for char_action in character.actions:
-            anim_data = armature.animation_data_create()
-            track = anim_data.nla_tracks.new()
-            track.name = char_action.name
-            track.strips.new(
-                name=char_action.name,
-                start=char_action.action.frame_range[0],
-                action=char_action.action
-            )
-
+        anim_data = armature.animation_data or armature.animation_data_create()
+        stats = sync_nla_tracks(anim_data, list(character.actions))
+        self.report(
+            {'INFO'},
+            "NLA synced: {added} added, {removed} removed, {moved} moved, "
+            "{updated} updated.".format(**stats)
+        )
         return {'FINISHED'}
 
 
@@ -278,7 +662,9 @@ class NKT_OT_character_actions_menu(Operator):
              "Unlink and remove the active character action.", 'REMOVE', 3),
             ('LOAD', "Load New", "Load a new file with animation and it as a new character action.", 'NEWFOLDER', 4),
             None,
-            ('PUSH_NLA', "Push to NLA Stash", "Push all the actions of the character to NLA tracks.", 'NLA_PUSHDOWN', 5)
+            ('PUSH_NLA', "Push to NLA Stash", "Push all the actions of the character to NLA tracks.", 'NLA_PUSHDOWN', 5),
+            ('PRUNE', "Prune Channels", "Remove the constant and rest pose channels of character actions.", 'SORTSIZE', 6),
+            ('REDUCE', "Reduce Keyframes", "Remove the keyframes of baked character actions that can be interpolated.", 'IPO_LINEAR', 7)
         ],
         name="Character Actions Menu Options",
         description=""
@@ -299,4 +685,8 @@ class NKT_OT_character_actions_menu(Operator):
                 'INVOKE_DEFAULT', move_type='MOVE_DOWN')
         elif self.menu_options == 'PUSH_NLA':
             bpy.ops.nkt.character_push_to_nla('INVOKE_DEFAULT')
+        elif self.menu_options == 'PRUNE':
+            bpy.ops.nkt.character_prune_actions('INVOKE_DEFAULT')
+        elif self.menu_options == 'REDUCE':
+            bpy.ops.nkt.character_reduce_actions('INVOKE_DEFAULT')
         return {'FINISHED'}
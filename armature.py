@@ -1,114 +1,156 @@
 import bpy
+import time
+import numpy as np
 
-from re import search as regex_search
-from bpy.props import BoolProperty, StringProperty
+from bpy.props import BoolProperty, EnumProperty, StringProperty
 
 from bpy.types import Operator
 from .baker import (
     apply_baker_to_bone,
     extract_loc_rot_from_bone,
-    extract_loc_rot_from_obj
+    extract_loc_rot_from_obj,
+    get_bone_basis_matrices,
+    get_deformed_objects,
+    get_world_loc_rot_matrices,
+    isolated_evaluation,
+    sample_bone_matrices,
+    write_bone_transforms
 )
-
-bone_map = {
-    'Hips': 'pelvis',
-    'Spine': 'spine_01',
-    'Spine1': 'spine_02',
-    'Spine2': 'spine_03',
-    'LeftShoulder': 'clavicle_l',
-    'LeftArm': 'upperarm_l',
-    'LeftForeArm': 'lowerarm_l',
-    'LeftHand': 'hand_l',
-    'RightShoulder': 'clavicle_r',
-    'RightArm': 'upperarm_r',
-    'RightForeArm': 'lowerarm_r',
-    'RightHand': 'hand_r',
-    'Neck1': 'neck_01',
-    'Neck': 'neck_01',
-    'Head': 'head',
-    'LeftUpLeg': 'thigh_l',
-    'LeftLeg': 'calf_l',
-    'LeftFoot': 'foot_l',
-    'RightUpLeg': 'thigh_r',
-    'RightLeg': 'calf_r',
-    'RightFoot': 'foot_r',
-    'LeftHandIndex1': 'index_01_l',
-    'LeftHandIndex2': 'index_02_l',
-    'LeftHandIndex3': 'index_03_l',
-    'LeftHandMiddle1': 'middle_01_l',
-    'LeftHandMiddle2': 'middle_02_l',
-    'LeftHandMiddle3': 'middle_03_l',
-    'LeftHandPinky1': 'pinky_01_l',
-    'LeftHandPinky2': 'pinky_02_l',
-    'LeftHandPinky3': 'pinky_03_l',
-    'LeftHandRing1': 'ring_01_l',
-    'LeftHandRing2': 'ring_02_l',
-    'LeftHandRing3': 'ring_03_l',
-    'LeftHandThumb1': 'thumb_01_l',
-    'LeftHandThumb2': 'thumb_02_l',
-    'LeftHandThumb3': 'thumb_03_l',
-    'RightHandIndex1': 'index_01_r',
-    'RightHandIndex2': 'index_02_r',
-    'RightHandIndex3': 'index_03_r',
-    'RightHandMiddle1': 'middle_01_r',
-    'RightHandMiddle2': 'middle_02_r',
-    'RightHandMiddle3': 'middle_03_r',
-    'RightHandPinky1': 'pinky_01_r',
-    'RightHandPinky2': 'pinky_02_r',
-    'RightHandPinky3': 'pinky_03_r',
-    'RightHandRing1': 'ring_01_r',
-    'RightHandRing2': 'ring_02_r',
-    'RightHandRing3': 'ring_03_r',
-    'RightHandThumb1': 'thumb_01_r',
-    'RightHandThumb2': 'thumb_02_r',
-    'RightHandThumb3': 'thumb_03_r',
-    'LeftToeBase': 'ball_l',
-    'RightToeBase': 'ball_r'
-}
-bone_map_inverse = dict([reversed(i) for i in bone_map.items()])
+from .channels import (
+    invalidate_channel_index,
+    parse_bone_data_path,
+    remove_action
+)
+from .pose import ArmatureRig
+from .profiles import get_active_profile
 
 
 def get_mapped_bone_name(in_name):
-    new_name = bone_map.get(in_name)
-    if new_name:
-        return new_name
-    else:
-        return in_name
+    return get_active_profile().get_mapped_bone_name(in_name)
 
 
 def guess_hip_bone_name(armature):
-    for hip_name in ("hips", "Hips", "pelvis", "Pelvis"):
-        hips = armature.data.bones.get(hip_name)
-        if hips != None:
-            return hip_name
-
-    return ""
+    return get_active_profile().guess_hip_bone_name(armature.data.bones)
 
 
 def remove_namespace(full_name):
-    if full_name in bone_map or full_name in bone_map_inverse:
-        return full_name
-    i = regex_search(r"[:_]", full_name[::-1])
-    if i:
-        return full_name[-(i.start())::]
-    else:
-        return full_name
-
+    return get_active_profile().remove_namespace(full_name)
+
+
+def get_bone_rename_map(names, remove_namespace_only=False):
+    """
+    Returns the old to new name map of the bone names that change when
+    removing namespaces and applying the active bone map profile.
+    """
+    return get_active_profile().get_rename_map(names, remove_namespace_only)
+
+
+def get_animated_actions(armature):
+    """Returns the actions of armature whose paths Blender fixes on rename"""
+    anim_data = armature.animation_data
+    if not anim_data:
+        return set()
+
+    actions = {anim_data.action} if anim_data.action else set()
+    for track in anim_data.nla_tracks:
+        actions.update(
+            strip.action for strip in track.strips if strip.action)
+    return actions
+
+
+def rename_action_bones(action, rename_map):
+    """
+    Rewrites the bone data paths and groups of action with rename_map.
+    Returns the number of rewritten fcurves.
+    """
+    count = 0
+    for fcurve in action.fcurves:
+        parsed = parse_bone_data_path(fcurve.data_path)
+        if parsed and parsed[0] in rename_map:
+            fcurve.data_path = 'pose.bones["{}"].{}'.format(
+                rename_map[parsed[0]], parsed[1])
+            count += 1
+
+    for group in action.groups:
+        if group.name in rename_map:
+            group.name = rename_map[group.name]
+
+    invalidate_channel_index(action)
+    return count
+
+
+def is_skinned(object, armature):
+    """Checks whether object is deformed by armature"""
+    if object.parent == armature and object.parent_type == 'ARMATURE':
+        return True
+    return any(
+        modifier.type == 'ARMATURE' and modifier.object == armature
+        for modifier in object.modifiers
+    )
 
-def rename_bones(armature, remove_namespace_only=False):
-    """function for renaming the armature bones to a target skeleton"""
-    for bone in armature.data.bones:
-        old_name = bone.name
-        new_name = remove_namespace(bone.name)
-        if not remove_namespace_only:
-            new_name = get_mapped_bone_name(new_name)
 
-        bone.name = new_name
+def rename_items(collection, rename_map):
+    """
+    Renames the items of a bpy collection found in rename_map. Names that
+    swap with other renamed items go through unique names first, otherwise
+    Blender would suffix them. Returns the number of renamed items.
+    """
+    items = [
+        (collection[old_name], new_name)
+        for old_name, new_name in rename_map.items()
+        if old_name in collection
+    ]
+    if set(rename_map.values()) & set(rename_map):
+        for i, (item, _) in enumerate(items):
+            item.name = 'NKT_rename_{}'.format(i)
+    for item, new_name in items:
+        item.name = new_name
+    return len(items)
+
+
+def rename_bones(armature, remove_namespace_only=False, actions=()):
+    """
+    function for renaming the armature bones to a target skeleton. The new
+    names are computed once and applied in one pass each to the bones, to
+    the vertex groups of the deformed meshes and to the bone fcurves of the
+    given actions. Returns the rename statistics.
+    """
+    start = time.perf_counter()
+    bones = armature.data.bones
+    rename_map = get_bone_rename_map(
+        [bone.name for bone in bones], remove_namespace_only)
+
+    # Blender fixes the paths of the assigned actions when renaming a bone.
+    animated_actions = get_animated_actions(armature)
+    fcurve_count = sum(
+        rename_action_bones(action, rename_map)
+        for action in set(actions) - animated_actions
+    )
 
-        for mesh in armature.children:
-            for vertex_group in mesh.vertex_groups:
-                if vertex_group.name == old_name:
-                    vertex_group.name = new_name
+    objects = get_deformed_objects(armature)
+    vertex_group_count = sum(
+        vertex_group.name in rename_map
+        for object in objects
+        for vertex_group in object.vertex_groups
+    )
+    bone_count = rename_items(bones, rename_map)
+
+    # Blender fixes the vertex groups of skinned meshes when renaming a bone,
+    # the groups of other children are renamed here.
+    for object in objects:
+        if not is_skinned(object, armature):
+            rename_items(object.vertex_groups, rename_map)
+    for action in animated_actions:
+        invalidate_channel_index(action)
+
+    return {
+        'bones': bone_count,
+        'objects': len(objects),
+        'vertex_groups': vertex_group_count,
+        'actions': len(set(actions) | animated_actions),
+        'fcurves': fcurve_count,
+        'time': time.perf_counter() - start
+    }
 
 
 class NKT_OT_mixamo_rename_bones(Operator):
@@ -127,6 +169,18 @@ class NKT_OT_mixamo_rename_bones(Operator):
         default=False
     )
 
+    action_scope: EnumProperty(
+        items=[
+            ('ASSIGNED', "Assigned",
+             "Only fix the actions assigned to the armature.", 0),
+            ('CHARACTER', "Character",
+             "Also fix the actions of the character using the armature.", 1),
+            ('ALL', "All", "Fix the bone paths of all actions.", 2)
+        ],
+        name="Actions",
+        description="The actions whose bone fcurves are renamed as well."
+    )
+
     def execute(self, context):
         if not self.target_name:
             self.report({'ERROR'}, "The target name is invalid.")
@@ -137,7 +191,31 @@ class NKT_OT_mixamo_rename_bones(Operator):
             self.report({'ERROR'}, "The target is not a valid armature.")
             return {'CANCELLED'}
 
-        rename_bones(target, self.remove_namespace_only)
+        try:
+            get_active_profile(context)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        actions = []
+        if self.action_scope == 'ALL':
+            actions = list(bpy.data.actions)
+        elif self.action_scope == 'CHARACTER':
+            actions = [
+                char_action.action
+                for character in context.scene.nkt_settings.characters
+                if character.armature == target
+                for char_action in character.actions
+                if char_action.action
+            ]
+
+        stats = rename_bones(target, self.remove_namespace_only, actions)
+        self.report(
+            {'INFO'},
+            "Renamed {bones} bones, {vertex_groups} vertex groups on "
+            "{objects} objects and {fcurves} fcurves in {actions} actions "
+            "in {time:.3f}s.".format(**stats)
+        )
         return {'FINISHED'}
 
     def invoke(self, context, event):
@@ -145,13 +223,78 @@ class NKT_OT_mixamo_rename_bones(Operator):
         return self.execute(context)
 
 
-def prepare_anim_rig(context, armature):
+def get_pose_matrices(armature, action, bone_names, start_frame, end_frame):
+    """
+    Returns the armature space pose matrices of the given bones, evaluated
+    analytically when the rig allows it and by stepping the scene otherwise.
+    """
+    if ArmatureRig.is_supported(armature):
+        rig = ArmatureRig(armature)
+        pose = rig.evaluate_action(action, start_frame, end_frame)
+        return {name: pose[:, rig.bone_indices[name]] for name in bone_names}
+
+    return sample_bone_matrices(
+        armature=armature,
+        action=action,
+        bone_names=bone_names,
+        start_frame=start_frame,
+        end_frame=end_frame
+    )
+
+
+def prepare_anim_rig_direct(context, armature, action, hip_bone_name):
+    """
+    Applies the armature object transform and moves it into the hip
+    channels by transforming the hip matrices directly, instead of baking
+    the hip into a helper object and back.
+    """
+    start_frame = int(action.frame_range[0])
+    end_frame = int(action.frame_range[1])
+    armature.animation_data.action = action
+
+    hip_pose = get_pose_matrices(
+        armature, action, [hip_bone_name], start_frame, end_frame
+    )[hip_bone_name]
+    hip_world = get_world_loc_rot_matrices(armature, hip_pose)
+
+    # Apply transformations on selected Armature
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
+    armature.select_set(True)
+    context.view_layer.objects.active = armature
+    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
+
+    # The rest pose has changed, so parent poses are evaluated afterwards.
+    parent = armature.data.bones[hip_bone_name].parent
+    parent_pose = None
+    if parent:
+        parent_pose = get_pose_matrices(
+            armature, action, [parent.name], start_frame, end_frame
+        )[parent.name]
+
+    basis = get_bone_basis_matrices(
+        armature=armature,
+        bone_name=hip_bone_name,
+        pose_matrices=np.linalg.inv(np.array(armature.matrix_world)) @
+        hip_world,
+        parent_pose=parent_pose
+    )
+    write_bone_transforms(action, hip_bone_name, basis, start_frame)
+
+
+def prepare_anim_rig(context, armature, use_direct=False):
     rename_bones(armature)
 
     action = armature.animation_data.action
     start_frame = int(action.frame_range[0])
     end_frame = int(action.frame_range[1])
     hip_bone_name = guess_hip_bone_name(armature)
+
+    if use_direct and (
+        armature.pose.bones[hip_bone_name].rotation_mode == 'QUATERNION'
+    ):
+        prepare_anim_rig_direct(context, armature, action, hip_bone_name)
+        return
     # target_bone_name = hip_bone_name
     # if armature.data.bones[hip_bone_name].parent:
     #     target_bone_name = armature.data.bones[hip_bone_name].parent
@@ -221,7 +364,7 @@ def prepare_anim_rig(context, armature):
     # if root_baker:
     #     root_baker.select_set(True)
     #     bpy.data.actions.remove(root_baker.animation_data.action)
-    bpy.data.actions.remove(scale_baker.animation_data.action)
+    remove_action(scale_baker.animation_data.action)
     bpy.ops.object.delete(use_global=False)
 
 
@@ -235,6 +378,15 @@ class NKT_OT_mixamo_prepare_anim_rig(Operator):
         description="The name of the target armature, whose bones are to be renamed."
     )
 
+    use_direct: BoolProperty(
+        name="Direct Fix",
+        description=(
+            "Transform the hip channels directly instead of baking them " +
+            "through a helper object."
+        ),
+        default=True
+    )
+
     def execute(self, context):
         if not self.target_name:
             self.report({'ERROR'}, "The target name is invalid.")
@@ -245,7 +397,8 @@ class NKT_OT_mixamo_prepare_anim_rig(Operator):
             self.report({'ERROR'}, "The target is not a valid armature.")
             return {'CANCELLED'}
 
-        prepare_anim_rig(context, target)
+        with isolated_evaluation(target):
+            prepare_anim_rig(context, target, self.use_direct)
         return {'FINISHED'}
 
     def invoke(self, context, event):
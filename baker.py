@@ -1,6 +1,29 @@
 import bpy
-from math import pi
-from mathutils import Quaternion
+import numpy as np
+
+from contextlib import contextmanager
+
+from .channels import (
+    get_channel_index,
+    invalidate_channel_index,
+    remove_action
+)
+from .dense import get_action_matrix, write_dense_curve
+from .jobs import run_steps
+
+from .transforms import (
+    compose_matrices,
+    decompose_matrices,
+    fix_quaternion_flips,
+    fix_quaternion_inverts,
+    get_basis_matrices,
+    matrix_to_euler_z,
+    remove_scale,
+    z_rotation_quaternions
+)
+
+# Frames the scene is stepped through per job step while sampling.
+SAMPLE_CHUNK_FRAMES = 16
 
 
 def get_all_quaternion_curves(object):
@@ -8,115 +31,89 @@ def get_all_quaternion_curves(object):
     Returns all quaternion fcurves of object/bones packed together in a touple
     per object/bone
     """
-    fcurves = object.animation_data.action.fcurves
-    if fcurves.find('rotation_quaternion'):
-        yield (
-            fcurves.find('rotation_quaternion', index=0),
-            fcurves.find('rotation_quaternion', index=1),
-            fcurves.find('rotation_quaternion', index=2),
-            fcurves.find('rotation_quaternion', index=3)
-        )
+    channels = get_channel_index(object.animation_data.action)
+    curves = channels.get_vector(None, 'rotation_quaternion', 4)
+    if curves:
+        yield curves
 
     if object.type != 'ARMATURE':
         return
     for bone in object.pose.bones:
-        data_path = 'pose.bones["' + bone.name + '"].rotation_quaternion'
-        if not fcurves.find(data_path):
-            continue
-
-        yield (
-            fcurves.find(data_path, index=0),
-            fcurves.find(data_path, index=1),
-            fcurves.find(data_path, index=2),
-            fcurves.find(data_path, index=3)
-        )
+        curves = channels.get_vector(bone.name, 'rotation_quaternion', 4)
+        if curves:
+            yield curves
 
 
 def quaternion_cleanup(object, prevent_flips=True, prevent_inverts=True):
     """fixes signs in quaternion fcurves swapping from one frame to another"""
-    for curves in get_all_quaternion_curves(object):
-        start = int(min((curves[i].keyframe_points[0].co.x for i in range(4))))
-        end = int(max((curves[i].keyframe_points[-1].co.x for i in range(4))))
-        for curve in curves:
-            for i in range(start, end):
-                curve.keyframe_points.insert(
-                    i, curve.evaluate(i)).interpolation = 'LINEAR'
-        zipped = list(zip(
-            curves[0].keyframe_points,
-            curves[1].keyframe_points,
-            curves[2].keyframe_points,
-            curves[3].keyframe_points))
-        for i in range(1, len(zipped)):
-            if prevent_flips:
-                rot_prev = Quaternion((zipped[i-1][j].co.y for j in range(4)))
-                rot_cur = Quaternion((zipped[i][j].co.y for j in range(4)))
-                diff = rot_prev.rotation_difference(rot_cur)
-                if abs(diff.angle - pi) < 0.5:
-                    rot_cur.rotate(Quaternion(diff.axis, pi))
-                    for j in range(4):
-                        zipped[i][j].co.y = rot_cur[j]
-            if prevent_inverts:
-                change_amount = 0.0
-                for j in range(4):
-                    change_amount += abs(zipped[i-1]
-                                         [j].co.y - zipped[i][j].co.y)
-                if change_amount > 1.0:
-                    for j in range(4):
-                        zipped[i][j].co.y *= -1.0
-
-
-def extract_loc_rot_from_obj(
-    object,
-    action,
-    start_frame,
-    end_frame,
-    baker_name
-):
-    # Set the scene for curr actions
-    object.animation_data.action = action
-
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.empty_add(
-        type='ARROWS', radius=1, align='WORLD', location=(0, 0, 0)
-    )
-
-    baker = bpy.context.object
-    baker.name = baker_name
-    baker.rotation_mode = 'QUATERNION'
+    matrix = get_action_matrix(object.animation_data.action)
+    names = [None]
+    if object.type == 'ARMATURE':
+        names.extend(bone.name for bone in object.pose.bones)
+
+    fixed_columns = []
+    for name in names:
+        columns = matrix.get_columns(name, 'rotation_quaternion', 4)
+        if min(columns) < 0:
+            continue
 
-    bpy.ops.object.constraint_add(type='COPY_LOCATION')
-    baker.constraints["Copy Location"].target = object
+        quats = matrix.values[:, columns].astype(np.float64)
+        if prevent_flips:
+            fix_quaternion_flips(quats)
+        if prevent_inverts:
+            fix_quaternion_inverts(quats)
+        matrix.values[:, columns] = quats
+        fixed_columns.extend(columns)
 
-    bpy.ops.object.constraint_add(type='COPY_ROTATION')
-    baker.constraints["Copy Rotation"].target = object
+    matrix.write(fixed_columns)
 
-    bpy.ops.nla.bake(
-        frame_start=start_frame,
-        frame_end=end_frame,
-        step=1,
-        only_selected=True,
-        visual_keying=True,
-        clear_constraints=True,
-        clear_parents=False,
-        use_current_action=False,
-        bake_types={'OBJECT'}
-    )
 
-    quaternion_cleanup(baker)
-    return baker
+def get_deformed_objects(armature):
+    """
+    Returns the objects parented to the armature (recursively) or deformed
+    by one of its Armature modifiers.
+    """
+    objects = set()
+    children = list(armature.children)
+    while children:
+        child = children.pop()
+        objects.add(child)
+        children.extend(child.children)
+
+    for object in bpy.context.scene.objects:
+        if any(
+            modifier.type == 'ARMATURE' and modifier.object == armature
+            for modifier in object.modifiers
+        ):
+            objects.add(object)
 
+    return objects
 
-def extract_loc_rot_from_bone(
-    armature,
-    action,
-    bone_name,
-    start_frame,
-    end_frame,
-    baker_name
-):
-    # Set the scene for curr actions
-    armature.animation_data.action = action
 
+@contextmanager
+def isolated_evaluation(armature):
+    """
+    Context manager turning off the viewport modifiers of the objects that
+    the armature deforms, so that bakes evaluate the bones without
+    deforming the meshes every frame. Yields the number of objects changed
+    and restores the modifiers on exit.
+    """
+    disabled = []
+    for object in get_deformed_objects(armature):
+        for modifier in object.modifiers:
+            if modifier.show_viewport:
+                modifier.show_viewport = False
+                disabled.append(modifier)
+
+    try:
+        yield len({modifier.id_data for modifier in disabled})
+    finally:
+        for modifier in disabled:
+            modifier.show_viewport = True
+
+
+def add_baker(baker_name):
+    """Adds an empty with quaternion rotation to bake transforms into"""
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.object.empty_add(
         type='ARROWS', radius=1, align='WORLD', location=(0, 0, 0)
@@ -124,58 +121,41 @@ def extract_loc_rot_from_bone(
     baker = bpy.context.object
     baker.name = baker_name
     baker.rotation_mode = 'QUATERNION'
+    return baker
 
-    bpy.ops.object.constraint_add(type='COPY_LOCATION')
-    baker.constraints["Copy Location"].target = armature
-    baker.constraints["Copy Location"].subtarget = bone_name
 
-    bpy.ops.object.constraint_add(type='COPY_ROTATION')
-    baker.constraints["Copy Rotation"].target = armature
-    baker.constraints["Copy Rotation"].subtarget = bone_name
+def add_loc_rot_constraints(baker, target, subtarget=''):
+    """Makes baker follow the world location and rotation of the target"""
+    bpy.context.view_layer.objects.active = baker
 
-    bpy.ops.nla.bake(
-        frame_start=start_frame,
-        frame_end=end_frame,
-        step=1,
-        only_selected=True,
-        visual_keying=True,
-        clear_constraints=True,
-        clear_parents=False,
-        use_current_action=False,
-        bake_types={'OBJECT'}
-    )
+    bpy.ops.object.constraint_add(type='COPY_LOCATION')
+    baker.constraints["Copy Location"].target = target
+    baker.constraints["Copy Location"].subtarget = subtarget
 
-    quaternion_cleanup(baker)
-    return baker
+    bpy.ops.object.constraint_add(type='COPY_ROTATION')
+    baker.constraints["Copy Rotation"].target = target
+    baker.constraints["Copy Rotation"].subtarget = subtarget
 
 
-def extract_constrained_from_bone(
+def add_rootmotion_constraints(
+    baker,
     armature,
-    action,
     bone_name,
     use_x,
     use_y,
     use_z,
     on_ground,
-    use_rot,
-    start_frame,
-    end_frame,
-    baker_name
+    use_rot
 ):
+    """
+    Makes baker follow the ground projected motion of the bone, as the root
+    bone should.
+    """
     pose_bone = armature.pose.bones[bone_name]
-    # Set the scene for curr actions
-    armature.animation_data.action = action
-
     hip_world_loc = armature.matrix_local @ pose_bone.bone.head_local
     z_offset = hip_world_loc.z
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.empty_add(
-        type='ARROWS', radius=1, align='WORLD', location=(0, 0, 0)
-    )
-    baker = bpy.context.object
-    baker.name = baker_name
-    baker.rotation_mode = 'QUATERNION'
+    bpy.context.view_layer.objects.active = baker
 
     if use_z:
         bpy.ops.object.constraint_add(type='COPY_LOCATION')
@@ -206,33 +186,130 @@ def extract_constrained_from_bone(
     baker.constraints["Copy Rotation"].use_x = False
     baker.constraints["Copy Rotation"].use_z = use_rot
 
+
+def bake_objects(bakers, start_frame, end_frame, clear_constraints=True):
+    """
+    Bakes the visual transforms of the bakers into new actions, all bakers
+    in a single pass over the frames.
+    """
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
+    for baker in bakers:
+        baker.select_set(True)
+    bpy.context.view_layer.objects.active = bakers[0]
+
     bpy.ops.nla.bake(
         frame_start=start_frame,
         frame_end=end_frame,
         step=1,
         only_selected=True,
         visual_keying=True,
-        clear_constraints=True,
+        clear_constraints=clear_constraints,
         clear_parents=False,
         use_current_action=False,
         bake_types={'OBJECT'}
     )
 
-    quaternion_cleanup(baker)
+    for baker in bakers:
+        quaternion_cleanup(baker)
+
+
+def delete_bakers(bakers):
+    """Deletes the baker objects along with their baked actions"""
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
+
+    for baker in bakers:
+        if baker.animation_data and baker.animation_data.action:
+            remove_action(baker.animation_data.action)
+        baker.select_set(True)
+
+    bpy.ops.object.delete(use_global=False)
+
+
+def extract_loc_rot_from_obj(
+    object,
+    action,
+    start_frame,
+    end_frame,
+    baker_name
+):
+    # Set the scene for curr actions
+    object.animation_data.action = action
+
+    baker = add_baker(baker_name)
+    add_loc_rot_constraints(baker, object)
+    bake_objects([baker], start_frame, end_frame)
     return baker
 
 
-def apply_baker_to_bone(
-    baker,
+def extract_loc_rot_from_bone(
     armature,
     action,
-    target_bone_name,
+    bone_name,
+    start_frame,
+    end_frame,
+    baker_name
+):
+    # Set the scene for curr actions
+    armature.animation_data.action = action
+
+    baker = add_baker(baker_name)
+    add_loc_rot_constraints(baker, armature, bone_name)
+    bake_objects([baker], start_frame, end_frame)
+    return baker
+
+
+def extract_constrained_from_bone(
+    armature,
+    action,
+    bone_name,
+    use_x,
+    use_y,
+    use_z,
+    on_ground,
+    use_rot,
+    start_frame,
+    end_frame,
+    baker_name
+):
+    # Set the scene for curr actions
+    armature.animation_data.action = action
+
+    baker = add_baker(baker_name)
+    add_rootmotion_constraints(
+        baker=baker,
+        armature=armature,
+        bone_name=bone_name,
+        use_x=use_x,
+        use_y=use_y,
+        use_z=use_z,
+        on_ground=on_ground,
+        use_rot=use_rot
+    )
+    bake_objects([baker], start_frame, end_frame)
+    return baker
+
+
+def remove_bone_fcurves(action, bone_name):
+    """Removes all fcurves of the given bone from action"""
+    get_channel_index(action).remove_bone_curves(bone_name)
+
+
+def apply_bakers_to_bones(
+    armature,
+    action,
+    bone_bakers,
     start_frame,
     end_frame
 ):
+    """
+    Bakes the transforms of the baker objects into the bones of action,
+    given as (bone name, baker) pairs, all bones in a single pass. A child
+    bone is keyed relative to its parent's baked transform.
+    """
     # Set the scene for curr actions
     armature.animation_data.action = action
-    pose_bone = armature.pose.bones[target_bone_name]
 
     bpy.ops.object.mode_set(mode='OBJECT')
     bpy.ops.object.select_all(action='DESELECT')
@@ -242,24 +319,15 @@ def apply_baker_to_bone(
 
     bpy.ops.object.mode_set(mode='POSE')
     bpy.ops.pose.select_all(action='DESELECT')
-    pose_bone.bone.select = True
-    armature.data.bones.active = pose_bone.bone
-    bpy.ops.pose.constraint_add(type='COPY_TRANSFORMS')
-    pose_bone.constraints["Copy Transforms"].target = baker
-
-    # Clear all existing loc and rot frames
-    fcurves_to_remove = []
-    for fcurve in action.fcurves:
-        data_path = fcurve.data_path.split("\"", maxsplit=2)
-        if (
-            len(data_path) == 3 and
-            data_path[0] == "pose.bones[" and
-            data_path[1] == target_bone_name
-        ):
-            fcurves_to_remove.append(fcurve)
+    for bone_name, baker in bone_bakers:
+        pose_bone = armature.pose.bones[bone_name]
+        pose_bone.bone.select = True
+        armature.data.bones.active = pose_bone.bone
+        bpy.ops.pose.constraint_add(type='COPY_TRANSFORMS')
+        pose_bone.constraints["Copy Transforms"].target = baker
 
-    for fcurve in fcurves_to_remove:
-        action.fcurves.remove(fcurve)
+        # Clear all existing loc and rot frames
+        remove_bone_fcurves(action, bone_name)
 
     bpy.ops.nla.bake(
         frame_start=start_frame,
@@ -272,3 +340,195 @@ def apply_baker_to_bone(
         use_current_action=True,
         bake_types={'POSE'}
     )
+    invalidate_channel_index(action)
+
+
+def apply_baker_to_bone(
+    baker,
+    armature,
+    action,
+    target_bone_name,
+    start_frame,
+    end_frame
+):
+    apply_bakers_to_bones(
+        armature=armature,
+        action=action,
+        bone_bakers=[(target_bone_name, baker)],
+        start_frame=start_frame,
+        end_frame=end_frame
+    )
+
+
+def iter_sample_matrices(
+    armature,
+    action,
+    bone_names,
+    objects,
+    start_frame,
+    end_frame
+):
+    """
+    Generator stepping the scene through [start_frame, end_frame] once,
+    SAMPLE_CHUNK_FRAMES frames per step. Returns the armature space pose
+    matrices of the given bones and the world matrices of the given
+    objects, as dicts of (frames, 4, 4) arrays keyed by name.
+    """
+    armature.animation_data.action = action
+    scene = bpy.context.scene
+    current_frame = scene.frame_current
+    pose_bones = [armature.pose.bones[name] for name in bone_names]
+    count = end_frame - start_frame + 1
+    matrices = {name: np.empty((count, 4, 4)) for name in bone_names}
+    object_matrices = {
+        object.name: np.empty((count, 4, 4)) for object in objects
+    }
+
+    try:
+        for i, frame in enumerate(range(start_frame, end_frame + 1)):
+            scene.frame_set(frame)
+            for pose_bone in pose_bones:
+                matrices[pose_bone.name][i] = pose_bone.matrix
+            for object in objects:
+                object_matrices[object.name][i] = object.matrix_world
+            if (i + 1) % SAMPLE_CHUNK_FRAMES == 0:
+                yield (i + 1) / count
+    finally:
+        scene.frame_set(current_frame)
+    return matrices, object_matrices
+
+
+def sample_matrices(
+    armature,
+    action,
+    bone_names,
+    objects,
+    start_frame,
+    end_frame
+):
+    """
+    Steps the scene through [start_frame, end_frame] once and returns the
+    armature space pose matrices of the given bones and the world matrices
+    of the given objects, as dicts of (frames, 4, 4) arrays keyed by name.
+    """
+    return run_steps(iter_sample_matrices(
+        armature=armature,
+        action=action,
+        bone_names=bone_names,
+        objects=objects,
+        start_frame=start_frame,
+        end_frame=end_frame
+    ))
+
+
+def sample_bone_matrices(
+    armature,
+    action,
+    bone_names,
+    start_frame,
+    end_frame
+):
+    """
+    Steps the scene through [start_frame, end_frame] and returns the armature
+    space pose matrices of the given bones as a dict of (frames, 4, 4) arrays.
+    """
+    return sample_matrices(
+        armature=armature,
+        action=action,
+        bone_names=bone_names,
+        objects=(),
+        start_frame=start_frame,
+        end_frame=end_frame
+    )[0]
+
+
+def get_bone_basis_matrices(
+    armature,
+    bone_name,
+    pose_matrices,
+    parent_pose=None
+):
+    """
+    Converts armature space pose matrices of a bone to its local basis (the
+    matrices its loc/rot/scale channels describe), given the armature space
+    pose matrices of its parent.
+    """
+    bone = armature.data.bones[bone_name]
+    parent_rest = None
+    if bone.parent:
+        parent_rest = np.array(bone.parent.matrix_local)
+    return get_basis_matrices(
+        pose_matrices=pose_matrices,
+        rest=np.array(bone.matrix_local),
+        parent_rest=parent_rest,
+        parent_pose=parent_pose
+    )
+
+
+def write_bone_transforms(action, bone_name, basis_matrices, start_frame):
+    """
+    Replaces the loc/rot/scale channels of a bone in action with the given
+    (frames, 4, 4) basis matrices, keying every frame from start_frame.
+    """
+    channels = get_channel_index(action)
+    channels.remove_bone_curves(bone_name)
+    locs, quats, scales = decompose_matrices(basis_matrices)
+    fix_quaternion_inverts(quats)
+
+    for prop, values in (
+        ('location', locs),
+        ('rotation_quaternion', quats),
+        ('scale', scales)
+    ):
+        for i in range(values.shape[1]):
+            fcurve = channels.new_curve(bone_name, prop, i, group=bone_name)
+            write_dense_curve(fcurve, values[:, i], start_frame)
+
+
+def get_world_loc_rot_matrices(armature, pose_matrices):
+    """
+    Returns the world space matrices an object would get by copying the
+    location and rotation (but not the scale) of the given pose matrices.
+    """
+    return remove_scale(np.array(armature.matrix_world) @ pose_matrices)
+
+
+def get_constrained_root_matrices(
+    armature,
+    bone_name,
+    pose_matrices,
+    use_x,
+    use_y,
+    use_z,
+    on_ground,
+    use_rot
+):
+    """
+    Returns the world space matrices that extract_constrained_from_bone bakes
+    onto its baker, computed from the bone's armature space pose matrices.
+    """
+    pose_bone = armature.pose.bones[bone_name]
+    z_offset = (armature.matrix_local @ pose_bone.bone.head_local).z
+
+    matrices = np.array(armature.matrix_world) @ pose_matrices
+    hip_locs = matrices[:, :3, 3]
+    count = len(matrices)
+
+    locs = np.zeros((count, 3))
+    if use_x:
+        locs[:, 0] = hip_locs[:, 0]
+    if use_y:
+        locs[:, 1] = hip_locs[:, 1]
+    if use_z:
+        locs[:, 2] = hip_locs[:, 2] - z_offset
+        if on_ground:
+            locs[:, 2] = np.maximum(locs[:, 2], 0.0)
+
+    quats = np.zeros((count, 4))
+    quats[:, 0] = 1.0
+    if use_rot:
+        rots = matrices[:, :3, :3]
+        rots = rots / np.linalg.norm(rots, axis=-2)[:, np.newaxis, :]
+        quats = z_rotation_quaternions(matrix_to_euler_z(rots))
+
+    return compose_matrices(locs, quats)
@@ -0,0 +1,32 @@
+"""
+Headless batch entry point, run with:
+
+    blender -b --factory-startup -P batch.py -- manifest.json [--workers N]
+
+or, with the add-on folder on the python path:
+
+    blender -b --factory-startup --python-expr \
+        "import novekreed_character_tools.batch as b; b.run()" -- manifest.json
+
+The manifest lists the characters to process, see manifest.read_manifest.
+Use '-- --serve <workers> <state.json>' to start warm workers for client.py.
+"""
+import os
+import sys
+import importlib
+
+
+def run():
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    addon = importlib.import_module(os.path.basename(addon_dir))
+    if not hasattr(addon, 'bl_info'):
+        raise ImportError("Could not import the add-on from " + addon_dir)
+
+    addon.register()
+    pipeline = importlib.import_module(addon.__name__ + '.pipeline')
+    sys.exit(pipeline.main())
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import hashlib
+
+import bpy
+
+# Bump to drop entries written by an incompatible version of the importer.
+CACHE_VERSION = 1
+
+
+def get_default_cache_directory():
+    return bpy.utils.user_resource(
+        'DATAFILES', path='nkt_import_cache', create=True)
+
+
+def hash_file(filepath, chunk_size=1 << 20):
+    """Returns the sha256 hex digest of the contents of filepath"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ImportCache:
+    """
+    Persistent cache of prepared animation actions, keyed by the content of
+    the source file plus the import options. Every entry is a small .blend
+    library holding one action. The least recently used entries are evicted
+    once the total size exceeds max_size bytes.
+    """
+
+    def __init__(self, directory=None, max_size=2 << 30):
+        self.directory = directory or get_default_cache_directory()
+        self.max_size = max_size
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                self.index = json.load(index_file)
+
+    def get_key(self, filepath, options):
+        """Returns the cache key of filepath imported with options"""
+        digest = hashlib.sha256()
+        digest.update(hash_file(filepath).encode())
+        digest.update(json.dumps(
+            [CACHE_VERSION, options], sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.directory, key + '.blend')
+
+    def load_action(self, key, name):
+        """
+        Appends the cached action of key renamed to name. Returns None on a
+        cache miss.
+        """
+        path = self.get_entry_path(key)
+        if key not in self.index or not os.path.exists(path):
+            self.index.pop(key, None)
+            return None
+
+        with bpy.data.libraries.load(path) as (data_from, data_to):
+            data_to.actions = data_from.actions[:1]
+        if not data_to.actions or data_to.actions[0] is None:
+            return None
+
+        action = data_to.actions[0]
+        action.use_fake_user = False
+        action.name = name
+        self.index[key]['used'] = time.time()
+        return action
+
+    def store_action(self, key, action):
+        """Writes action to the cache as the entry of key"""
+        path = self.get_entry_path(key)
+        bpy.data.libraries.write(path, {action}, fake_user=True)
+        self.index[key] = {
+            'size': os.path.getsize(path),
+            'used': time.time()
+        }
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits"""
+        total = sum(entry['size'] for entry in self.index.values())
+        by_age = sorted(self.index.items(), key=lambda item: item[1]['used'])
+        for key, entry in by_age:
+            if total <= self.max_size:
+                break
+            path = self.get_entry_path(key)
+            if os.path.exists(path):
+                os.remove(path)
+            del self.index[key]
+            total -= entry['size']
+
+    def save(self):
+        """Evicts old entries and writes the cache index to disk"""
+        self.evict()
+        with open(self.index_path, 'w') as index_file:
+            json.dump(self.index, index_file)
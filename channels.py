@@ -0,0 +1,144 @@
+import bpy
+
+from bpy.app.handlers import persistent
+
+
+def parse_bone_data_path(data_path):
+    """
+    Splits a 'pose.bones["name"].prop' data path into (name, prop). Returns
+    None for data paths that do not target a pose bone.
+    """
+    data_path = data_path.split("\"", maxsplit=2)
+    if len(data_path) != 3 or data_path[0] != "pose.bones[":
+        return None
+    return data_path[1], data_path[2][2:]
+
+
+class ChannelIndex:
+    """
+    Maps the (bone name, property, array index) channels of an action to
+    their fcurves, with None as bone name for object channels. Curves added
+    or removed through the index keep it up to date.
+    """
+
+    def __init__(self, action):
+        self.action = action
+        self.bones = {}
+        for fcurve in action.fcurves:
+            self.index_curve(fcurve)
+        self.curve_count = len(action.fcurves)
+
+    def index_curve(self, fcurve):
+        parsed = parse_bone_data_path(fcurve.data_path)
+        bone_name, prop = parsed if parsed else (None, fcurve.data_path)
+        channels = self.bones.setdefault(bone_name, {})
+        channels[(prop, fcurve.array_index)] = fcurve
+
+    def get(self, bone_name, prop, array_index=0):
+        """Returns the fcurve of the channel, None if it is not animated"""
+        return self.bones.get(bone_name, {}).get((prop, array_index))
+
+    def get_vector(self, bone_name, prop, size):
+        """
+        Returns the size fcurves of a vector property as a tuple (with None
+        for missing components), None if its first component is missing.
+        """
+        channels = self.bones.get(bone_name, {})
+        if (prop, 0) not in channels:
+            return None
+        return tuple(channels.get((prop, i)) for i in range(size))
+
+    def get_bone_curves(self, bone_name):
+        return list(self.bones.get(bone_name, {}).values())
+
+    def new_curve(self, bone_name, prop, array_index, group=''):
+        data_path = prop
+        if bone_name is not None:
+            data_path = 'pose.bones["' + bone_name + '"].' + prop
+        fcurve = self.action.fcurves.new(
+            data_path, index=array_index, action_group=group
+        )
+        self.index_curve(fcurve)
+        self.curve_count += 1
+        return fcurve
+
+    def remove_curve(self, bone_name, prop, array_index=0):
+        """Removes the fcurve of the channel from the action, if any"""
+        fcurve = self.bones.get(bone_name, {}).pop((prop, array_index), None)
+        if fcurve is not None:
+            self.action.fcurves.remove(fcurve)
+            self.curve_count -= 1
+            invalidate_action_matrix(self.action)
+
+    def remove_bone_curves(self, bone_name):
+        """Removes all fcurves of the bone from the action"""
+        fcurves = self.action.fcurves
+        for fcurve in self.bones.pop(bone_name, {}).values():
+            fcurves.remove(fcurve)
+            self.curve_count -= 1
+        invalidate_action_matrix(self.action)
+
+
+# Channel indices keyed by get_action_key.
+channel_indices = {}
+# Dense samplings of actions (see dense.ActionMatrix), keyed like the indices.
+action_matrices = {}
+
+
+def get_action_key(action):
+    """
+    Returns the key of the cached data of action. Unlike its address, the
+    session uid of a data-block is never given to another one, so entries
+    of actions removed behind the add-on's back can not be mistaken for a
+    new action.
+    """
+    return action.session_uid
+
+
+def get_channel_index(action):
+    """
+    Returns the channel index of action, built once and reused until the
+    number of curves changes outside of the index. Code replacing curves by
+    other means (nla.bake) must call invalidate_channel_index.
+    """
+    key = get_action_key(action)
+    index = channel_indices.get(key)
+    if index is None or index.curve_count != len(action.fcurves):
+        index = ChannelIndex(action)
+        channel_indices[key] = index
+    return index
+
+
+def invalidate_action_matrix(action):
+    action_matrices.pop(get_action_key(action), None)
+
+
+def invalidate_channel_index(action):
+    """Drops the channel index of action, along with its dense sampling"""
+    channel_indices.pop(get_action_key(action), None)
+    invalidate_action_matrix(action)
+
+
+def remove_action(action):
+    """Removes action from the blend data along with its channel index"""
+    invalidate_channel_index(action)
+    bpy.data.actions.remove(action)
+
+
+@persistent
+def clear_channel_indices(*args):
+    """
+    Drops all channel indices and dense samplings. Used after a file load
+    or an undo step (which reallocate all actions) and after actions were
+    removed in bulk.
+    """
+    channel_indices.clear()
+    action_matrices.clear()
+
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+    """Drops the cached data of actions edited outside of this add-on"""
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Action):
+            invalidate_channel_index(update.id.original)
@@ -1,10 +1,15 @@
 import os
+import math
 import bpy
 
+from contextlib import nullcontext
+
 from bpy.types import PropertyGroup, Operator
 from bpy.props import (
+    BoolProperty,
     CollectionProperty,
     EnumProperty,
+    FloatProperty,
     IntProperty,
     PointerProperty,
     StringProperty
@@ -12,6 +17,10 @@ from bpy.props import (
 from bpy_extras.io_utils import ImportHelper
 
 from .armature import rename_bones
+from .clips import iter_export_clips
+from .export import export_gltf, iter_sharded_export, iter_split_export
+from .jobs import run_steps, submit_job
+from .preparation import prepared_export_actions
 
 
 class NKT_CharacterAction(PropertyGroup):
@@ -56,6 +65,12 @@ class NKT_CharacterAction(PropertyGroup):
         # default='IN_PLACE'
     )
 
+    selected: BoolProperty(
+        name="Selected",
+        description="Include the action in batch operations.",
+        default=False
+    )
+
 
 class NKT_Character(PropertyGroup):
     def poll_character_armature_valid(self, object):
@@ -100,6 +115,18 @@ class NKT_Character(PropertyGroup):
         if self.active_action_index >= 0:
             return self.actions[self.active_action_index]
 
+    def get_target_action_names(self, target):
+        """Returns the names of the actions for an operator target"""
+        if target == 'ALL':
+            return [char_action.name for char_action in self.actions]
+        if target == 'SELECTED':
+            return [
+                char_action.name for char_action in self.actions
+                if char_action.selected
+            ]
+        active_action = self.get_active_action()
+        return [active_action.name] if active_action else []
+
     def validate_active_action(self):
         curr_action = self.armature.animation_data.action
         active_action = self.get_active_action()
@@ -171,6 +198,11 @@ class NKT_Character(PropertyGroup):
                 'GLTF_SEPARATE', "glTF Separate (.gltf + .bin + textures)",
                 "Exports multiple files, with separate JSON, binary and " +
                 "texture data. Easiest to edit later."
+            ),
+            (
+                'CLIPS', "Binary Clips (.nkc)",
+                "Exports only the animations, as quantized bone tracks in " +
+                "a compact binary file that can be memory mapped."
             )
         ],
         description="Output format and embedding options. " +
@@ -179,6 +211,89 @@ class NKT_Character(PropertyGroup):
         name="Export Format",
         default='GLTF_SEPARATE'
     )
+    export_mode: EnumProperty(
+        items=[
+            (
+                'SINGLE', "Single File",
+                "Exports the character and all actions into one file."
+            ),
+            (
+                'SPLIT', "File per Action",
+                "Exports the rig and meshes to one file and every action " +
+                "to its own file, only re-exporting what changed."
+            )
+        ],
+        name="Export Mode",
+        description="How the character and its actions are split into files",
+        default='SINGLE'
+    )
+    use_export_workers: BoolProperty(
+        name="Parallel Export",
+        description=(
+            "Export the actions on background Blender processes, each " +
+            "working on a shard of the actions."
+        ),
+        default=False
+    )
+    export_worker_count: IntProperty(
+        name="Workers",
+        description="The number of background Blender processes to use.",
+        default=max(1, (os.cpu_count() or 2) // 2),
+        min=1,
+        max=64
+    )
+    use_export_preparation: BoolProperty(
+        name="Resample and Quantize",
+        description=(
+            "Export resampled and quantized copies of the actions, within " +
+            "the maximum errors."
+        ),
+        default=False
+    )
+    export_sample_rate: FloatProperty(
+        name="Sample Rate",
+        description="The frames per second the actions are resampled to.",
+        default=30.0,
+        min=1.0
+    )
+    export_location_precision: FloatProperty(
+        name="Location Precision",
+        description="The step locations and scales are quantized to.",
+        default=1e-4,
+        min=0.0,
+        precision=5,
+        subtype='DISTANCE'
+    )
+    export_location_error: FloatProperty(
+        name="Max Location Error",
+        description=(
+            "The maximum distance between the exported and the original " +
+            "bone locations."
+        ),
+        default=1e-3,
+        min=0.0,
+        precision=5,
+        subtype='DISTANCE'
+    )
+    export_rotation_error: FloatProperty(
+        name="Max Rotation Error",
+        description=(
+            "The maximum angle between the exported and the original bone " +
+            "rotations."
+        ),
+        default=math.radians(0.1),
+        min=0.0,
+        precision=3,
+        subtype='ANGLE'
+    )
+    merge_export_shards: BoolProperty(
+        name="Merge Shards",
+        description=(
+            "Merge the animations of the parallel export into the " +
+            "character file, instead of one file per shard."
+        ),
+        default=True
+    )
 
 
 class NKT_OT_init_character(Operator):
@@ -337,6 +452,55 @@ class NKT_OT_character_menu(Operator):
         return {'FINISHED'}
 
 
+def iter_quick_export(report):
+    """Generator exporting the active character to its export path"""
+    context = bpy.context
+    settings = context.scene.nkt_settings
+    character = settings.get_active_character()
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
+    character.armature.select_set(True)
+    context.view_layer.objects.active = character.armature
+
+    preparation = nullcontext()
+    if character.use_export_preparation:
+        preparation = prepared_export_actions(
+            character,
+            context.scene.render.fps / context.scene.render.fps_base,
+            report
+        )
+    with preparation:
+        yield from iter_export_character(character, report)
+
+
+def iter_export_character(character, report):
+    """Generator exporting character with its export settings"""
+    if character.export_format == 'CLIPS':
+        yield from iter_export_clips(character, report)
+        return
+    if character.export_mode == 'SPLIT':
+        yield from iter_split_export(character, report)
+        return
+    if character.use_export_workers and len(character.actions) > 1:
+        yield from iter_sharded_export(character, report)
+        return
+
+    # Generate Filename To Export
+    fileName = os.path.join(
+        bpy.path.abspath(character.export_path), character.export_name
+    )
+
+    # Push animation to NLA Tracks
+    bpy.ops.nkt.character_push_to_nla()
+    yield 0.1
+
+    export_gltf(fileName, character.export_format)
+    yield 1.0
+
+    report({'INFO'}, 'Character File Exported')
+
+
 class NKT_OT_character_quick_export(Operator):
     bl_idname = 'nkt.character_quick_export'
     bl_label = "Quick Export Character"
@@ -344,31 +508,9 @@ class NKT_OT_character_quick_export(Operator):
 
     def execute(self, context):
         settings = context.scene.nkt_settings
-        character = settings.get_active_character()
-
-        bpy.ops.object.mode_set(mode='OBJECT')
-        bpy.ops.object.select_all(action='DESELECT')
-        character.armature.select_set(True)
-        context.view_layer.objects.active = character.armature
-
-        # Generate Filename To Export
-        fileName = os.path.join(
-            bpy.path.abspath(character.export_path), character.export_name
-        )
-
-        # Push animation to NLA Tracks
-        bpy.ops.nkt.character_push_to_nla()
-
-        bpy.ops.export_scene.gltf(
-            filepath=fileName,
-            export_format=character.export_format,
-            export_frame_range=False,
-            export_force_sampling=False,
-            export_tangents=False,
-            export_image_format="AUTO",
-            export_cameras=False,
-            export_lights=False
-        )
-
-        self.report({'INFO'}, 'Character File Exported')
+        if settings.use_background_jobs:
+            submit_job("Quick Export", iter_quick_export)
+            bpy.ops.nkt.job_monitor('INVOKE_DEFAULT')
+        else:
+            run_steps(iter_quick_export(self.report))
         return {'FINISHED'}
@@ -0,0 +1,102 @@
+"""
+Client for warm worker daemons, runs with any Python 3 interpreter:
+
+    python client.py <state.json> <manifest.json>
+    python client.py <state.json> --shutdown
+
+Start the daemon with:
+
+    blender -b --factory-startup -P batch.py -- --serve <workers> <state.json>
+"""
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import importlib.util
+
+from multiprocessing.connection import Client
+
+
+def load_manifest_module():
+    # Loaded from its path, importing the add-on package would need bpy.
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'manifest.py')
+    spec = importlib.util.spec_from_file_location('nkt_manifest', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def connect(state):
+    authkey = bytes.fromhex(state['authkey'])
+    return [Client(tuple(address), authkey=authkey)
+            for address in state['workers']]
+
+
+def submit_manifest(state, manifest_path):
+    """
+    Runs every character of the manifest on the warm workers, one character
+    per worker at a time. Returns the exit code.
+    """
+    manifest = load_manifest_module()
+    characters = manifest.read_manifest(manifest_path)['characters']
+    pending = queue.Queue()
+    for i, character in enumerate(characters):
+        pending.put((i, character))
+    results = [None] * len(characters)
+
+    def work(connection):
+        while True:
+            try:
+                i, character = pending.get_nowait()
+            except queue.Empty:
+                return
+            connection.send({
+                'task': 'pipeline_character',
+                'args': {'character': character}
+            })
+            reply = connection.recv()
+            if reply['error']:
+                print(reply['error'])
+            results[i] = reply['result']
+
+    start = time.perf_counter()
+    connections = connect(state)
+    threads = [threading.Thread(target=work, args=(c,)) for c in connections]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for connection in connections:
+        connection.close()
+
+    for character, result in zip(characters, results):
+        manifest.print_summary(character['name'], result)
+    print("[nkt] total {:.2f}s".format(time.perf_counter() - start))
+    return manifest.get_exit_code(results)
+
+
+def shutdown(state):
+    for connection in connect(state):
+        connection.send({'task': 'shutdown', 'args': {}})
+        connection.recv()
+        connection.close()
+    return 0
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(__doc__)
+        return 2
+
+    with open(argv[1]) as state_file:
+        state = json.load(state_file)
+    if argv[2] == '--shutdown':
+        return shutdown(state)
+    return submit_manifest(state, argv[2])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,215 @@
+import mmap
+import struct
+
+# Layout of .nkc binary clip files, all little endian. Every block starts on
+# a 16 byte boundary so a runtime can map the file and use it in place.
+#
+# header      HEADER
+# bone table  BONE_ENTRY per bone, parents before children
+# clip index  CLIP_ENTRY per clip
+# strings     utf-8 names, referenced by (offset, length)
+# per clip:
+#   ranges       float32 [bones][translation min, translation extent,
+#                scale min, scale extent][x, y, z, 0]
+#   rotations    int16 [frames][bones][w, x, y, z], the unit quaternion
+#                times 32767
+#   translations uint16 [frames][bones][x, y, z, 0], min + value / 65535 *
+#                extent of the bone's range
+#   scales       uint16 [frames][bones][x, y, z, 0], like translations
+#   root         float32 [frames][x, y, z, 0, w, x, y, z], armature space
+#                transform of the root bone, only with a root bone
+#
+# Bone transforms are relative to the parent bone (the armature for root
+# bones), in Blender's Z up space.
+MAGIC = b'NKCL'
+VERSION = 1
+ALIGNMENT = 16
+HEADER = struct.Struct('<4sHHIIIIiI')
+BONE_ENTRY = struct.Struct('<IIiI')
+CLIP_ENTRY = struct.Struct('<IIIfIIIII28x')
+ROTATION_SCALE = 32767
+RANGE_SCALE = 65535
+
+
+def align(offset):
+    return offset + (-offset % ALIGNMENT)
+
+
+def write_clip_file(filepath, bones, root_index, clips):
+    """
+    Writes a clip file. bones is a list of (name, parent index) and clips a
+    list of dicts with 'name', 'frame_count', 'frame_rate' and the encoded
+    'ranges', 'rotations', 'translations', 'scales' and 'root' blocks (root
+    empty without a root bone). Returns the size of the file in bytes.
+    """
+    strings = bytearray()
+
+    def add_string(text):
+        data = text.encode('utf-8')
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    bone_names = [add_string(name) for name, _ in bones]
+    clip_names = [add_string(clip['name']) for clip in clips]
+
+    bone_table = HEADER.size
+    clip_index = align(bone_table + BONE_ENTRY.size * len(bones))
+    string_offset = clip_index + CLIP_ENTRY.size * len(clips)
+    offset = align(string_offset + len(strings))
+
+    blocks = []
+    clip_entries = []
+    for clip, (name_offset, name_length) in zip(clips, clip_names):
+        offsets = {}
+        for block in ('ranges', 'rotations', 'translations', 'scales', 'root'):
+            data = clip[block]
+            offsets[block] = offset if data else 0
+            if data:
+                blocks.append((offset, data))
+                offset = align(offset + len(data))
+        clip_entries.append(CLIP_ENTRY.pack(
+            string_offset + name_offset,
+            name_length,
+            clip['frame_count'],
+            clip['frame_rate'],
+            offsets['rotations'],
+            offsets['translations'],
+            offsets['scales'],
+            offsets['root'],
+            offsets['ranges']
+        ))
+
+    data = bytearray(offset)
+    HEADER.pack_into(
+        data, 0, MAGIC, VERSION, 0, len(bones), len(clips),
+        bone_table, clip_index, root_index, offset
+    )
+    for i, ((_, parent), (name_offset, name_length)) in enumerate(
+        zip(bones, bone_names)
+    ):
+        BONE_ENTRY.pack_into(
+            data, bone_table + i * BONE_ENTRY.size,
+            string_offset + name_offset, name_length, parent, 0
+        )
+    for i, entry in enumerate(clip_entries):
+        start = clip_index + i * CLIP_ENTRY.size
+        data[start:start + CLIP_ENTRY.size] = entry
+    data[string_offset:string_offset + len(strings)] = strings
+    for start, block in blocks:
+        data[start:start + len(block)] = block
+
+    with open(filepath, 'wb') as clip_file:
+        clip_file.write(data)
+    return len(data)
+
+
+class Clip:
+    """A clip of a ClipFile, decoding frames straight from the mapping"""
+
+    def __init__(self, data, entry, bone_count):
+        (
+            name_offset, name_length, self.frame_count, self.frame_rate,
+            rotations, translations, scales, root, ranges
+        ) = entry
+        self.name = bytes(
+            data[name_offset:name_offset + name_length]).decode('utf-8')
+        self.bone_count = bone_count
+
+        size = self.frame_count * bone_count * 4
+        self.rotations = data[rotations:rotations + size * 2].cast('h')
+        self.translations = data[
+            translations:translations + size * 2].cast('H')
+        self.scales = data[scales:scales + size * 2].cast('H')
+        self.ranges = data[ranges:ranges + bone_count * 64].cast('f')
+        self.root = None
+        if root:
+            self.root = data[root:root + self.frame_count * 32].cast('f')
+
+    def get_rotation(self, frame, bone):
+        """Returns the (w, x, y, z) rotation of bone on frame"""
+        i = (frame * self.bone_count + bone) * 4
+        return tuple(
+            value / ROTATION_SCALE for value in self.rotations[i:i + 4])
+
+    def get_ranged(self, values, frame, bone, range_index):
+        i = (frame * self.bone_count + bone) * 4
+        r = bone * 16 + range_index * 8
+        low, extent = self.ranges[r:r + 3], self.ranges[r + 4:r + 7]
+        return tuple(
+            low[axis] + values[i + axis] / RANGE_SCALE * extent[axis]
+            for axis in range(3)
+        )
+
+    def get_translation(self, frame, bone):
+        return self.get_ranged(self.translations, frame, bone, 0)
+
+    def get_scale(self, frame, bone):
+        return self.get_ranged(self.scales, frame, bone, 1)
+
+    def get_root(self, frame):
+        """Returns the root bone's (location, rotation) on frame, if any"""
+        if self.root is None:
+            return None
+        values = self.root[frame * 8:frame * 8 + 8]
+        return tuple(values[0:3]), tuple(values[4:8])
+
+    def release(self):
+        for view in (
+            self.rotations, self.translations, self.scales, self.ranges,
+            self.root
+        ):
+            if view is not None:
+                view.release()
+
+
+class ClipFile:
+    """
+    Reader of .nkc clip files. The file is memory mapped and the clips read
+    from the mapping without copies. bones lists (name, parent index).
+    """
+
+    def __init__(self, filepath):
+        self.file = open(filepath, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.map)
+
+        (
+            magic, version, _, bone_count, clip_count,
+            bone_table, clip_index, self.root_index, _
+        ) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a version {} clip file.".format(
+                filepath, VERSION))
+
+        self.bones = []
+        for i in range(bone_count):
+            name_offset, name_length, parent, _ = BONE_ENTRY.unpack_from(
+                self.data, bone_table + i * BONE_ENTRY.size)
+            name = bytes(
+                self.data[name_offset:name_offset + name_length]
+            ).decode('utf-8')
+            self.bones.append((name, parent))
+
+        self.clips = {}
+        for i in range(clip_count):
+            clip = Clip(
+                self.data,
+                CLIP_ENTRY.unpack_from(
+                    self.data, clip_index + i * CLIP_ENTRY.size),
+                bone_count
+            )
+            self.clips[clip.name] = clip
+
+    def close(self):
+        for clip in getattr(self, 'clips', {}).values():
+            clip.release()
+        self.data.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
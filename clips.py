@@ -0,0 +1,122 @@
+import os
+
+import bpy
+import numpy as np
+
+from .clipformat import RANGE_SCALE, ROTATION_SCALE, write_clip_file
+from .pose import ArmatureRig
+from .transforms import decompose_matrices
+
+
+def make_continuous(quats):
+    """
+    Flips the sign of (frames, ..., 4) quaternions where needed so that
+    consecutive frames take the short path between each other.
+    """
+    dots = np.einsum('f...i,f...i->f...', quats[1:], quats[:-1])
+    signs = np.cumprod(np.where(dots < 0.0, -1.0, 1.0), axis=0)
+    quats = quats.copy()
+    quats[1:] *= signs[..., np.newaxis]
+    return quats
+
+
+def encode_ranged(values):
+    """
+    Quantizes (frames, bones, 3) values to uint16 within the range of every
+    bone. Returns the (bones, 2, 4) float32 min and extent and the
+    (frames, bones, 4) uint16 values.
+    """
+    low = values.min(axis=0)
+    extent = values.max(axis=0) - low
+    scale = np.divide(
+        RANGE_SCALE, extent, out=np.zeros_like(extent), where=extent > 0.0)
+    encoded = np.zeros(values.shape[:-1] + (4,), dtype=np.uint16)
+    encoded[..., :3] = np.rint((values - low) * scale)
+
+    ranges = np.zeros((values.shape[1], 2, 4), dtype=np.float32)
+    ranges[:, 0, :3] = low
+    ranges[:, 1, :3] = extent
+    return ranges, encoded
+
+
+def encode_clip(rig, action, start_frame, end_frame, root_index=-1):
+    """
+    Samples action on every frame in [start_frame, end_frame] and encodes
+    the tracks of all bones of rig in the blocks of the clip format.
+    """
+    basis = rig.get_basis_matrices(
+        *rig.read_action(action, start_frame, end_frame))
+    locs, quats, scales = decompose_matrices(rig.offsets @ basis)
+
+    translation_ranges, translations = encode_ranged(locs)
+    scale_ranges, scales = encode_ranged(scales)
+    ranges = np.concatenate((translation_ranges, scale_ranges), axis=1)
+    rotations = np.rint(
+        make_continuous(quats) * ROTATION_SCALE).astype(np.int16)
+
+    root = b''
+    if root_index >= 0:
+        root_matrices = rig.get_pose_matrices(basis)[:, root_index]
+        root_locs, root_quats, _ = decompose_matrices(root_matrices)
+        root_track = np.zeros((len(root_locs), 8), dtype=np.float32)
+        root_track[:, :3] = root_locs
+        root_track[:, 4:] = make_continuous(root_quats)
+        root = root_track.tobytes()
+
+    return {
+        'frame_count': end_frame - start_frame + 1,
+        'ranges': ranges.astype(np.float32).tobytes(),
+        'rotations': rotations.tobytes(),
+        'translations': translations.tobytes(),
+        'scales': scales.tobytes(),
+        'root': root
+    }
+
+
+def iter_export_clips(character, report):
+    """
+    Generator writing all actions of the character into one binary clip
+    file (see clipformat), one action per step.
+    """
+    scene = bpy.context.scene
+    if not ArmatureRig.is_supported(character.armature):
+        report(
+            {'WARNING'},
+            "Constraints, drivers and inheritance options of the armature "
+            "are not applied to the clips."
+        )
+    frame_rate = scene.render.fps / scene.render.fps_base
+    rig = ArmatureRig(character.armature)
+    root_index = rig.bone_indices.get(character.root_bone_name, -1)
+    filepath = os.path.join(
+        bpy.path.abspath(character.export_path),
+        character.export_name + '.nkc'
+    )
+
+    clips = []
+    for i, char_action in enumerate(character.actions):
+        action = char_action.action
+        clip = encode_clip(
+            rig,
+            action,
+            int(action.frame_range[0]),
+            int(action.frame_range[1]),
+            root_index
+        )
+        clip['name'] = char_action.name
+        clip['frame_rate'] = frame_rate
+        clips.append(clip)
+        yield (i + 1) / (len(character.actions) + 1)
+
+    bones = [
+        (name, int(parent))
+        for name, parent in zip(rig.bone_names, rig.parents)
+    ]
+    size = write_clip_file(filepath, bones, root_index, clips)
+    yield 1.0
+
+    report(
+        {'INFO'},
+        "Exported {} clip(s) of {} bone(s), {:.1f} KB.".format(
+            len(clips), len(bones), size / 1024)
+    )
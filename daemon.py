@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import traceback
+import subprocess
+
+from multiprocessing.connection import Listener
+
+import bpy
+
+from .workers import get_worker_command, worker_task, worker_tasks
+
+AUTHKEY_VARIABLE = 'NKT_DAEMON_AUTHKEY'
+
+
+@worker_task('serve')
+def serve_task(args):
+    """
+    Worker task keeping a warm Blender process around. It listens on a local
+    port, written to args['address_path'], and runs the registered worker
+    tasks sent to it, in a clean scene each, until asked to shut down.
+    """
+    authkey = bytes.fromhex(os.environ[AUTHKEY_VARIABLE])
+    listener = Listener(('127.0.0.1', 0), authkey=authkey)
+    with open(args['address_path'], 'w') as address_file:
+        json.dump(listener.address, address_file)
+
+    while True:
+        with listener.accept() as connection:
+            while True:
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    break
+
+                if message['task'] == 'shutdown':
+                    connection.send({'result': None, 'error': None})
+                    listener.close()
+                    return {}
+
+                start = time.perf_counter()
+                reply = {'result': None, 'error': None}
+                try:
+                    bpy.ops.wm.read_homefile(use_empty=True)
+                    reply['result'] = worker_tasks[message['task']](
+                        message['args'])
+                except Exception:
+                    reply['error'] = traceback.format_exc()
+                reply['seconds'] = time.perf_counter() - start
+                connection.send(reply)
+
+
+def start_daemon(worker_count, state_path, timeout=120.0):
+    """
+    Starts worker_count warm workers and writes their addresses and the
+    shared authentication key to state_path for clients, then waits until
+    all workers have shut down.
+    """
+    authkey = os.urandom(16).hex()
+    env = dict(os.environ)
+    env[AUTHKEY_VARIABLE] = authkey
+    state_dir = os.path.dirname(os.path.abspath(state_path))
+
+    processes = []
+    address_paths = []
+    for i in range(worker_count):
+        address_path = os.path.join(
+            state_dir, 'nkt_worker_{}_{}.json'.format(os.getpid(), i))
+        if os.path.exists(address_path):
+            os.remove(address_path)
+        address_paths.append(address_path)
+        processes.append(subprocess.Popen(
+            get_worker_command('serve', {'address_path': address_path}),
+            env=env
+        ))
+
+    try:
+        deadline = time.time() + timeout
+        while not all(os.path.exists(path) for path in address_paths):
+            if time.time() > deadline or any(
+                process.poll() is not None for process in processes
+            ):
+                raise RuntimeError("Workers failed to start.")
+            time.sleep(0.1)
+        # The address file may still be being written.
+        time.sleep(0.1)
+
+        addresses = []
+        for path in address_paths:
+            with open(path) as address_file:
+                addresses.append(json.load(address_file))
+            os.remove(path)
+
+        with open(state_path, 'w') as state_file:
+            json.dump({'authkey': authkey, 'workers': addresses}, state_file)
+        print("[nkt] {} workers ready, state in {}".format(
+            worker_count, state_path))
+
+        for process in processes:
+            process.wait()
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+        if os.path.exists(state_path):
+            os.remove(state_path)
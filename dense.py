@@ -0,0 +1,163 @@
+import numpy as np
+
+from .channels import (
+    action_matrices,
+    get_action_key,
+    get_channel_index,
+    invalidate_action_matrix
+)
+
+# Value of the 'LINEAR' item in the keyframe interpolation enum
+LINEAR_INTERPOLATION = 1
+
+
+def read_dense_curve(curve, start, end):
+    """
+    Returns the values of curve sampled on every frame in [start, end] as a
+    float array. Curves that are already keyed on every frame (as produced by
+    nla.bake) are read in bulk, others are evaluated per frame.
+    """
+    count = end - start + 1
+    points = curve.keyframe_points
+    if len(points) == count:
+        co = np.empty(count * 2, dtype=np.float32)
+        points.foreach_get('co', co)
+        co = co.reshape(count, 2).astype(np.float64)
+        if np.array_equal(co[:, 0], np.arange(start, end + 1)):
+            return co[:, 1]
+
+    return np.fromiter(
+        (curve.evaluate(frame) for frame in range(start, end + 1)),
+        dtype=np.float64,
+        count=count
+    )
+
+
+def write_dense_curve(curve, values, start):
+    """
+    Replaces all keyframes of curve with one linear keyframe per frame
+    starting at start.
+    """
+    write_keyframes(curve, np.arange(start, start + len(values)), values)
+
+
+def write_keyframes(curve, frames, values):
+    """Replaces all keyframes of curve with linear keyframes at frames"""
+    count = len(values)
+    points = curve.keyframe_points
+    while len(points) > count:
+        points.remove(points[-1], fast=True)
+    if len(points) < count:
+        points.add(count - len(points))
+
+    co = np.empty((count, 2), dtype=np.float32)
+    co[:, 0] = frames
+    co[:, 1] = values
+    points.foreach_set('co', co.ravel())
+    points.foreach_set('handle_left', co.ravel())
+    points.foreach_set('handle_right', co.ravel())
+    points.foreach_set(
+        'interpolation',
+        np.full(count, LINEAR_INTERPOLATION, dtype=np.int32)
+    )
+    curve.update()
+    invalidate_action_matrix(curve.id_data)
+
+
+class ActionMatrix:
+    """
+    An action sampled on every frame in [start_frame, end_frame] as a dense
+    (frames, channels) float32 array. channels describes the columns as
+    (bone name, property, array index), with None as bone name for object
+    channels. Curves without keyframes are left out.
+    """
+
+    def __init__(self, action, start_frame=None, end_frame=None):
+        if start_frame is None or end_frame is None:
+            start_frame = int(action.frame_range[0])
+            end_frame = int(action.frame_range[1])
+        self.action = action
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.index = get_channel_index(action)
+
+        self.channels = [
+            (bone_name, prop, array_index)
+            for bone_name, bone_channels in self.index.bones.items()
+            for (prop, array_index), fcurve in sorted(
+                bone_channels.items(), key=lambda item: item[0])
+            if len(fcurve.keyframe_points) > 0
+        ]
+        self.columns = {
+            channel: column for column, channel in enumerate(self.channels)
+        }
+
+        self.values = np.empty(
+            (end_frame - start_frame + 1, len(self.channels)),
+            dtype=np.float32
+        )
+        for column, channel in enumerate(self.channels):
+            self.values[:, column] = read_dense_curve(
+                self.index.get(*channel), start_frame, end_frame)
+
+    @property
+    def frames(self):
+        return np.arange(self.start_frame, self.end_frame + 1)
+
+    def get_columns(self, bone_name, prop, size):
+        """
+        Returns the column of every component of a vector property, -1 for
+        components without keyframes.
+        """
+        return [
+            self.columns.get((bone_name, prop, i), -1) for i in range(size)
+        ]
+
+    def is_valid(self, action):
+        """
+        Checks that the matrix was sampled from action and that its curves
+        were not replaced since. The sampled action may have been freed.
+        """
+        try:
+            if self.action != action:
+                return False
+        except ReferenceError:
+            return False
+        return get_channel_index(action) is self.index
+
+    def write(self, columns=None):
+        """
+        Writes the values of the given columns (all by default) back into
+        their fcurves, keying every frame. The matrix stays cached as the
+        current state of the action.
+        """
+        if columns is None:
+            columns = range(len(self.channels))
+        for column in columns:
+            write_dense_curve(
+                self.index.get(*self.channels[column]),
+                self.values[:, column],
+                self.start_frame
+            )
+        action_matrices[get_action_key(self.action)] = self
+
+
+def get_action_matrix(action, start_frame=None, end_frame=None):
+    """
+    Returns the ActionMatrix of action over the frame range (the action's
+    by default), sampled once and reused until the action is edited. The
+    matrix is shared, changed values must be written back with write().
+    """
+    key = get_action_key(action)
+    matrix = action_matrices.get(key)
+    if start_frame is None or end_frame is None:
+        start_frame = int(action.frame_range[0])
+        end_frame = int(action.frame_range[1])
+    if (
+        matrix is None or
+        not matrix.is_valid(action) or
+        (matrix.start_frame, matrix.end_frame) != (start_frame, end_frame)
+    ):
+        matrix = ActionMatrix(action, start_frame, end_frame)
+        action_matrices[key] = matrix
+    return matrix
@@ -0,0 +1,384 @@
+import os
+import json
+import hashlib
+import tempfile
+
+import bpy
+import numpy as np
+
+from .gltfmerge import merge_animations
+from .jobs import scale_progress
+from .skeleton import Skeleton, hash_rest_pose
+from .workers import iter_worker_tasks, split_jobs, worker_task
+
+# Bump to re-export everything written by an incompatible version.
+EXPORT_MANIFEST_VERSION = 1
+
+
+def get_export_extension(export_format):
+    return '.glb' if export_format == 'GLB' else '.gltf'
+
+
+def export_gltf(filepath, export_format, **options):
+    """Exports the scene to filepath with the quick export settings"""
+    bpy.ops.export_scene.gltf(
+        filepath=filepath,
+        export_format=export_format,
+        export_frame_range=False,
+        export_force_sampling=False,
+        export_tangents=False,
+        export_image_format="AUTO",
+        export_cameras=False,
+        export_lights=False,
+        **options
+    )
+
+
+def set_nla_actions(armature, char_actions):
+    """Replaces the animation of armature with one NLA track per action"""
+    armature.animation_data_clear()
+    anim_data = armature.animation_data_create()
+    for char_action in char_actions:
+        track = anim_data.nla_tracks.new()
+        track.name = char_action.name
+        track.strips.new(
+            name=char_action.name,
+            start=char_action.action.frame_range[0],
+            action=char_action.action
+        )
+
+
+@worker_task('export_actions')
+def export_actions_task(args):
+    """
+    Worker task that exports the active character's armature once per
+    entry of args['exports'], with the named actions as NLA tracks.
+    """
+    context = bpy.context
+    character = context.scene.nkt_settings.get_active_character()
+    armature = character.armature
+    bpy.ops.object.mode_set(mode='OBJECT')
+    bpy.ops.object.select_all(action='DESELECT')
+    armature.select_set(True)
+    context.view_layer.objects.active = armature
+
+    for export in args['exports']:
+        set_nla_actions(armature, [
+            character.actions[character.get_action_index(name)]
+            for name in export['actions']
+        ])
+        export_gltf(
+            export['filepath'],
+            args['format'],
+            use_selection=True,
+            export_animations=True,
+            export_nla_strips=True
+        )
+    return {'files': [export['filepath'] for export in args['exports']]}
+
+
+def iter_export_actions_parallel(exports, export_format, worker_count):
+    """
+    Generator running the exports (dicts of 'actions' and 'filepath') on
+    background workers from a copy of the current file. Yields progress
+    while the workers run and returns the list of failed exports with the
+    error message of each.
+    """
+    with tempfile.TemporaryDirectory(prefix='nkt_export_') as temp_dir:
+        blend_file = os.path.join(temp_dir, 'scene.blend')
+        bpy.ops.wm.save_as_mainfile(filepath=blend_file, copy=True)
+        args_list = [
+            {'exports': chunk, 'format': export_format}
+            for chunk in split_jobs(exports, worker_count)
+        ]
+        results = yield from iter_worker_tasks(
+            'export_actions', args_list, blend_file)
+
+    failed = []
+    for args, (result, log) in zip(args_list, results):
+        if result is None:
+            failed.extend(
+                (export, "Export worker failed for {}:\n{}".format(
+                    ", ".join(export['actions']), log))
+                for export in args['exports']
+            )
+    return failed
+
+
+def iter_sharded_export(character, report):
+    """
+    Generator exporting the character with its actions split into shards,
+    one per worker, exported in parallel. The shards are merged into the
+    export file around the rig, or kept as <export name>_<i> files next to
+    it when the character does not merge them.
+    """
+    directory = bpy.path.abspath(character.export_path)
+    extension = get_export_extension(character.export_format)
+    filepath = os.path.join(directory, character.export_name + extension)
+    action_names = [char_action.name for char_action in character.actions]
+
+    with tempfile.TemporaryDirectory(prefix='nkt_shards_') as shard_dir:
+        if not character.merge_export_shards:
+            shard_dir = directory
+        exports = [
+            {
+                'actions': chunk,
+                'filepath': os.path.join(shard_dir, "{}_{}{}".format(
+                    character.export_name, i, extension))
+            }
+            for i, chunk in enumerate(split_jobs(
+                action_names, character.export_worker_count))
+        ]
+        failed = yield from scale_progress(
+            iter_export_actions_parallel(
+                exports, character.export_format, len(exports)),
+            0.0,
+            0.8
+        )
+        for _, error in failed:
+            report({'ERROR'}, error)
+        if failed:
+            return
+
+        export_gltf(filepath, character.export_format, export_animations=False)
+        yield 0.9
+
+        if character.merge_export_shards:
+            merge_animations(
+                filepath,
+                [export['filepath'] for export in exports],
+                filepath,
+                character.export_format
+            )
+    yield 1.0
+
+    report(
+        {'INFO'},
+        "Exported {} action(s) in {} shard(s){}.".format(
+            len(action_names),
+            len(exports),
+            ", merged" if character.merge_export_shards else ""
+        )
+    )
+
+
+def hash_action(action):
+    """Returns a sha256 hex digest of the keyframes of action"""
+    digest = hashlib.sha256()
+    digest.update(repr(tuple(action.frame_range)).encode())
+    fcurves = sorted(
+        action.fcurves,
+        key=lambda fcurve: (fcurve.data_path, fcurve.array_index)
+    )
+    for fcurve in fcurves:
+        points = fcurve.keyframe_points
+        count = len(points)
+        digest.update("{}[{}]:{}:{}".format(
+            fcurve.data_path, fcurve.array_index, count, fcurve.mute
+        ).encode())
+        for prop in ('co', 'handle_left', 'handle_right'):
+            values = np.empty(count * 2, dtype=np.float32)
+            points.foreach_get(prop, values)
+            digest.update(values.tobytes())
+        interpolation = np.empty(count, dtype=np.int32)
+        points.foreach_get('interpolation', interpolation)
+        digest.update(interpolation.tobytes())
+    return digest.hexdigest()
+
+
+def hash_skeleton(armature):
+    """
+    Returns a sha256 hex digest of what every action file embeds besides
+    the action: the skeleton with its rest pose and the armature transform.
+    """
+    digest = hashlib.sha256()
+    digest.update(Skeleton.from_armature(armature).fingerprint.encode())
+    digest.update(hash_rest_pose(armature).encode())
+    digest.update(
+        np.array(armature.matrix_world, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def hash_rig(scene, armature):
+    """
+    Returns a sha256 hex digest of what the rig export contains: the
+    skeleton with its rest pose and the geometry of the scene's meshes.
+    """
+    digest = hashlib.sha256()
+    digest.update(Skeleton.from_armature(armature).fingerprint.encode())
+    bones = armature.data.bones
+    matrices = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get('matrix_local', matrices)
+    digest.update(matrices.tobytes())
+
+    meshes = sorted(
+        (obj for obj in scene.objects if obj.type == 'MESH'),
+        key=lambda obj: obj.name
+    )
+    for obj in meshes:
+        mesh = obj.data
+        digest.update("{}:{}".format(
+            obj.name, [slot.name for slot in obj.material_slots]).encode())
+        digest.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+        co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get('co', co)
+        digest.update(co.tobytes())
+        loops = np.empty(len(mesh.loops), dtype=np.int32)
+        mesh.loops.foreach_get('vertex_index', loops)
+        digest.update(loops.tobytes())
+    return digest.hexdigest()
+
+
+def read_export_manifest(filepath, options):
+    """
+    Reads the hashes of a previous split export. Returns an empty manifest
+    when there is none or it was written with other options.
+    """
+    manifest = {
+        'version': EXPORT_MANIFEST_VERSION,
+        'options': options,
+        'rig': None,
+        'actions': {}
+    }
+    if os.path.exists(filepath):
+        with open(filepath) as manifest_file:
+            previous = json.load(manifest_file)
+        if (
+            previous.get('version') == EXPORT_MANIFEST_VERSION and
+            previous.get('options') == options
+        ):
+            manifest.update(previous)
+    return manifest
+
+
+def write_export_manifest(filepath, manifest):
+    with open(filepath, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+
+
+def remove_export_file(directory, filename):
+    """Removes an exported file along with the buffer of .gltf files"""
+    stem = os.path.splitext(filename)[0]
+    for name in (filename, stem + '.bin'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def iter_split_export(character, report):
+    """
+    Generator exporting the character as one file with the rig and meshes
+    and one file per action, yielding the progress after every file. Only
+    files whose content hash changed since the last export are written, the
+    hashes are kept in a <export name>.nkt.json manifest next to them.
+    """
+    context = bpy.context
+    armature = character.armature
+    directory = bpy.path.abspath(character.export_path)
+    extension = get_export_extension(character.export_format)
+    manifest_path = os.path.join(
+        directory, character.export_name + '.nkt.json')
+    manifest = read_export_manifest(
+        manifest_path, {'format': character.export_format})
+
+    # Action files embed the skeleton, so a rig change makes them all stale.
+    skeleton_hash = hash_skeleton(armature)
+    files = {}
+    for char_action in character.actions:
+        files[char_action.name] = {
+            'hash': hash_action(char_action.action),
+            'skeleton': skeleton_hash,
+            'file': "{}_{}{}".format(
+                character.export_name,
+                bpy.path.clean_name(char_action.name),
+                extension
+            )
+        }
+    current_files = {entry['file'] for entry in files.values()}
+    for name, entry in list(manifest['actions'].items()):
+        if files.get(name) != entry:
+            if entry['file'] not in current_files:
+                remove_export_file(directory, entry['file'])
+            del manifest['actions'][name]
+    dirty = [
+        char_action for char_action in character.actions
+        if char_action.name not in manifest['actions'] or
+        not os.path.exists(
+            os.path.join(directory, files[char_action.name]['file']))
+    ]
+
+    rig_hash = hash_rig(context.scene, armature)
+    rig_file = character.export_name + extension
+    export_rig = (
+        manifest['rig'] != rig_hash or
+        not os.path.exists(os.path.join(directory, rig_file))
+    )
+
+    anim_data = armature.animation_data_create()
+    current_action = anim_data.action
+    count = len(dirty) + 1
+    exported = []
+    try:
+        if export_rig:
+            export_gltf(
+                os.path.join(directory, rig_file),
+                character.export_format,
+                export_animations=False
+            )
+            manifest['rig'] = rig_hash
+        yield 1 / count
+
+        if character.use_export_workers and len(dirty) > 1:
+            exports = [
+                {
+                    'actions': [char_action.name],
+                    'filepath': os.path.join(
+                        directory, files[char_action.name]['file'])
+                }
+                for char_action in dirty
+            ]
+            failed = yield from scale_progress(
+                iter_export_actions_parallel(
+                    exports,
+                    character.export_format,
+                    character.export_worker_count
+                ),
+                1 / count,
+                1.0
+            )
+            failed_names = set()
+            for export, error in failed:
+                failed_names.update(export['actions'])
+                report({'ERROR'}, error)
+            exported = [
+                char_action for char_action in dirty
+                if char_action.name not in failed_names
+            ]
+        else:
+            for i, char_action in enumerate(dirty):
+                anim_data.action = char_action.action
+                export_gltf(
+                    os.path.join(directory, files[char_action.name]['file']),
+                    character.export_format,
+                    use_selection=True,
+                    export_animations=True,
+                    export_nla_strips=False
+                )
+                exported.append(char_action)
+                yield (i + 2) / count
+    finally:
+        anim_data.action = current_action
+        for char_action in exported:
+            entry = files[char_action.name]
+            manifest['actions'][char_action.name] = entry
+        write_export_manifest(manifest_path, manifest)
+
+    report(
+        {'INFO'},
+        "Exported {}{} of {} action(s), {} unchanged.".format(
+            "the rig and " if export_rig else "",
+            len(exported),
+            len(files),
+            len(files) - len(dirty)
+        )
+    )
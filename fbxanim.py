@@ -0,0 +1,222 @@
+import bpy
+import numpy as np
+
+from .baker import write_bone_transforms
+from .fbxreader import FBX_KTIME, get_model_name, read_fbx, sample_curve
+from .profiles import get_active_profile
+from .transforms import euler_to_matrix
+
+ROTATION_ORDERS = ('XYZ', 'XZY', 'YZX', 'YXZ', 'ZXY', 'ZYX')
+CHANNELS = {
+    b'Lcl Translation': 'location',
+    b'Lcl Rotation': 'rotation',
+    b'Lcl Scaling': 'scale'
+}
+
+
+def get_axis_matrix(global_settings):
+    """
+    Returns the rotation converting the FBX axis system to Blender's (up to
+    Z, front to -Y), as the FBX importer does.
+    """
+    props = global_settings.get_properties() if global_settings else {}
+
+    def axis(name, default):
+        index = props.get(name, (default,))[0]
+        sign = props.get(name + b'Sign', (1,))[0]
+        vector = np.zeros(3)
+        vector[index] = sign
+        return vector
+
+    fbx_axes = np.stack((
+        axis(b'CoordAxis', 0),
+        axis(b'FrontAxis', 2),
+        axis(b'UpAxis', 1)
+    ), axis=-1)
+    blender_axes = np.array([
+        [1.0, 0.0, 0.0],
+        [0.0, -1.0, 0.0],
+        [0.0, 0.0, 1.0]
+    ])
+    return blender_axes @ np.linalg.inv(fbx_axes)
+
+
+def get_unit_scale(global_settings):
+    props = global_settings.get_properties() if global_settings else {}
+    return props.get(b'UnitScaleFactor', (1.0,))[0] / 100.0
+
+
+def get_local_matrices(props, locs, rots, scales):
+    """
+    Builds FBX local matrices (with pre and post rotation) of a model from
+    (frames, 3) location, euler degree and scale arrays.
+    """
+    order = 'XYZ'
+    pre_rotation = np.eye(3)
+    post_rotation = np.eye(3)
+    if props.get(b'RotationActive', (0,))[0]:
+        order = ROTATION_ORDERS[props.get(b'RotationOrder', (0,))[0]]
+        pre_rotation = euler_to_matrix(
+            np.radians(props.get(b'PreRotation', (0.0, 0.0, 0.0))))
+        post_rotation = euler_to_matrix(
+            np.radians(props.get(b'PostRotation', (0.0, 0.0, 0.0))))
+
+    matrices = np.zeros((len(locs), 4, 4))
+    matrices[:, :3, :3] = (
+        pre_rotation @ euler_to_matrix(np.radians(rots), order) @
+        post_rotation.T
+    ) * scales[:, np.newaxis, :]
+    matrices[:, :3, 3] = locs
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def get_rest_values(props):
+    return {
+        'location': np.array(props.get(b'Lcl Translation', (0.0,) * 3)),
+        'rotation': np.array(props.get(b'Lcl Rotation', (0.0,) * 3)),
+        'scale': np.array(props.get(b'Lcl Scaling', (1.0,) * 3))
+    }
+
+
+def load_fbx_action(filepath, armature, action_name, fps, anim_offset=1.0):
+    """
+    Builds an action for armature from the bone animation of a binary FBX
+    file, without importing any object. Bone names are resolved with the
+    active bone map profile, and only bones of armature are kept.
+
+    The FBX local motion of every bone relative to its rest is moved into
+    the armature bone's orientation, which matches importing the file and
+    running prepare_anim_rig when both skeletons share the same rest pose.
+
+    Curves are resampled on every frame following the constant, linear or
+    cubic flag of their keys (see fbxreader.sample_curve). Weighted cubic
+    tangents are evaluated as unweighted ones.
+    """
+    nodes = read_fbx(filepath)
+    objects = nodes.get('Objects')
+    connections = nodes.get('Connections')
+    if not objects or not connections:
+        raise ValueError("No animation found in {}.".format(filepath))
+
+    global_settings = nodes.get('GlobalSettings')
+    axis_matrix = get_axis_matrix(global_settings)
+    unit_scale = get_unit_scale(global_settings)
+
+    models = {}
+    curve_nodes = {}
+    curves = {}
+    for node in objects.children:
+        if node.name == 'Model':
+            models[node.props[0]] = node
+        elif node.name == 'AnimationCurveNode':
+            curve_nodes[node.props[0]] = node
+        elif node.name == 'AnimationCurve':
+            curves[node.props[0]] = node
+
+    parents = {}
+    node_curves = {}
+    model_channels = {}
+    for connection in connections.children:
+        kind, child, parent = connection.props[:3]
+        if kind == b'OO' and child in models:
+            parents[child] = parent
+        elif kind == b'OP' and child in curves and parent in curve_nodes:
+            axis = connection.props[3][-1:].decode()
+            node_curves.setdefault(parent, {})['XYZ'.index(axis)] = child
+        elif kind == b'OP' and child in curve_nodes and parent in models:
+            channel = CHANNELS.get(connection.props[3])
+            if channel:
+                model_channels.setdefault(parent, {})[channel] = child
+
+    if not model_channels:
+        raise ValueError("No animation found in {}.".format(filepath))
+
+    # Frame range covering all keys
+    times = [curves[c].find('KeyTime').props[0] for c in curves]
+    times = np.concatenate([t for t in times if len(t)])
+    start_frame = int(np.floor(times.min() / FBX_KTIME * fps + anim_offset))
+    end_frame = int(np.ceil(times.max() / FBX_KTIME * fps + anim_offset))
+    frames = np.arange(start_frame, end_frame + 1)
+
+    properties = {
+        model_id: model.get_properties() for model_id, model in models.items()
+    }
+    rest_matrices = {}
+
+    def get_rest_matrix(model_id):
+        """FBX global rest matrix of a model, including non bone parents"""
+        if model_id not in rest_matrices:
+            props = properties[model_id]
+            rest = get_rest_values(props)
+            matrix = get_local_matrices(
+                props,
+                rest['location'][np.newaxis],
+                rest['rotation'][np.newaxis],
+                rest['scale'][np.newaxis]
+            )[0]
+            parent = parents.get(model_id)
+            if parent in models:
+                matrix = get_rest_matrix(parent) @ matrix
+            rest_matrices[model_id] = matrix
+        return rest_matrices[model_id]
+
+    action = bpy.data.actions.new(action_name)
+    bones = armature.data.bones
+    profile = get_active_profile()
+    for model_id, channels in model_channels.items():
+        model_name = get_model_name(models[model_id])
+        bone = bones.get(profile.resolve(model_name))
+        if not bone:
+            continue
+
+        props = properties[model_id]
+        values = get_rest_values(props)
+        rest_local = get_local_matrices(
+            props,
+            values['location'][np.newaxis],
+            values['rotation'][np.newaxis],
+            values['scale'][np.newaxis]
+        )[0]
+
+        for channel, node_id in channels.items():
+            defaults = curve_nodes[node_id].get_properties()
+            sampled = np.empty((len(frames), 3))
+            for i, axis in enumerate('XYZ'):
+                curve_id = node_curves.get(node_id, {}).get(i)
+                default = defaults.get(
+                    ('d|' + axis).encode(), (values[channel][i],))[0]
+                if curve_id is None:
+                    sampled[:, i] = default
+                    continue
+                curve = curves[curve_id]
+                if len(curve.find('KeyTime').props[0]) == 0:
+                    sampled[:, i] = default
+                    continue
+                sampled[:, i] = sample_curve(curve, frames, fps, anim_offset)
+            values[channel] = sampled
+
+        count = len(frames)
+        local = get_local_matrices(
+            props,
+            np.broadcast_to(values['location'], (count, 3)),
+            np.broadcast_to(values['rotation'], (count, 3)),
+            np.broadcast_to(values['scale'], (count, 3))
+        )
+
+        # Orientation of the armature bone relative to the FBX bone
+        fbx_rotation = axis_matrix @ get_rest_matrix(model_id)[:3, :3]
+        fbx_rotation /= np.linalg.norm(fbx_rotation, axis=0)
+        correction = np.zeros((4, 4))
+        correction[:3, :3] = (
+            fbx_rotation.T @ np.array(bone.matrix_local.to_3x3().normalized())
+        )
+        correction[3, 3] = 1.0
+
+        basis = correction.T @ np.linalg.inv(rest_local) @ local @ correction
+        basis[:, :3, 3] *= unit_scale
+        write_bone_transforms(action, bone.name, basis, start_frame)
+
+    if len(action.groups) > 0:
+        action.groups[0].name = "NKT Imported"
+    return action
@@ -0,0 +1,263 @@
+import zlib
+import struct
+
+import numpy as np
+
+FBX_MAGIC = b'Kaydara FBX Binary  \x00'
+FBX_KTIME = 46186158000
+
+# Top level nodes (and their children) needed to build an action, anything
+# else is skipped without being decoded. None keeps the whole subtree.
+ANIMATION_NODES = {
+    'GlobalSettings': None,
+    'Objects': {
+        'Model': None,
+        'AnimationCurveNode': None,
+        'AnimationCurve': None
+    },
+    'Connections': None
+}
+
+# Nodes needed to read the bone hierarchy only.
+SKELETON_NODES = {
+    'Objects': {
+        'Model': {}
+    },
+    'Connections': None
+}
+
+ARRAY_TYPES = {
+    ord('f'): '<f4',
+    ord('d'): '<f8',
+    ord('l'): '<i8',
+    ord('i'): '<i4',
+    ord('b'): '<u1'
+}
+SCALAR_TYPES = {
+    ord('Y'): '<h',
+    ord('C'): '<?',
+    ord('I'): '<i',
+    ord('F'): '<f',
+    ord('D'): '<d',
+    ord('L'): '<q'
+}
+
+# Interpolation bits of the KeyAttrFlags of an AnimationCurve. Keys without
+# any of them are interpolated linearly.
+INTERPOLATION_CONSTANT = 0x002
+INTERPOLATION_LINEAR = 0x004
+INTERPOLATION_CUBIC = 0x008
+# Constant keys with this bit hold the value of the next key.
+CONSTANT_NEXT = 0x100
+
+
+class FBXNode:
+    __slots__ = ('name', 'props', 'children')
+
+    def __init__(self, name, props, children):
+        self.name = name
+        self.props = props
+        self.children = children
+
+    def find(self, name):
+        return next((c for c in self.children if c.name == name), None)
+
+    def get_properties(self):
+        """Returns the Properties70 values of the node keyed by name"""
+        properties = self.find('Properties70')
+        if not properties:
+            return {}
+        return {p.props[0]: p.props[4:] for p in properties.children}
+
+
+def read_property(data, offset):
+    prop_type = data[offset]
+    offset += 1
+    if prop_type in SCALAR_TYPES:
+        fmt = SCALAR_TYPES[prop_type]
+        return struct.unpack_from(fmt, data, offset)[0], \
+            offset + struct.calcsize(fmt)
+    if prop_type in ARRAY_TYPES:
+        length, encoding, size = struct.unpack_from('<III', data, offset)
+        offset += 12
+        raw = data[offset:offset + size]
+        if encoding == 1:
+            raw = zlib.decompress(raw)
+        values = np.frombuffer(raw, dtype=ARRAY_TYPES[prop_type], count=length)
+        return values, offset + size
+    if prop_type in (ord('S'), ord('R')):
+        size = struct.unpack_from('<I', data, offset)[0]
+        offset += 4
+        return bytes(data[offset:offset + size]), offset + size
+
+    raise ValueError("Unknown FBX property type {!r}.".format(chr(prop_type)))
+
+
+def read_node(data, offset, wide, node_filter):
+    """
+    Reads the node record at offset. Returns the node (None for the null
+    record ending a node list, or for a node rejected by node_filter) and
+    the offset of the next record.
+    """
+    header = '<QQQ' if wide else '<III'
+    end, prop_count, _ = struct.unpack_from(header, data, offset)
+    offset += struct.calcsize(header)
+    name_length = data[offset]
+    offset += 1
+    if end == 0:
+        return None, offset
+
+    name = bytes(data[offset:offset + name_length]).decode()
+    offset += name_length
+    if node_filter is not None and name not in node_filter:
+        return None, end
+    child_filter = node_filter[name] if node_filter is not None else None
+
+    props = []
+    for _ in range(prop_count):
+        value, offset = read_property(data, offset)
+        props.append(value)
+
+    children = []
+    while offset < end:
+        child, offset = read_node(data, offset, wide, child_filter)
+        if child:
+            children.append(child)
+
+    return FBXNode(name, props, children), end
+
+
+def read_fbx(filepath, node_filter=ANIMATION_NODES):
+    """
+    Reads the top level nodes of a binary FBX file that pass node_filter,
+    keyed by name.
+    """
+    with open(filepath, 'rb') as file:
+        data = memoryview(file.read())
+
+    if bytes(data[:len(FBX_MAGIC)]) != FBX_MAGIC:
+        raise ValueError("{} is not a binary FBX file.".format(filepath))
+    version = struct.unpack_from('<I', data, 23)[0]
+    wide = version >= 7500
+    null_size = 25 if wide else 13
+
+    nodes = {}
+    offset = 27
+    while offset + null_size <= len(data):
+        if not any(data[offset:offset + null_size]):
+            break
+        node, offset = read_node(data, offset, wide, node_filter)
+        if node:
+            nodes[node.name] = node
+    return nodes
+
+
+def get_model_name(model):
+    return model.props[1].split(b'\x00')[0].decode()
+
+
+def read_fbx_skeleton(filepath):
+    """
+    Returns the bone hierarchy of a binary FBX file as a dict of bone name
+    to parent bone name (None for root bones). Leaf bones are left out, as
+    the importer's ignore_leaf_bones does.
+    """
+    nodes = read_fbx(filepath, SKELETON_NODES)
+    objects = nodes.get('Objects')
+    connections = nodes.get('Connections')
+    if not objects or not connections:
+        raise ValueError("No skeleton found in {}.".format(filepath))
+
+    bones = {
+        model.props[0]: get_model_name(model)
+        for model in objects.children
+        if len(model.props) > 2 and model.props[2] == b'LimbNode'
+    }
+    parents = {}
+    for connection in connections.children:
+        kind, child, parent = connection.props[:3]
+        if kind == b'OO' and child in bones:
+            parents[child] = parent
+
+    has_children = {
+        parent for parent in parents.values() if parent in bones
+    }
+    return {
+        bones[bone_id]: bones.get(parents.get(bone_id))
+        for bone_id in bones if bone_id in has_children
+    }
+
+
+def get_key_attributes(curve, key_count):
+    """
+    Returns the KeyAttrFlags of every key of an AnimationCurve node and its
+    (right slope, next left slope) pair in value per second. Consecutive
+    keys share attributes as counted by KeyAttrRefCount.
+    """
+    flags = curve.find('KeyAttrFlags')
+    data = curve.find('KeyAttrDataFloat')
+    ref_counts = curve.find('KeyAttrRefCount')
+    if not flags or not ref_counts or len(flags.props[0]) == 0:
+        return (
+            np.full(key_count, INTERPOLATION_LINEAR, dtype=np.int32),
+            np.zeros((key_count, 2))
+        )
+
+    attributes = np.repeat(
+        np.arange(len(ref_counts.props[0])), ref_counts.props[0])
+    attributes = attributes[
+        np.minimum(np.arange(key_count), len(attributes) - 1)]
+    slopes = np.zeros((len(flags.props[0]), 2))
+    if data and len(data.props[0]) >= 4 * len(slopes):
+        slopes = data.props[0][:4 * len(slopes)].reshape(-1, 4)[:, :2]
+    return flags.props[0][attributes], slopes[attributes].astype(np.float64)
+
+
+def sample_curve(curve, frames, fps, anim_offset=1.0):
+    """
+    Samples an AnimationCurve node on frames, its key times being placed at
+    time * fps + anim_offset. Each key's constant, linear or cubic flag is
+    honored up to the next key, cubic segments are Hermite splines of the
+    stored slopes (tangent weights are ignored). Frames outside of the keys
+    hold the first or last value.
+    """
+    key_times = curve.find('KeyTime').props[0]
+    key_values = curve.find('KeyValueFloat').props[0].astype(np.float64)
+    frames = np.asarray(frames, dtype=np.float64)
+    count = len(key_times)
+    if count == 1:
+        return np.full(len(frames), key_values[0])
+
+    key_frames = key_times / FBX_KTIME * fps + anim_offset
+    flags, slopes = get_key_attributes(curve, count)
+    segments = np.clip(
+        np.searchsorted(key_frames, frames, side='right') - 1, 0, count - 2)
+    start = key_frames[segments]
+    length = key_frames[segments + 1] - start
+    t = np.divide(
+        frames - start, length, out=np.ones_like(frames), where=length > 0)
+    t = np.clip(t, 0.0, 1.0)
+    v0 = key_values[segments]
+    v1 = key_values[segments + 1]
+    values = v0 + t * (v1 - v0)
+
+    segment_flags = flags[segments]
+    cubic = (segment_flags & INTERPOLATION_CUBIC) != 0
+    if cubic.any():
+        tc = t[cubic]
+        seconds = length[cubic] / fps
+        t2 = tc * tc
+        t3 = t2 * tc
+        values[cubic] = (
+            (2.0 * t3 - 3.0 * t2 + 1.0) * v0[cubic] +
+            (t3 - 2.0 * t2 + tc) * slopes[segments[cubic], 0] * seconds +
+            (3.0 * t2 - 2.0 * t3) * v1[cubic] +
+            (t3 - t2) * slopes[segments[cubic], 1] * seconds
+        )
+
+    constant = (segment_flags & INTERPOLATION_CONSTANT) != 0
+    if constant.any():
+        use_next = (t >= 1.0) | (
+            ((segment_flags & CONSTANT_NEXT) != 0) & (t > 0.0))
+        values[constant] = np.where(use_next, v1, v0)[constant]
+    return values
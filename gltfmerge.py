@@ -0,0 +1,195 @@
+import os
+import json
+import base64
+import struct
+
+from urllib.parse import unquote
+
+GLB_MAGIC = b'glTF'
+GLB_JSON_CHUNK = 0x4E4F534A
+GLB_BIN_CHUNK = 0x004E4942
+DATA_URI_PREFIX = 'data:application/octet-stream;base64,'
+
+
+def pad(data, fill=b'\0'):
+    data += fill * (-len(data) % 4)
+    return data
+
+
+def read_gltf(filepath):
+    """
+    Reads a .glb or .gltf file. Returns the json document and the contents
+    of its buffers.
+    """
+    with open(filepath, 'rb') as gltf_file:
+        data = gltf_file.read()
+
+    if data[:4] == GLB_MAGIC:
+        gltf, binary = None, b''
+        offset = 12
+        while offset < len(data):
+            length, chunk_type = struct.unpack_from('<II', data, offset)
+            chunk = data[offset + 8:offset + 8 + length]
+            if chunk_type == GLB_JSON_CHUNK:
+                gltf = json.loads(chunk)
+            elif chunk_type == GLB_BIN_CHUNK:
+                binary = chunk
+            offset += 8 + length
+        if gltf is None:
+            raise ValueError("{} has no json chunk.".format(filepath))
+        buffers = [
+            binary if 'uri' not in buffer else
+            read_buffer_uri(filepath, buffer['uri'])
+            for buffer in gltf.get('buffers', [])
+        ]
+        return gltf, buffers
+
+    gltf = json.loads(data)
+    buffers = [
+        read_buffer_uri(filepath, buffer['uri'])
+        for buffer in gltf.get('buffers', [])
+    ]
+    return gltf, buffers
+
+
+def read_buffer_uri(filepath, uri):
+    if uri.startswith('data:'):
+        return base64.b64decode(uri.split(',', 1)[1])
+    path = os.path.join(os.path.dirname(filepath), unquote(uri))
+    with open(path, 'rb') as buffer_file:
+        return buffer_file.read()
+
+
+def join_buffers(gltf, buffers):
+    """Moves all buffer views of gltf into a single buffer, returned"""
+    blob = bytearray()
+    offsets = []
+    for data in buffers:
+        pad(blob)
+        offsets.append(len(blob))
+        blob += data
+    for view in gltf.get('bufferViews', []):
+        offset = offsets[view['buffer']]
+        view['byteOffset'] = view.get('byteOffset', 0) + offset
+        view['buffer'] = 0
+    return blob
+
+
+def write_gltf(filepath, gltf, blob, export_format):
+    """
+    Writes gltf with blob as its only buffer, in the layout of the glTF
+    exporter's export_format.
+    """
+    gltf['buffers'] = [{'byteLength': len(blob)}] if blob else []
+    if export_format == 'GLB':
+        json_chunk = pad(
+            json.dumps(gltf, separators=(',', ':')).encode(), b' ')
+        bin_chunk = pad(bytes(blob))
+        length = 12 + 8 + len(json_chunk) + (8 + len(bin_chunk) if blob else 0)
+        with open(filepath, 'wb') as gltf_file:
+            gltf_file.write(struct.pack('<4sII', GLB_MAGIC, 2, length))
+            gltf_file.write(
+                struct.pack('<II', len(json_chunk), GLB_JSON_CHUNK))
+            gltf_file.write(json_chunk)
+            if blob:
+                gltf_file.write(
+                    struct.pack('<II', len(bin_chunk), GLB_BIN_CHUNK))
+                gltf_file.write(bin_chunk)
+        return
+
+    if blob and export_format == 'GLTF_EMBEDDED':
+        gltf['buffers'][0]['uri'] = (
+            DATA_URI_PREFIX + base64.b64encode(blob).decode())
+    elif blob:
+        bin_path = os.path.splitext(filepath)[0] + '.bin'
+        with open(bin_path, 'wb') as bin_file:
+            bin_file.write(blob)
+        gltf['buffers'][0]['uri'] = os.path.basename(bin_path)
+    with open(filepath, 'w') as gltf_file:
+        json.dump(gltf, gltf_file, indent=4)
+
+
+class AnimationMerger:
+    """
+    Appends the animations of other glTF files to a base document, with the
+    channels retargeted to the base nodes of the same name.
+    """
+
+    def __init__(self, filepath):
+        self.gltf, buffers = read_gltf(filepath)
+        self.blob = join_buffers(self.gltf, buffers)
+        self.nodes = {
+            node.get('name'): i
+            for i, node in enumerate(self.gltf.get('nodes', []))
+        }
+
+    def add_file(self, filepath):
+        """Adds the animations of filepath, returns their names"""
+        source, buffers = read_gltf(filepath)
+        source_blob = join_buffers(source, buffers)
+        source_nodes = source.get('nodes', [])
+        views = {}
+        accessors = {}
+
+        def copy_view(index):
+            if index not in views:
+                view = dict(source['bufferViews'][index])
+                start = view['byteOffset']
+                pad(self.blob)
+                view['byteOffset'] = len(self.blob)
+                self.blob += source_blob[start:start + view['byteLength']]
+                buffer_views = self.gltf.setdefault('bufferViews', [])
+                buffer_views.append(view)
+                views[index] = len(buffer_views) - 1
+            return views[index]
+
+        def copy_accessor(index):
+            if index not in accessors:
+                accessor = dict(source['accessors'][index])
+                accessor['bufferView'] = copy_view(accessor['bufferView'])
+                target_accessors = self.gltf.setdefault('accessors', [])
+                target_accessors.append(accessor)
+                accessors[index] = len(target_accessors) - 1
+            return accessors[index]
+
+        names = []
+        for animation in source.get('animations', []):
+            samplers = []
+            sampler_indices = {}
+            channels = []
+            for channel in animation['channels']:
+                node_name = source_nodes[channel['target']['node']].get('name')
+                if node_name not in self.nodes:
+                    continue
+                index = channel['sampler']
+                if index not in sampler_indices:
+                    sampler = dict(animation['samplers'][index])
+                    sampler['input'] = copy_accessor(sampler['input'])
+                    sampler['output'] = copy_accessor(sampler['output'])
+                    sampler_indices[index] = len(samplers)
+                    samplers.append(sampler)
+                target = dict(channel['target'], node=self.nodes[node_name])
+                channels.append(
+                    {'sampler': sampler_indices[index], 'target': target})
+
+            if channels:
+                merged = dict(animation, channels=channels, samplers=samplers)
+                self.gltf.setdefault('animations', []).append(merged)
+                names.append(animation.get('name'))
+        return names
+
+    def write(self, filepath, export_format):
+        write_gltf(filepath, self.gltf, self.blob, export_format)
+
+
+def merge_animations(base_path, filepaths, filepath, export_format):
+    """
+    Writes base_path with the animations of filepaths added as filepath.
+    Returns the names of the added animations.
+    """
+    merger = AnimationMerger(base_path)
+    names = []
+    for path in filepaths:
+        names.extend(merger.add_file(path))
+    merger.write(filepath, export_format)
+    return names
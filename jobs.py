@@ -0,0 +1,228 @@
+import time
+import traceback
+
+import bpy
+
+from bpy.types import Operator
+from bpy.props import EnumProperty, IntProperty
+
+# Seconds of work done per timer tick before handing control back to the UI.
+STEP_BUDGET = 0.05
+TICK_INTERVAL = 0.01
+
+
+class Job:
+    """
+    A long running task split into steps. create_steps is called with the
+    job's report method and returns a generator that does one small piece of
+    work (a clip, a chunk of frames) per iteration and yields its progress
+    in [0, 1].
+    """
+
+    def __init__(self, name, create_steps, on_finish=None):
+        self.name = name
+        self.steps = create_steps(self.report)
+        self.on_finish = on_finish
+        self.state = 'QUEUED'
+        self.progress = 0.0
+        self.messages = []
+
+    def report(self, type, message):
+        """Collects messages, with the same signature as Operator.report"""
+        self.messages.append((type, message))
+
+    @property
+    def is_active(self):
+        return self.state in ('QUEUED', 'RUNNING')
+
+    def step(self):
+        """Runs one step, returns False once the job has ended"""
+        self.state = 'RUNNING'
+        try:
+            self.progress = next(self.steps)
+        except StopIteration:
+            self.finish('FINISHED')
+            return False
+        except Exception:
+            self.report({'ERROR'}, traceback.format_exc())
+            self.finish('FAILED')
+            return False
+        return True
+
+    def finish(self, state):
+        self.state = state
+        self.progress = 1.0
+        self.steps.close()
+        if self.on_finish:
+            self.on_finish(self)
+
+    def cancel(self):
+        if self.is_active or self.state == 'PAUSED':
+            self.finish('CANCELLED')
+
+    def pause(self):
+        if self.is_active:
+            self.state = 'PAUSED'
+
+    def resume(self):
+        if self.state == 'PAUSED':
+            self.state = 'QUEUED'
+
+
+job_queue = []
+
+
+def get_active_job():
+    return next((job for job in job_queue if job.is_active), None)
+
+
+def update_progress(job):
+    window_manager = bpy.context.window_manager
+    if job:
+        window_manager.progress_update(int(job.progress * 100))
+    else:
+        window_manager.progress_end()
+
+    for window in window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+
+def run_jobs():
+    """
+    Timer callback running queued jobs in order, STEP_BUDGET seconds at a
+    time (less when a step makes no progress), until no active job is left.
+    """
+    deadline = time.perf_counter() + STEP_BUDGET
+    job = get_active_job()
+    while job and time.perf_counter() < deadline:
+        progress = job.progress
+        if not job.step():
+            job = get_active_job()
+            if job:
+                bpy.context.window_manager.progress_begin(0, 100)
+        elif job.progress == progress:
+            # The job waits on something (like workers), so hand the rest
+            # of the tick back to the UI.
+            break
+
+    # Forget ended jobs, only keeping the last few for the UI.
+    ended = [job for job in job_queue if job.state not in (
+        'QUEUED', 'RUNNING', 'PAUSED')]
+    for old_job in ended[:-5]:
+        job_queue.remove(old_job)
+
+    update_progress(job)
+    return TICK_INTERVAL if job else None
+
+
+def submit_job(name, create_steps, on_finish=None):
+    """
+    Queues a job, running it from a timer so the UI stays responsive.
+    Returns the job, see Job for the arguments.
+    """
+    job = Job(name, create_steps, on_finish)
+    job_queue.append(job)
+    if not bpy.app.timers.is_registered(run_jobs):
+        bpy.context.window_manager.progress_begin(0, 100)
+        bpy.app.timers.register(run_jobs, first_interval=TICK_INTERVAL)
+    return job
+
+
+def run_steps(steps):
+    """Runs all steps of a job generator right away, returns its result"""
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def scale_progress(steps, start, end):
+    """
+    Generator forwarding the steps of a nested job generator with its
+    progress mapped to [start, end]. Returns the nested generator's result.
+    """
+    try:
+        while True:
+            try:
+                progress = next(steps)
+            except StopIteration as stop:
+                return stop.value
+            yield start + (end - start) * progress
+    finally:
+        steps.close()
+
+
+class NKT_OT_job_control(Operator):
+    bl_idname = 'nkt.job_control'
+    bl_label = "Control Job"
+    bl_description = "Cancel, pause or resume a queued job."
+
+    job_index: IntProperty(
+        name="Job Index",
+        description="The index of the job in the job queue.",
+        default=-1
+    )
+
+    action: EnumProperty(
+        items=[
+            ('CANCEL', "Cancel", "Cancel the job.", 'CANCEL', 0),
+            ('PAUSE', "Pause", "Pause the job.", 'PAUSE', 1),
+            ('RESUME', "Resume", "Resume the paused job.", 'PLAY', 2)
+        ],
+        name="Action",
+        description="What to do with the job."
+    )
+
+    def execute(self, context):
+        if self.job_index < 0 or self.job_index >= len(job_queue):
+            self.report({'ERROR'}, "No job at index {}.".format(self.job_index))
+            return {'CANCELLED'}
+
+        job = job_queue[self.job_index]
+        if self.action == 'CANCEL':
+            job.cancel()
+        elif self.action == 'PAUSE':
+            job.pause()
+        else:
+            job.resume()
+            if not bpy.app.timers.is_registered(run_jobs):
+                bpy.app.timers.register(run_jobs, first_interval=TICK_INTERVAL)
+        return {'FINISHED'}
+
+
+class NKT_OT_job_monitor(Operator):
+    bl_idname = 'nkt.job_monitor'
+    bl_label = "Monitor Jobs"
+    bl_description = (
+        "Watch the running jobs, press Esc to cancel the active job."
+    )
+
+    def modal(self, context, event):
+        job = get_active_job()
+        if not job:
+            context.window_manager.event_timer_remove(self.timer)
+            context.workspace.status_text_set(None)
+            return {'FINISHED'}
+
+        if event.type == 'ESC' and event.value == 'PRESS':
+            job.cancel()
+            self.report({'INFO'}, "Cancelled {}.".format(job.name))
+            return {'RUNNING_MODAL'}
+
+        if event.type == 'TIMER':
+            context.workspace.status_text_set(
+                "{}: {:.0%} (Esc to cancel)".format(job.name, job.progress))
+
+        return {'PASS_THROUGH'}
+
+    def invoke(self, context, event):
+        if not get_active_job():
+            return {'CANCELLED'}
+
+        window_manager = context.window_manager
+        self.timer = window_manager.event_timer_add(0.1, window=context.window)
+        window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
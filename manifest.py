@@ -0,0 +1,121 @@
+import os
+import glob
+import json
+
+# This module must not import bpy, it is shared with the daemon client
+# which runs outside of Blender.
+
+# Manifest keys of a character and their defaults.
+CHARACTER_DEFAULTS = {
+    'name': None,
+    'file': None,
+    'animations': [],
+    'hip_bone_name': 'pelvis',
+    'root_bone_name': 'root',
+    'bone_map': 'MIXAMO_UE',
+    'load': {},
+    'rootmotion': None,
+    'export': None
+}
+LOAD_DEFAULTS = {
+    'use_direct_prepare': True,
+    'use_parallel': False,
+    'worker_count': 1,
+    'use_animation_only': False,
+    'check_skeleton': True,
+    'use_pruning': True,
+    'prune_tolerance': 1e-4,
+    'remove_rest': True,
+    'use_cache': True,
+    'cache_size': 2048
+}
+ROOTMOTION_DEFAULTS = {
+    'actions': 'ALL',
+    'start_frame': 1,
+    'use_translation': [True, True, True],
+    'on_ground': True,
+    'use_rotation': True,
+    'use_direct_bake': True
+}
+
+
+def read_manifest(filepath):
+    """
+    Reads a JSON or TOML batch manifest. Relative paths in the manifest are
+    resolved against its directory.
+    """
+    if filepath.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError(
+                "TOML manifests need Python 3.11, use JSON instead.")
+        with open(filepath, 'rb') as manifest_file:
+            manifest = tomllib.load(manifest_file)
+    else:
+        with open(filepath) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    base_dir = os.path.dirname(os.path.abspath(filepath))
+    characters = []
+    for entry in manifest.get('characters', []):
+        unknown = set(entry) - set(CHARACTER_DEFAULTS)
+        if unknown:
+            raise ValueError("Unknown character keys: {}.".format(
+                ", ".join(sorted(unknown))))
+        character = dict(CHARACTER_DEFAULTS, **entry)
+        if not character['file']:
+            raise ValueError("Every character needs a 'file'.")
+
+        character['file'] = os.path.join(base_dir, character['file'])
+        if character['bone_map'].endswith('.json'):
+            character['bone_map'] = os.path.join(
+                base_dir, character['bone_map'])
+        character['animations'] = [
+            os.path.join(base_dir, path) for path in character['animations']
+        ]
+        character['load'] = dict(LOAD_DEFAULTS, **character['load'])
+        if character['rootmotion'] is not None:
+            character['rootmotion'] = dict(
+                ROOTMOTION_DEFAULTS, **character['rootmotion'])
+        if character['export'] is not None:
+            export = dict(character['export'])
+            export['path'] = os.path.join(base_dir, export.get('path', ''))
+            character['export'] = export
+        if not character['name']:
+            character['name'] = os.path.splitext(
+                os.path.basename(character['file']))[0]
+        characters.append(character)
+
+    return {
+        'workers': manifest.get('workers', 1),
+        'characters': characters
+    }
+
+
+def get_animation_files(paths):
+    """Expands folders in paths to the FBX files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.fbx'))))
+        else:
+            files.append(path)
+    return files
+
+
+def print_summary(name, result):
+    if result is None:
+        print("[nkt] {}: worker failed".format(name))
+        return
+    for stage_name, seconds in result['timings'].items():
+        print("[nkt] {}: {} {:.2f}s".format(name, stage_name, seconds))
+    status = "failed" if result['errors'] else "done"
+    print("[nkt] {}: {} with {} error(s)".format(
+        name, status, len(result['errors'])))
+
+
+def get_exit_code(results):
+    """0 when every character succeeded, 1 otherwise"""
+    failed = any(result is None or result['errors'] for result in results)
+    return 1 if failed else 0
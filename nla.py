@@ -0,0 +1,203 @@
+# Strip settings carried over when a track has to be recreated to move it.
+STRIP_SETTINGS = (
+    'action_frame_start',
+    'action_frame_end',
+    'scale',
+    'repeat',
+    'blend_type',
+    'blend_in',
+    'blend_out',
+    'extrapolation',
+    'use_reverse',
+    'mute',
+    'influence'
+)
+
+
+def get_longest_increasing(values):
+    """
+    Returns the indices of a longest strictly increasing subsequence of
+    values, in O(n log n).
+    """
+    tails = []
+    tail_values = []
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        low, high = 0, len(tail_values)
+        while low < high:
+            middle = (low + high) // 2
+            if tail_values[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        if low > 0:
+            previous[i] = tails[low - 1]
+        if low == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[low] = i
+            tail_values[low] = value
+
+    indices = []
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        indices.append(i)
+        i = previous[i]
+    return indices[::-1]
+
+
+def add_action_strip(track, char_action):
+    action = char_action.action
+    return track.strips.new(
+        name=char_action.name,
+        start=int(action.frame_range[0]),
+        action=action
+    )
+
+
+def set_strip_action(strip, action):
+    """Points strip at action and its frame range, keeping the settings"""
+    start, end = action.frame_range
+    strip.action = action
+    # The range setters clamp against each other, so widen the end first.
+    strip.action_frame_end = max(end, strip.action_frame_start)
+    strip.action_frame_start = start
+    strip.action_frame_end = end
+
+
+def copy_track(nla_tracks, track, prev):
+    """
+    Recreates track after prev (at the top for None), with its strips. The
+    old track is removed first since strip names are unique per AnimData.
+    """
+    name, mute, lock = track.name, track.mute, track.lock
+    strips = [
+        (
+            strip.name,
+            strip.action,
+            strip.frame_start,
+            strip.frame_end,
+            {setting: getattr(strip, setting) for setting in STRIP_SETTINGS}
+        )
+        for strip in track.strips if strip.action is not None
+    ]
+    nla_tracks.remove(track)
+
+    new_track = nla_tracks.new(prev=prev)
+    new_track.name = name
+    new_track.mute = mute
+    new_track.lock = lock
+    for strip_name, action, frame_start, frame_end, settings in strips:
+        new_strip = new_track.strips.new(
+            name=strip_name,
+            start=int(frame_start),
+            action=action
+        )
+        for setting, value in settings.items():
+            setattr(new_strip, setting, value)
+        new_strip.frame_start = frame_start
+        new_strip.frame_end = frame_end
+    return new_track
+
+
+def replace_track_action(track, strips, char_action, actions):
+    """
+    Makes track play char_action instead of the actions of its strips: a
+    single strip gets the action in place, otherwise the strips of other
+    character actions and the ones in the way of the new strip are removed.
+    """
+    if len(strips) == 1:
+        set_strip_action(strips[0], char_action.action)
+        return
+
+    start, end = char_action.action.frame_range
+    end = int(start) + end - start
+    start = int(start)
+    for strip in strips:
+        overlaps = strip.frame_start < end and strip.frame_end > start
+        if overlaps or strip.action in actions or strip.action is None:
+            track.strips.remove(strip)
+    add_action_strip(track, char_action)
+
+
+def sync_nla_tracks(anim_data, char_actions):
+    """
+    Makes the NLA of anim_data hold one track per character action, in the
+    order of char_actions, changing only what differs: tracks are matched
+    by name or by the action of their strips, so renamed actions and
+    manual strip edits are kept. Tracks matching neither are left alone,
+    extra tracks of the same action are removed. A matched track whose
+    strip holds another action gets the character action in its place.
+    Returns the counts of 'added', 'removed', 'moved' and 'updated' tracks.
+    """
+    stats = {'added': 0, 'removed': 0, 'moved': 0, 'updated': 0}
+    nla_tracks = anim_data.nla_tracks
+    actions = {char_action.action for char_action in char_actions}
+    names = {char_action.name for char_action in char_actions}
+    if anim_data.action in actions:
+        anim_data.action = None
+
+    by_name = {}
+    by_action = {}
+    managed = set()
+    for track in nla_tracks:
+        if track.name in names:
+            by_name[track.name] = track
+            managed.add(track.name)
+        for strip in track.strips:
+            if strip.action in actions:
+                by_action.setdefault(strip.action, track)
+                managed.add(track.name)
+
+    tracks = []
+    used = set()
+    for char_action in char_actions:
+        track = by_name.get(char_action.name)
+        if track is None or track.name in used:
+            track = by_action.get(char_action.action)
+        if track is not None and track.name in used:
+            track = None
+        if track is not None:
+            used.add(track.name)
+        tracks.append(track)
+
+    for name in managed - used:
+        nla_tracks.remove(nla_tracks[name])
+        stats['removed'] += 1
+
+    # Keep the longest run of tracks already in order, recreate the others
+    # after their predecessor. New tracks can only go on top, so the first
+    # track anchors the order.
+    positions = {track.name: i for i, track in enumerate(nla_tracks)}
+    existing = [i for i, track in enumerate(tracks) if track is not None]
+    in_order = set()
+    if existing and existing[0] == 0:
+        first = positions[tracks[0].name]
+        rest = [
+            i for i in existing[1:] if positions[tracks[i].name] > first]
+        in_order = {0}
+        in_order.update(rest[i] for i in get_longest_increasing(
+            [positions[tracks[i].name] for i in rest]))
+
+    prev = None
+    for i, (char_action, track) in enumerate(zip(char_actions, tracks)):
+        if track is None:
+            track = nla_tracks.new(prev=prev)
+            track.name = char_action.name
+            add_action_strip(track, char_action)
+            stats['added'] += 1
+        else:
+            if i not in in_order:
+                track = copy_track(nla_tracks, track, prev)
+                stats['moved'] += 1
+            if track.name != char_action.name:
+                track.name = char_action.name
+                stats['updated'] += 1
+            strips = list(track.strips)
+            if not any(strip.action == char_action.action for strip in strips):
+                replace_track_action(track, strips, char_action, actions)
+                stats['updated'] += 1
+        tracks[i] = track
+        prev = track
+    return stats
@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import traceback
+
+import bpy
+
+from .animation import iter_load_animations
+from .character import iter_quick_export
+from .daemon import start_daemon
+from .jobs import run_steps
+from .manifest import (
+    get_animation_files,
+    get_exit_code,
+    print_summary,
+    read_manifest
+)
+from .rootmotion import iter_add_rootmotion
+from .workers import run_worker_tasks, worker_task
+
+
+class StageReport:
+    """Collects the messages of a character, in the Operator.report format"""
+
+    def __init__(self, name):
+        self.name = name
+        self.errors = []
+
+    def __call__(self, type, message):
+        print("[nkt] {}: {}".format(self.name, message))
+        if 'ERROR' in type:
+            self.errors.append(message)
+
+
+def init_character(context, character, report):
+    settings = context.scene.nkt_settings
+    if character['bone_map'].endswith('.json'):
+        settings.bone_map_profile = 'CUSTOM'
+        settings.bone_map_file = character['bone_map']
+    else:
+        settings.bone_map_profile = character['bone_map']
+
+    bpy.ops.object.select_all(action='DESELECT')
+    bpy.ops.import_scene.fbx(
+        filepath=character['file'],
+        ignore_leaf_bones=True,
+        automatic_bone_orientation=True
+    )
+    armature = next(
+        (obj for obj in context.selected_objects if obj.type == 'ARMATURE'),
+        None
+    )
+    if armature is None:
+        raise ValueError(
+            "No armature found in {}.".format(character['file']))
+
+    context.view_layer.objects.active = armature
+    bpy.ops.nkt.character_initialize(target_name=armature.name)
+    nkt_character = context.scene.nkt_settings.get_active_character()
+    nkt_character.name = character['name']
+    nkt_character.hip_bone_name = character['hip_bone_name']
+    nkt_character.root_bone_name = character['root_bone_name']
+
+
+def load_animations(context, character, report):
+    filepaths = get_animation_files(character['animations'])
+    if filepaths:
+        run_steps(iter_load_animations(filepaths, character['load'], report))
+
+
+def add_rootmotion(context, character, report):
+    settings = context.scene.nkt_settings
+    nkt_character = settings.get_active_character()
+    options = character['rootmotion']
+    for name in (
+        'start_frame',
+        'use_translation',
+        'on_ground',
+        'use_rotation',
+        'use_direct_bake'
+    ):
+        setattr(settings.rootmotion, name, options[name])
+
+    names = options['actions']
+    action_names = [
+        char_action.name for char_action in nkt_character.actions
+        if names == 'ALL' or char_action.name in names
+    ]
+    if action_names:
+        run_steps(iter_add_rootmotion(report, action_names))
+
+
+def export_character(context, character, report):
+    nkt_character = context.scene.nkt_settings.get_active_character()
+    export = character['export']
+    nkt_character.export_path = export['path']
+    nkt_character.export_name = export.get('name', character['name'])
+    nkt_character.export_format = export.get('format', 'GLB')
+    nkt_character.export_mode = export.get('mode', 'SINGLE')
+    nkt_character.use_export_workers = export.get('workers', 1) > 1
+    nkt_character.export_worker_count = export.get('workers', 1)
+    nkt_character.merge_export_shards = export.get('merge', True)
+    if export.get('sample_rate'):
+        nkt_character.use_export_preparation = True
+        nkt_character.export_sample_rate = export['sample_rate']
+    os.makedirs(export['path'], exist_ok=True)
+    run_steps(iter_quick_export(report))
+
+
+def process_character(character):
+    """
+    Runs all stages of a manifest character in a fresh scene. Returns the
+    per stage timings in seconds and the error messages.
+    """
+    bpy.ops.wm.read_homefile(use_empty=True)
+    context = bpy.context
+    report = StageReport(character['name'])
+
+    stages = [('init', init_character), ('load', load_animations)]
+    if character['rootmotion'] is not None:
+        stages.append(('rootmotion', add_rootmotion))
+    if character['export'] is not None:
+        stages.append(('export', export_character))
+
+    timings = {}
+    for stage_name, stage in stages:
+        start = time.perf_counter()
+        try:
+            stage(context, character, report)
+        except Exception:
+            report({'ERROR'}, "{} failed:\n{}".format(
+                stage_name, traceback.format_exc()))
+            break
+        finally:
+            timings[stage_name] = time.perf_counter() - start
+
+    return {'timings': timings, 'errors': report.errors}
+
+
+@worker_task('pipeline_character')
+def pipeline_character_task(args):
+    return process_character(args['character'])
+
+
+def run_manifest(filepath, worker_count=None):
+    """
+    Processes every character of the manifest, on separate worker processes
+    when more than one worker is configured. Returns the exit code: 0 when
+    all characters succeeded, 1 otherwise.
+    """
+    manifest = read_manifest(filepath)
+    characters = manifest['characters']
+    worker_count = worker_count or manifest['workers']
+
+    start = time.perf_counter()
+    if worker_count > 1 and len(characters) > 1:
+        results = []
+        for i in range(0, len(characters), worker_count):
+            batch = characters[i:i + worker_count]
+            for (result, log), character in zip(run_worker_tasks(
+                'pipeline_character',
+                [{'character': character} for character in batch]
+            ), batch):
+                if result is None:
+                    print(log)
+                results.append(result)
+    else:
+        results = [process_character(c) for c in characters]
+
+    for character, result in zip(characters, results):
+        print_summary(character['name'], result)
+    print("[nkt] total {:.2f}s".format(time.perf_counter() - start))
+    return get_exit_code(results)
+
+
+def main(argv=None):
+    """
+    Command line entry point, takes the arguments after '--':
+    <manifest> [--workers N] or --serve <workers> <state file>
+    """
+    argv = sys.argv if argv is None else argv
+    args = argv[argv.index('--') + 1:] if '--' in argv else argv[1:]
+    if not args:
+        print("usage: blender -b -P batch.py -- <manifest> [--workers N]")
+        print("       blender -b -P batch.py -- --serve <workers> <state>")
+        return 2
+
+    if args[0] == '--serve':
+        start_daemon(int(args[1]), args[2])
+        return 0
+
+    worker_count = None
+    if '--workers' in args:
+        worker_count = int(args[args.index('--workers') + 1])
+    try:
+        return run_manifest(args[0], worker_count)
+    except (OSError, ValueError) as error:
+        print("[nkt] {}".format(error))
+        return 2
@@ -0,0 +1,165 @@
+import numpy as np
+
+from .dense import get_action_matrix
+from .transforms import (
+    axis_angle_to_quaternion,
+    euler_to_matrix,
+    quaternion_to_matrix
+)
+
+
+class ArmatureRig:
+    """
+    Compact copy of an armature's rest hierarchy, used to evaluate the pose
+    of all bones across all frames of an action without touching the scene.
+
+    Bones are stored in hierarchy order (parents before children) with
+    parent indices and rest matrices, and grouped by depth so that every
+    level of the hierarchy is evaluated with one batched matrix product.
+    """
+
+    def __init__(self, armature):
+        self.matrix_world = np.array(armature.matrix_world)
+
+        bones = []
+        pending = [bone for bone in armature.data.bones if not bone.parent]
+        while pending:
+            bones.extend(pending)
+            pending = [child for bone in pending for child in bone.children]
+
+        self.bone_names = [bone.name for bone in bones]
+        self.bone_indices = {name: i for i, name in enumerate(self.bone_names)}
+        self.parents = np.array([
+            self.bone_indices[bone.parent.name] if bone.parent else -1
+            for bone in bones
+        ], dtype=np.int32)
+        self.rest_matrices = np.array([bone.matrix_local for bone in bones])
+
+        # Rest matrix of every bone relative to its parent's rest matrix
+        self.offsets = self.rest_matrices.copy()
+        has_parent = self.parents >= 0
+        self.offsets[has_parent] = (
+            np.linalg.inv(self.rest_matrices[self.parents[has_parent]]) @
+            self.rest_matrices[has_parent]
+        )
+
+        depths = np.zeros(len(bones), dtype=np.int32)
+        for i, parent in enumerate(self.parents):
+            if parent >= 0:
+                depths[i] = depths[parent] + 1
+        self.levels = [
+            np.flatnonzero(depths == depth)
+            for depth in range(depths.max(initial=-1) + 1)
+        ]
+
+        pose_bones = armature.pose.bones
+        self.rotation_modes = [
+            pose_bones[name].rotation_mode for name in self.bone_names
+        ]
+
+    @staticmethod
+    def is_supported(armature):
+        """
+        Checks that the pose of armature only depends on its fcurves and the
+        default parenting rules, so the rig evaluation matches Blender's.
+        """
+        anim_data = armature.animation_data
+        if anim_data and len(anim_data.drivers) > 0:
+            return False
+
+        for pose_bone in armature.pose.bones:
+            bone = pose_bone.bone
+            if (
+                len(pose_bone.constraints) > 0 or
+                not bone.use_inherit_rotation or
+                bone.inherit_scale != 'FULL' or
+                not bone.use_local_location
+            ):
+                return False
+        return True
+
+    def read_action(self, action, start_frame, end_frame):
+        """
+        Reads the loc/rot/scale fcurves of all bones in action into dense
+        (frames, bones, 3) location, (frames, bones, 4) quaternion and
+        (frames, bones, 3) scale arrays. Missing channels keep their rest
+        values.
+        """
+        count = end_frame - start_frame + 1
+        bone_count = len(self.bone_names)
+        locs = np.zeros((count, bone_count, 3))
+        quats = np.zeros((count, bone_count, 4))
+        quats[..., 0] = 1.0
+        scales = np.ones((count, bone_count, 3))
+        eulers = {}
+        axis_angles = {}
+
+        matrix = get_action_matrix(action, start_frame, end_frame)
+        for column, (name, prop, index) in enumerate(matrix.channels):
+            i = self.bone_indices.get(name)
+            if i is None:
+                continue
+
+            mode = self.rotation_modes[i]
+            if prop == 'location':
+                target = locs[:, i, index]
+            elif prop == 'scale':
+                target = scales[:, i, index]
+            elif prop == 'rotation_quaternion' and mode == 'QUATERNION':
+                target = quats[:, i, index]
+            elif prop == 'rotation_euler' and len(mode) == 3:
+                target = eulers.setdefault(i, np.zeros((count, 3)))[:, index]
+            elif prop == 'rotation_axis_angle' and mode == 'AXIS_ANGLE':
+                default = np.zeros((count, 4))
+                default[:, 2] = 1.0
+                target = axis_angles.setdefault(i, default)[:, index]
+            else:
+                continue
+            target[:] = matrix.values[:, column]
+
+        rotations = quaternion_to_matrix(quats)
+        for i, values in eulers.items():
+            rotations[:, i] = euler_to_matrix(values, self.rotation_modes[i])
+        for i, values in axis_angles.items():
+            rotations[:, i] = quaternion_to_matrix(
+                axis_angle_to_quaternion(values)
+            )
+
+        return locs, rotations, scales
+
+    def get_basis_matrices(self, locs, rotations, scales):
+        """Builds (frames, bones, 4, 4) basis matrices from channel arrays"""
+        basis = np.zeros(locs.shape[:-1] + (4, 4))
+        basis[..., :3, :3] = rotations * scales[..., np.newaxis, :]
+        basis[..., :3, 3] = locs
+        basis[..., 3, 3] = 1.0
+        return basis
+
+    def get_pose_matrices(self, basis):
+        """
+        Computes the armature space pose matrices of all bones from their
+        (frames, bones, 4, 4) basis matrices, one hierarchy level at a time.
+        """
+        local = self.offsets @ basis
+        pose = np.empty_like(local)
+        for level in self.levels:
+            parents = self.parents[level]
+            if parents[0] < 0:
+                pose[:, level] = local[:, level]
+            else:
+                pose[:, level] = pose[:, parents] @ local[:, level]
+        return pose
+
+    def evaluate_action(self, action, start_frame, end_frame, world=False):
+        """
+        Returns the (frames, bones, 4, 4) armature space (or world space)
+        pose matrices of all bones for every frame in [start_frame,
+        end_frame]. Bone order follows bone_names.
+        """
+        basis = self.get_basis_matrices(
+            *self.read_action(action, start_frame, end_frame)
+        )
+        pose = self.get_pose_matrices(basis)
+        if world:
+            return self.matrix_world @ pose
+        return pose
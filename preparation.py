@@ -0,0 +1,155 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+from .channels import get_channel_index, remove_action
+from .dense import get_action_matrix, write_keyframes
+from .quantize import (
+    SMALLEST_THREE_BYTES,
+    fit_property,
+    get_grid_bytes,
+    get_sample_frames,
+    is_quaternion_property
+)
+
+
+def prepare_action(action, frame_step, options):
+    """
+    Resamples the channels of action every frame_step frames and quantizes
+    them: quaternions to smallest-three 48 bits, locations and scales to
+    multiples of options['location_precision']. A property whose result is
+    further than options['location_error'] (distance) or
+    options['rotation_error'] (angle) from the original on any frame is kept
+    on every frame instead, or unchanged if that does not fit either.
+
+    Properties with fewer keys than samples are left as they are. Returns
+    the key counts, the float bytes the keys take in a glTF export and the
+    quantized size of the values, each as (before, after), and the number
+    of properties kept over the error limit.
+    """
+    index = get_channel_index(action)
+    matrix = get_action_matrix(action)
+    frames = matrix.frames.astype(np.float64)
+    samples = get_sample_frames(
+        matrix.start_frame, matrix.end_frame, frame_step)
+    precision = options['location_precision']
+
+    properties = {}
+    for column, (bone_name, prop, _) in enumerate(matrix.channels):
+        properties.setdefault((bone_name, prop), []).append(column)
+
+    stats = {'keys': [0, 0], 'bytes': [0, 0], 'quantized': [0, 0]}
+    unchanged = 0
+    for (bone_name, prop), columns in properties.items():
+        values = matrix.values[:, columns].astype(np.float64)
+        if prop.startswith('rotation'):
+            max_error = options['rotation_error']
+        else:
+            max_error = options['location_error']
+
+        fcurves = [index.get(*matrix.channels[column]) for column in columns]
+        key_count = max(len(fcurve.keyframe_points) for fcurve in fcurves)
+        if is_quaternion_property(prop, values):
+            key_bytes = SMALLEST_THREE_BYTES
+        elif prop in ('location', 'scale'):
+            key_bytes = get_grid_bytes(values, precision)
+        else:
+            key_bytes = 4 * len(columns)
+
+        # Sparse properties (pruned or reduced) are not densified again.
+        candidates = [
+            keys for keys in (samples, frames) if len(keys) <= key_count]
+        keys, keyed = fit_property(
+            frames, values, candidates, prop, precision, max_error)
+
+        float_bytes = 4 * (1 + len(columns))
+        stats['keys'][0] += key_count * len(columns)
+        stats['bytes'][0] += key_count * float_bytes
+        stats['quantized'][0] += key_count * 4 * len(columns)
+        if keys is None:
+            unchanged += len(candidates) > 0
+            stats['keys'][1] += key_count * len(columns)
+            stats['bytes'][1] += key_count * float_bytes
+            stats['quantized'][1] += key_count * 4 * len(columns)
+            continue
+
+        for fcurve, column_values in zip(fcurves, keyed.T):
+            write_keyframes(fcurve, keys, column_values)
+        stats['keys'][1] += len(keys) * len(columns)
+        stats['bytes'][1] += len(keys) * float_bytes
+        stats['quantized'][1] += len(keys) * key_bytes
+
+    stats = {name: tuple(counts) for name, counts in stats.items()}
+    stats['unchanged'] = unchanged
+    return stats
+
+
+def format_prepare_stats(name, stats):
+    return (
+        "{}: keys {} -> {}, export {:.1f} -> {:.1f} KB, quantized "
+        "{:.1f} -> {:.1f} KB{}"
+    ).format(
+        name,
+        *stats['keys'],
+        *(size / 1024 for size in stats['bytes']),
+        *(size / 1024 for size in stats['quantized']),
+        ", {} channel(s) over the error limit kept".format(
+            stats['unchanged']) if stats['unchanged'] else ""
+    )
+
+
+def get_prepare_options(character):
+    return {
+        'location_precision': character.export_location_precision,
+        'location_error': character.export_location_error,
+        'rotation_error': character.export_rotation_error
+    }
+
+
+@contextmanager
+def prepared_export_actions(character, frame_rate, report):
+    """
+    Context swapping the actions of character for resampled and quantized
+    copies (see prepare_action) with the same names, at the character's
+    export sample rate, also as the armature's active action. On exit the
+    copies are removed and their users, like the NLA strips made for the
+    export, get the original actions back.
+    """
+    frame_step = max(1.0, frame_rate / character.export_sample_rate)
+    options = get_prepare_options(character)
+    anim_data = character.armature.animation_data
+    active_action = anim_data.action if anim_data else None
+    prepared = []
+    try:
+        lines = []
+        totals = [0, 0]
+        for char_action in character.actions:
+            original = char_action.action
+            name = original.name
+            copy = original.copy()
+            prepared.append((char_action, original, copy, name))
+            original.name = name + '.nkt_source'
+            copy.name = name
+            char_action.action = copy
+            if original == active_action:
+                anim_data.action = copy
+
+            stats = prepare_action(copy, frame_step, options)
+            lines.append(format_prepare_stats(name, stats))
+            totals[0] += stats['bytes'][0]
+            totals[1] += stats['bytes'][1]
+
+        report(
+            {'INFO'},
+            "Prepared {} action(s), {:.1f} KB saved:\n{}".format(
+                len(lines), (totals[0] - totals[1]) / 1024, "\n".join(lines))
+        )
+        yield
+    finally:
+        for char_action, original, copy, name in prepared:
+            char_action.action = original
+            copy.user_remap(original)
+            remove_action(copy)
+            original.name = name
+        if anim_data:
+            anim_data.action = active_action
@@ -0,0 +1,252 @@
+import os
+import json
+
+from re import search as regex_search
+from types import MappingProxyType
+
+import bpy
+
+MIXAMO_UE_BONE_MAP = {
+    'Hips': 'pelvis',
+    'Spine': 'spine_01',
+    'Spine1': 'spine_02',
+    'Spine2': 'spine_03',
+    'LeftShoulder': 'clavicle_l',
+    'LeftArm': 'upperarm_l',
+    'LeftForeArm': 'lowerarm_l',
+    'LeftHand': 'hand_l',
+    'RightShoulder': 'clavicle_r',
+    'RightArm': 'upperarm_r',
+    'RightForeArm': 'lowerarm_r',
+    'RightHand': 'hand_r',
+    'Neck1': 'neck_01',
+    'Neck': 'neck_01',
+    'Head': 'head',
+    'LeftUpLeg': 'thigh_l',
+    'LeftLeg': 'calf_l',
+    'LeftFoot': 'foot_l',
+    'RightUpLeg': 'thigh_r',
+    'RightLeg': 'calf_r',
+    'RightFoot': 'foot_r',
+    'LeftHandIndex1': 'index_01_l',
+    'LeftHandIndex2': 'index_02_l',
+    'LeftHandIndex3': 'index_03_l',
+    'LeftHandMiddle1': 'middle_01_l',
+    'LeftHandMiddle2': 'middle_02_l',
+    'LeftHandMiddle3': 'middle_03_l',
+    'LeftHandPinky1': 'pinky_01_l',
+    'LeftHandPinky2': 'pinky_02_l',
+    'LeftHandPinky3': 'pinky_03_l',
+    'LeftHandRing1': 'ring_01_l',
+    'LeftHandRing2': 'ring_02_l',
+    'LeftHandRing3': 'ring_03_l',
+    'LeftHandThumb1': 'thumb_01_l',
+    'LeftHandThumb2': 'thumb_02_l',
+    'LeftHandThumb3': 'thumb_03_l',
+    'RightHandIndex1': 'index_01_r',
+    'RightHandIndex2': 'index_02_r',
+    'RightHandIndex3': 'index_03_r',
+    'RightHandMiddle1': 'middle_01_r',
+    'RightHandMiddle2': 'middle_02_r',
+    'RightHandMiddle3': 'middle_03_r',
+    'RightHandPinky1': 'pinky_01_r',
+    'RightHandPinky2': 'pinky_02_r',
+    'RightHandPinky3': 'pinky_03_r',
+    'RightHandRing1': 'ring_01_r',
+    'RightHandRing2': 'ring_02_r',
+    'RightHandRing3': 'ring_03_r',
+    'RightHandThumb1': 'thumb_01_r',
+    'RightHandThumb2': 'thumb_02_r',
+    'RightHandThumb3': 'thumb_03_r',
+    'LeftToeBase': 'ball_l',
+    'RightToeBase': 'ball_r'
+}
+
+MIXAMO_GODOT_BONE_MAP = {
+    'Hips': 'Hips',
+    'Spine': 'Spine',
+    'Spine1': 'Chest',
+    'Spine2': 'UpperChest',
+    'Neck': 'Neck',
+    'Head': 'Head',
+    'LeftShoulder': 'LeftShoulder',
+    'LeftArm': 'LeftUpperArm',
+    'LeftForeArm': 'LeftLowerArm',
+    'LeftHand': 'LeftHand',
+    'LeftHandThumb1': 'LeftThumbMetacarpal',
+    'LeftHandThumb2': 'LeftThumbProximal',
+    'LeftHandThumb3': 'LeftThumbDistal',
+    'LeftHandIndex1': 'LeftIndexProximal',
+    'LeftHandIndex2': 'LeftIndexIntermediate',
+    'LeftHandIndex3': 'LeftIndexDistal',
+    'LeftHandMiddle1': 'LeftMiddleProximal',
+    'LeftHandMiddle2': 'LeftMiddleIntermediate',
+    'LeftHandMiddle3': 'LeftMiddleDistal',
+    'LeftHandRing1': 'LeftRingProximal',
+    'LeftHandRing2': 'LeftRingIntermediate',
+    'LeftHandRing3': 'LeftRingDistal',
+    'LeftHandPinky1': 'LeftLittleProximal',
+    'LeftHandPinky2': 'LeftLittleIntermediate',
+    'LeftHandPinky3': 'LeftLittleDistal',
+    'RightShoulder': 'RightShoulder',
+    'RightArm': 'RightUpperArm',
+    'RightForeArm': 'RightLowerArm',
+    'RightHand': 'RightHand',
+    'RightHandThumb1': 'RightThumbMetacarpal',
+    'RightHandThumb2': 'RightThumbProximal',
+    'RightHandThumb3': 'RightThumbDistal',
+    'RightHandIndex1': 'RightIndexProximal',
+    'RightHandIndex2': 'RightIndexIntermediate',
+    'RightHandIndex3': 'RightIndexDistal',
+    'RightHandMiddle1': 'RightMiddleProximal',
+    'RightHandMiddle2': 'RightMiddleIntermediate',
+    'RightHandMiddle3': 'RightMiddleDistal',
+    'RightHandRing1': 'RightRingProximal',
+    'RightHandRing2': 'RightRingIntermediate',
+    'RightHandRing3': 'RightRingDistal',
+    'RightHandPinky1': 'RightLittleProximal',
+    'RightHandPinky2': 'RightLittleIntermediate',
+    'RightHandPinky3': 'RightLittleDistal',
+    'LeftUpLeg': 'LeftUpperLeg',
+    'LeftLeg': 'LeftLowerLeg',
+    'LeftFoot': 'LeftFoot',
+    'LeftToeBase': 'LeftToes',
+    'RightUpLeg': 'RightUpperLeg',
+    'RightLeg': 'RightLowerLeg',
+    'RightFoot': 'RightFoot',
+    'RightToeBase': 'RightToes'
+}
+
+DEFAULT_HIP_NAMES = ("hips", "Hips", "pelvis", "Pelvis")
+
+
+class BoneMapProfile:
+    """
+    A bone name mapping compiled into frozen lookup tables. Namespace
+    stripped names are memoized, so that importing the same skeleton again
+    resolves its names without any regex work.
+    """
+
+    def __init__(self, name, bone_map, hip_names=DEFAULT_HIP_NAMES):
+        self.name = name
+        self.bone_map = MappingProxyType(dict(bone_map))
+        self.bone_map_inverse = MappingProxyType(
+            dict([reversed(i) for i in self.bone_map.items()]))
+        self.known_names = (
+            frozenset(self.bone_map) | frozenset(self.bone_map_inverse))
+        self.hip_names = tuple(hip_names)
+        self.stripped_names = {}
+        self.rename_maps = {}
+
+    def remove_namespace(self, full_name):
+        name = self.stripped_names.get(full_name)
+        if name is not None:
+            return name
+
+        name = full_name
+        if full_name not in self.known_names:
+            i = regex_search(r"[:_]", full_name[::-1])
+            if i:
+                name = full_name[-(i.start())::]
+        self.stripped_names[full_name] = name
+        return name
+
+    def get_mapped_bone_name(self, in_name):
+        return self.bone_map.get(in_name, in_name)
+
+    def resolve(self, full_name, remove_namespace_only=False):
+        """Returns the target name of a source bone name"""
+        name = self.remove_namespace(full_name)
+        if remove_namespace_only:
+            return name
+        return self.get_mapped_bone_name(name)
+
+    def get_rename_map(self, names, remove_namespace_only=False):
+        """
+        Returns the old to new name map of the names that change. Maps are
+        reused for skeletons with the same bone names.
+        """
+        key = (tuple(names), remove_namespace_only)
+        rename_map = self.rename_maps.get(key)
+        if rename_map is None:
+            rename_map = {}
+            for old_name in names:
+                new_name = self.resolve(old_name, remove_namespace_only)
+                if new_name != old_name:
+                    rename_map[old_name] = new_name
+            self.rename_maps[key] = rename_map
+        return dict(rename_map)
+
+    def guess_hip_bone_name(self, bones):
+        for hip_name in self.hip_names:
+            if bones.get(hip_name) is not None:
+                return hip_name
+        return ""
+
+    def get_key(self):
+        """Returns a json serializable value identifying the mapping"""
+        return [sorted(self.bone_map.items()), list(self.hip_names)]
+
+
+bone_map_profiles = {
+    'MIXAMO_UE': BoneMapProfile("Mixamo to Unreal", MIXAMO_UE_BONE_MAP),
+    'MIXAMO_GODOT': BoneMapProfile(
+        "Mixamo to Godot Humanoid",
+        MIXAMO_GODOT_BONE_MAP,
+        ("Hips",) + DEFAULT_HIP_NAMES
+    ),
+    'IDENTITY': BoneMapProfile("Identity", {})
+}
+
+# Custom profiles keyed by file path, along with the file modification time.
+custom_profiles = {}
+
+
+def load_bone_map_profile(filepath):
+    """
+    Loads a custom profile from a JSON file of the form {"name": ...,
+    "bone_map": {source: target}, "hip_names": [...]}. Profiles are reloaded
+    only when the file changes.
+    """
+    filepath = os.path.abspath(filepath)
+    mtime = os.path.getmtime(filepath)
+    cached = custom_profiles.get(filepath)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(filepath) as profile_file:
+        data = json.load(profile_file)
+    bone_map = data.get('bone_map') if isinstance(data, dict) else None
+    if not isinstance(bone_map, dict) or not all(
+        isinstance(value, str) for value in bone_map.values()
+    ):
+        raise ValueError(
+            "{} has no valid bone_map object.".format(filepath))
+
+    profile = BoneMapProfile(
+        data.get('name', os.path.basename(filepath)),
+        bone_map,
+        data.get('hip_names', DEFAULT_HIP_NAMES)
+    )
+    custom_profiles[filepath] = (mtime, profile)
+    return profile
+
+
+def get_active_profile(context=None):
+    """
+    Returns the bone map profile chosen in the scene settings. Raises
+    ValueError if a custom profile can not be loaded.
+    """
+    scene = (context or bpy.context).scene
+    settings = getattr(scene, 'nkt_settings', None)
+    if settings is None:
+        return bone_map_profiles['MIXAMO_UE']
+    if settings.bone_map_profile != 'CUSTOM':
+        return bone_map_profiles[settings.bone_map_profile]
+
+    if not settings.bone_map_file:
+        raise ValueError("No custom bone map file is set.")
+    try:
+        return load_bone_map_profile(bpy.path.abspath(settings.bone_map_file))
+    except OSError as error:
+        raise ValueError("Can not read the bone map: {}".format(error))
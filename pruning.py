@@ -0,0 +1,146 @@
+import numpy as np
+
+from bpy.types import Operator
+from bpy.props import BoolProperty, EnumProperty, FloatProperty
+
+from .channels import get_channel_index
+from .dense import get_action_matrix, write_keyframes
+
+# Values of the transform channels in rest pose, per array index.
+REST_VALUES = {
+    'location': (0.0, 0.0, 0.0),
+    'rotation_quaternion': (1.0, 0.0, 0.0, 0.0),
+    'rotation_euler': (0.0, 0.0, 0.0),
+    'rotation_axis_angle': (0.0, 0.0, 1.0, 0.0),
+    'scale': (1.0, 1.0, 1.0)
+}
+
+
+def count_keyframes(action):
+    return sum(len(fcurve.keyframe_points) for fcurve in action.fcurves)
+
+
+def prune_action(action, tolerance=1e-4, remove_rest=True):
+    """
+    Removes the redundant channels of action: curves without keyframes and,
+    with remove_rest, transform properties whose channels all stay at their
+    rest value. Other channels that stay within tolerance of a constant are
+    reduced to a keyframe on the first and last frame. Returns the fcurve
+    and keyframe counts as {'fcurves': (before, after), 'keyframes': ...}.
+    """
+    fcurve_count = len(action.fcurves)
+    keyframe_count = count_keyframes(action)
+
+    index = get_channel_index(action)
+    for bone_name, channels in list(index.bones.items()):
+        for (prop, array_index), fcurve in list(channels.items()):
+            if len(fcurve.keyframe_points) == 0:
+                index.remove_curve(bone_name, prop, array_index)
+
+    matrix = get_action_matrix(action)
+    values = matrix.values
+    constant = values.max(axis=0) - values.min(axis=0) <= tolerance
+
+    rest = np.full(len(matrix.channels), np.nan, dtype=np.float32)
+    for column, (bone_name, prop, array_index) in enumerate(matrix.channels):
+        rest_value = REST_VALUES.get(prop)
+        if rest_value and array_index < len(rest_value):
+            rest[column] = rest_value[array_index]
+    with np.errstate(invalid='ignore'):
+        at_rest = constant & (np.abs(values[0] - rest) <= tolerance)
+
+    # Only whole properties are removed, a partly keyed vector would mix the
+    # remaining channels with whatever pose the bone had before.
+    removed = set()
+    if remove_rest:
+        properties = {}
+        for column, (bone_name, prop, _) in enumerate(matrix.channels):
+            properties.setdefault((bone_name, prop), []).append(column)
+        for columns in properties.values():
+            if at_rest[columns].all():
+                removed.update(columns)
+        # An action without channels loses its frame range.
+        if len(removed) == len(matrix.channels):
+            removed.clear()
+
+    frames = [matrix.start_frame, matrix.end_frame]
+    if matrix.start_frame == matrix.end_frame:
+        frames = frames[:1]
+    for column, channel in enumerate(matrix.channels):
+        if column in removed:
+            index.remove_curve(*channel)
+        elif constant[column]:
+            fcurve = index.get(*channel)
+            if len(fcurve.keyframe_points) > len(frames):
+                write_keyframes(
+                    fcurve, frames, np.full(len(frames), values[0, column]))
+
+    return {
+        'fcurves': (fcurve_count, len(action.fcurves)),
+        'keyframes': (keyframe_count, count_keyframes(action))
+    }
+
+
+def format_prune_stats(name, stats):
+    return "{}: fcurves {} -> {}, keyframes {} -> {}".format(
+        name, *stats['fcurves'], *stats['keyframes'])
+
+
+class NKT_OT_prune_character_actions(Operator):
+    bl_idname = 'nkt.character_prune_actions'
+    bl_label = "Prune Character Actions"
+    bl_description = (
+        "Remove the constant and rest pose channels of character actions."
+    )
+    bl_options = {'REGISTER', 'UNDO'}
+
+    target: EnumProperty(
+        items=[
+            ('ACTIVE', "Active", "Prune the active character action.", 0),
+            ('SELECTED', "Selected",
+             "Prune the selected character actions.", 1),
+            ('ALL', "All", "Prune all character actions.", 2)
+        ],
+        name="Target",
+        description="The character actions to prune."
+    )
+    tolerance: FloatProperty(
+        name="Tolerance",
+        description=(
+            "The maximum change of a channel over the action for it to " +
+            "count as constant."
+        ),
+        default=1e-4,
+        min=0.0,
+        precision=6
+    )
+    remove_rest: BoolProperty(
+        name="Remove Rest Channels",
+        description=(
+            "Remove the transform channels that stay at their rest pose " +
+            "value, instead of reducing them to a single value."
+        ),
+        default=True
+    )
+
+    def execute(self, context):
+        settings = context.scene.nkt_settings
+        character = settings.get_active_character()
+        action_names = character.get_target_action_names(self.target)
+        if not action_names:
+            self.report({'ERROR'}, "No character actions to prune.")
+            return {'CANCELLED'}
+
+        lines = []
+        for name in action_names:
+            char_action = character.actions[character.get_action_index(name)]
+            stats = prune_action(
+                char_action.action, self.tolerance, self.remove_rest)
+            lines.append(format_prune_stats(name, stats))
+
+        self.report({'INFO'}, "Pruned {} action(s):\n{}".format(
+            len(lines), "\n".join(lines)))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
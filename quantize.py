@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+
+from .transforms import (
+    get_angular_error,
+    get_component_error,
+    get_positional_error
+)
+
+# Smallest-three quaternions: 2 bits for the index of the dropped largest
+# component and 15 bits for each of the other three, 48 bits in total.
+COMPONENT_BITS = 15
+COMPONENT_MAX = (1 << COMPONENT_BITS) - 1
+COMPONENT_RANGE = 1.0 / math.sqrt(2.0)
+SMALLEST_THREE_BYTES = 6
+
+
+def encode_smallest_three(quats):
+    """Packs (n, 4) quaternions into (n,) uint64 values of 48 bits"""
+    quats = quats / np.linalg.norm(quats, axis=1, keepdims=True)
+    largest = np.argmax(np.abs(quats), axis=1)
+    rows = np.arange(len(quats))
+    quats = quats * np.where(quats[rows, largest] < 0.0, -1.0, 1.0)[:, None]
+
+    keep = np.ones(quats.shape, dtype=bool)
+    keep[rows, largest] = False
+    small = quats[keep].reshape(-1, 3)
+    codes = np.rint(
+        (small / COMPONENT_RANGE + 1.0) * 0.5 * COMPONENT_MAX
+    ).clip(0, COMPONENT_MAX).astype(np.uint64)
+
+    packed = largest.astype(np.uint64) << np.uint64(3 * COMPONENT_BITS)
+    for i in range(3):
+        shift = np.uint64((2 - i) * COMPONENT_BITS)
+        packed |= codes[:, i] << shift
+    return packed
+
+
+def decode_smallest_three(packed):
+    """Unpacks (n,) uint64 smallest-three values into (n, 4) quaternions"""
+    packed = packed.astype(np.uint64)
+    mask = np.uint64(COMPONENT_MAX)
+    codes = np.stack([
+        (packed >> np.uint64((2 - i) * COMPONENT_BITS)) & mask
+        for i in range(3)
+    ], axis=1).astype(np.float64)
+    small = (codes / COMPONENT_MAX * 2.0 - 1.0) * COMPONENT_RANGE
+    largest = (packed >> np.uint64(3 * COMPONENT_BITS)).astype(np.intp)
+
+    rows = np.arange(len(packed))
+    quats = np.empty((len(packed), 4))
+    keep = np.ones(quats.shape, dtype=bool)
+    keep[rows, largest] = False
+    quats[keep] = small.ravel()
+    quats[rows, largest] = np.sqrt(
+        np.clip(1.0 - np.einsum('ij,ij->i', small, small), 0.0, 1.0))
+    return quats
+
+
+def match_signs(quats, reference):
+    """
+    Flips the (n, 4) quats that point away from their reference rows. The
+    smallest-three encoding keeps the largest component positive, which
+    flips the sign of a decoded track wherever that component changes sign.
+    """
+    dots = np.einsum('ij,ij->i', quats, reference)
+    return quats * np.where(dots < 0.0, -1.0, 1.0)[:, np.newaxis]
+
+
+def quantize_grid(values, precision):
+    """Snaps values to multiples of precision"""
+    if precision <= 0.0:
+        return values
+    return np.rint(values / precision) * precision
+
+
+def get_grid_bytes(values, precision):
+    """Returns the bytes per key of values stored as precision steps"""
+    if precision <= 0.0:
+        return 4 * values.shape[1]
+    extent = values.max(axis=0) - values.min(axis=0)
+    bits = np.ceil(np.log2(extent / precision + 1.0)).sum()
+    return int(math.ceil(bits / 8.0))
+
+
+def interpolate(frames, keys, values):
+    """Linearly interpolates the (keys, n) values at frames, per column"""
+    return np.stack([
+        np.interp(frames, keys, column) for column in values.T
+    ], axis=1)
+
+
+def get_sample_frames(start_frame, end_frame, frame_step):
+    """Returns frames every frame_step from start_frame, with end_frame"""
+    samples = np.arange(start_frame, end_frame, frame_step, dtype=np.float64)
+    return np.append(samples, float(end_frame))
+
+
+def is_quaternion_property(prop, values):
+    return prop == 'rotation_quaternion' and values.shape[1] == 4
+
+
+def resample_property(frames, values, keys, prop, precision):
+    """
+    Samples the (frames, n) values of a property on keys and quantizes them
+    as they are exported: quaternions to smallest-three 48 bits, locations
+    and scales to multiples of precision. Returns the keyed values and the
+    error of their linear interpolation on every frame, as an angle for
+    quaternions, a distance for locations and the largest component
+    difference otherwise.
+    """
+    keyed = interpolate(keys, frames, values)
+    if is_quaternion_property(prop, values):
+        keyed = match_signs(
+            decode_smallest_three(encode_smallest_three(keyed)), keyed)
+        get_error = get_angular_error
+    elif prop in ('location', 'scale'):
+        keyed = quantize_grid(keyed, precision)
+        get_error = (
+            get_positional_error if prop == 'location' else
+            get_component_error
+        )
+    else:
+        get_error = get_component_error
+    return keyed, get_error(interpolate(frames, keys, keyed), values)
+
+
+def fit_property(frames, values, candidates, prop, precision, max_error):
+    """
+    Returns the first of the candidate key frames whose resampled values
+    (see resample_property) stay within max_error on every frame, with
+    those values, or (None, None) if none does.
+    """
+    for keys in candidates:
+        keyed, error = resample_property(frames, values, keys, prop, precision)
+        if error.max() <= max_error:
+            return keys, keyed
+    return None, None
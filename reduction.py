@@ -0,0 +1,184 @@
+import math
+
+import numpy as np
+
+from bpy.types import Operator
+from bpy.props import EnumProperty, FloatProperty
+
+from .channels import get_channel_index
+from .dense import get_action_matrix, write_keyframes
+from .transforms import (
+    get_angular_error,
+    get_component_error,
+    get_positional_error
+)
+
+# Approximate size of a keyframe (BezTriple) in Blender's memory.
+KEYFRAME_SIZE = 72
+
+
+def simplify_keys(values, get_error, max_error):
+    """
+    Returns a mask of the rows of values (one per frame) to keep as linear
+    keyframes so that the interpolation between them stays within max_error
+    of every row. Like Douglas-Peucker, every segment between kept keys
+    gets its worst frame added until none is over the limit, but all
+    segments are refined at once with array operations.
+    """
+    count = len(values)
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    frames = np.arange(count)
+    while True:
+        keys = np.flatnonzero(keep)
+        if len(keys) < 2:
+            return keep
+        segments = np.clip(
+            np.searchsorted(keys, frames, side='right') - 1, 0, len(keys) - 2)
+        left = keys[segments]
+        right = keys[segments + 1]
+        factor = ((frames - left) / (right - left))[:, np.newaxis]
+        approx = values[left] + (values[right] - values[left]) * factor
+
+        error = get_error(approx, values)
+        error[keep] = 0.0
+        worst = np.maximum.reduceat(error, keys[:-1])
+        added = (error > max_error) & (error == worst[segments])
+        if not added.any():
+            return keep
+        keep |= added
+
+
+def reduce_action(action, location_error=1e-3, rotation_error=1e-3):
+    """
+    Removes the keyframes of action that can be interpolated linearly from
+    their neighbours. Vector properties keep their keys on shared frames:
+    locations stay within location_error of the original position, full
+    quaternions within rotation_error (radians) of the original rotation
+    and other channels within the matching limit per component. Curves are
+    read on every frame and written back as linear keyframes, so this is
+    meant for baked actions.
+
+    Returns the keyframe count and the estimated export and memory size in
+    bytes, each as (before, after).
+    """
+    index = get_channel_index(action)
+    matrix = get_action_matrix(action)
+    frames = matrix.frames
+
+    properties = {}
+    for column, (bone_name, prop, array_index) in enumerate(matrix.channels):
+        properties.setdefault((bone_name, prop), []).append(column)
+
+    stats = {'keyframes': [0, 0], 'export': [0, 0]}
+    for (bone_name, prop), columns in properties.items():
+        values = matrix.values[:, columns].astype(np.float64)
+        if prop == 'location':
+            keep = simplify_keys(
+                values, get_positional_error, location_error)
+        elif prop == 'rotation_quaternion' and len(columns) == 4:
+            keep = simplify_keys(values, get_angular_error, rotation_error)
+        elif prop.startswith('rotation'):
+            keep = simplify_keys(values, get_component_error, rotation_error)
+        else:
+            keep = simplify_keys(values, get_component_error, location_error)
+
+        fcurves = [index.get(*matrix.channels[column]) for column in columns]
+        key_counts = [len(fcurve.keyframe_points) for fcurve in fcurves]
+        key_count = sum(key_counts)
+        frame_count = max(key_counts)
+        kept = int(keep.sum())
+        if kept < frame_count:
+            for fcurve, column_values in zip(fcurves, values.T):
+                write_keyframes(fcurve, frames[keep], column_values[keep])
+            key_count, frame_count = kept * len(columns), kept
+
+        # A glTF sampler stores a float time and the vector per keyframe.
+        key_size = 4 * (1 + len(columns))
+        stats['keyframes'][0] += sum(key_counts)
+        stats['keyframes'][1] += key_count
+        stats['export'][0] += max(key_counts) * key_size
+        stats['export'][1] += frame_count * key_size
+
+    for name in ('keyframes', 'export'):
+        stats[name] = tuple(stats[name])
+    stats['memory'] = tuple(
+        count * KEYFRAME_SIZE for count in stats['keyframes'])
+    return stats
+
+
+def format_reduce_stats(name, stats):
+    return (
+        "{}: keyframes {} -> {}, export {:.1f} -> {:.1f} KB, "
+        "memory {:.1f} -> {:.1f} KB"
+    ).format(
+        name,
+        *stats['keyframes'],
+        *(size / 1024 for size in stats['export']),
+        *(size / 1024 for size in stats['memory'])
+    )
+
+
+class NKT_OT_reduce_character_actions(Operator):
+    bl_idname = 'nkt.character_reduce_actions'
+    bl_label = "Reduce Keyframes"
+    bl_description = (
+        "Remove the keyframes of baked character actions that can be " +
+        "interpolated within an error limit."
+    )
+    bl_options = {'REGISTER', 'UNDO'}
+
+    target: EnumProperty(
+        items=[
+            ('ACTIVE', "Active", "Reduce the active character action.", 0),
+            ('SELECTED', "Selected",
+             "Reduce the selected character actions.", 1),
+            ('ALL', "All", "Reduce all character actions.", 2)
+        ],
+        name="Target",
+        description="The character actions to reduce the keyframes of."
+    )
+    location_error: FloatProperty(
+        name="Location Error",
+        description=(
+            "The maximum distance between the reduced and the original " +
+            "bone locations."
+        ),
+        default=1e-3,
+        min=0.0,
+        precision=5,
+        subtype='DISTANCE'
+    )
+    rotation_error: FloatProperty(
+        name="Rotation Error",
+        description=(
+            "The maximum angle between the reduced and the original bone " +
+            "rotations."
+        ),
+        default=math.radians(0.1),
+        min=0.0,
+        precision=3,
+        subtype='ANGLE'
+    )
+
+    def execute(self, context):
+        settings = context.scene.nkt_settings
+        character = settings.get_active_character()
+        action_names = character.get_target_action_names(self.target)
+        if not action_names:
+            self.report({'ERROR'}, "No character actions to reduce.")
+            return {'CANCELLED'}
+
+        lines = []
+        for name in action_names:
+            char_action = character.actions[character.get_action_index(name)]
+            stats = reduce_action(
+                char_action.action, self.location_error, self.rotation_error)
+            lines.append(format_reduce_stats(name, stats))
+
+        self.report({'INFO'}, "Reduced {} action(s):\n{}".format(
+            len(lines), "\n".join(lines)))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
@@ -1,13 +1,140 @@
+import os
+import time
+import tempfile
+
+from contextlib import nullcontext
+
 import bpy
+import numpy as np
 
 from bpy.types import PropertyGroup, Operator
-from bpy.props import BoolProperty, BoolVectorProperty, IntProperty
+from bpy.props import (
+    BoolProperty,
+    BoolVectorProperty,
+    EnumProperty,
+    IntProperty
+)
 
 from .baker import (
-    apply_baker_to_bone,
-    extract_constrained_from_bone,
-    extract_loc_rot_from_bone
+    add_baker,
+    add_loc_rot_constraints,
+    add_rootmotion_constraints,
+    apply_bakers_to_bones,
+    bake_objects,
+    delete_bakers,
+    get_bone_basis_matrices,
+    get_constrained_root_matrices,
+    get_world_loc_rot_matrices,
+    isolated_evaluation,
+    iter_sample_matrices,
+    write_bone_transforms
 )
+from .channels import remove_action
+from .jobs import run_steps, scale_progress, submit_job
+from .pose import ArmatureRig
+from .workers import iter_worker_tasks, split_jobs, worker_task
+
+
+def can_bake_rootmotion_direct(armature, hip_bone_name, root_bone_name):
+    """
+    Checks whether bake_rootmotion_direct gives the same result as the
+    constraint based bake for the given bones.
+    """
+    pose_bones = armature.pose.bones
+    return all(
+        pose_bones[name].rotation_mode == 'QUATERNION'
+        for name in (hip_bone_name, root_bone_name)
+    )
+
+
+def iter_bake_rootmotion_direct(
+    armature,
+    action,
+    hip_bone_name,
+    root_bone_name,
+    use_x,
+    use_y,
+    use_z,
+    on_ground,
+    use_rot,
+    start_frame,
+    end_frame,
+    root_baker=None
+):
+    """
+    Bakes the rootmotion by evaluating the hip bone matrices (analytically
+    when the rig allows it) and writing the root and hip fcurves directly,
+    without any helper objects, constraints or nla.bake passes. All needed
+    transforms are sampled in a single sweep over the frames.
+
+    A user provided root_baker (to allow custom constraints on root) is
+    sampled along with the bones and copied into the root bone. Generator
+    yielding the progress per chunk of sampled frames.
+    """
+    bones = armature.data.bones
+    sampled_names = {hip_bone_name}
+    for name in (hip_bone_name, root_bone_name):
+        parent = bones[name].parent
+        if parent and parent.name != root_bone_name:
+            sampled_names.add(parent.name)
+
+    if root_baker is None and ArmatureRig.is_supported(armature):
+        rig = ArmatureRig(armature)
+        pose = rig.evaluate_action(action, start_frame, end_frame)
+        pose_matrices = {
+            name: pose[:, rig.bone_indices[name]] for name in sampled_names
+        }
+        object_matrices = {}
+    else:
+        pose_matrices, object_matrices = yield from scale_progress(
+            iter_sample_matrices(
+                armature=armature,
+                action=action,
+                bone_names=sampled_names,
+                objects=[root_baker] if root_baker else [],
+                start_frame=start_frame,
+                end_frame=end_frame
+            ),
+            0.0,
+            0.9
+        )
+    hip_pose = pose_matrices[hip_bone_name]
+
+    world_inverse = np.linalg.inv(np.array(armature.matrix_world))
+    if root_baker:
+        root_pose = world_inverse @ object_matrices[root_baker.name]
+    else:
+        root_pose = world_inverse @ get_constrained_root_matrices(
+            armature=armature,
+            bone_name=hip_bone_name,
+            pose_matrices=hip_pose,
+            use_x=use_x,
+            use_y=use_y,
+            use_z=use_z,
+            on_ground=on_ground,
+            use_rot=use_rot
+        )
+    pose_matrices[root_bone_name] = root_pose
+    hip_target = world_inverse @ get_world_loc_rot_matrices(armature, hip_pose)
+
+    for name, target in (
+        (root_bone_name, root_pose),
+        (hip_bone_name, hip_target)
+    ):
+        parent = bones[name].parent
+        basis = get_bone_basis_matrices(
+            armature=armature,
+            bone_name=name,
+            pose_matrices=target,
+            parent_pose=pose_matrices[parent.name] if parent else None
+        )
+        write_bone_transforms(action, name, basis, start_frame)
+    yield 1.0
+
+
+def bake_rootmotion_direct(**kwargs):
+    """Bakes the rootmotion right away, see iter_bake_rootmotion_direct"""
+    run_steps(iter_bake_rootmotion_direct(**kwargs))
 
 
 def bake_rootmotion(
@@ -21,22 +148,24 @@ def bake_rootmotion(
     on_ground,
     use_rot,
     start_frame,
-    end_frame=None
+    end_frame=None,
+    use_direct=False
 ):
     # Set the scene for curr actions
     armature.animation_data.action = action
     if not end_frame:
         end_frame = int(action.frame_range[1])
 
-    # Check if root_baker exists (To allow custom constraints on root)
-    root_baker = bpy.data.objects.get('NKT_root_baker')
-
-    if not root_baker:
-        # Create helper to bake the root motion
-        root_baker = extract_constrained_from_bone(
+    if use_direct and can_bake_rootmotion_direct(
+        armature, hip_bone_name, root_bone_name
+    ):
+        # Check if root_baker exists (To allow custom constraints on root)
+        root_baker = bpy.data.objects.get('NKT_root_baker')
+        bake_rootmotion_direct(
             armature=armature,
             action=action,
-            bone_name=hip_bone_name,
+            hip_bone_name=hip_bone_name,
+            root_bone_name=root_bone_name,
             use_x=use_x,
             use_y=use_y,
             use_z=use_z,
@@ -44,51 +173,262 @@ def bake_rootmotion(
             use_rot=use_rot,
             start_frame=start_frame,
             end_frame=end_frame,
-            baker_name='NKT_root_baker'
+            root_baker=root_baker
         )
+        if root_baker:
+            delete_bakers([root_baker])
+        return
 
-    # Create helper to bake hipmotion in Worldspace
-    hips_baker = extract_loc_rot_from_bone(
+    bakers = RootmotionBakers(
         armature=armature,
-        action=action,
-        bone_name=hip_bone_name,
-        start_frame=start_frame,
-        end_frame=end_frame,
-        baker_name='NKT_{}_baker'.format(hip_bone_name)
+        hip_bone_name=hip_bone_name,
+        root_bone_name=root_bone_name,
+        use_x=use_x,
+        use_y=use_y,
+        use_z=use_z,
+        on_ground=on_ground,
+        use_rot=use_rot
     )
+    try:
+        bakers.bake(action, start_frame, end_frame)
+    finally:
+        bakers.remove()
 
-    # Apply the root bone 1st.
-    apply_baker_to_bone(
-        baker=root_baker,
-        armature=armature,
-        action=action,
-        target_bone_name=root_bone_name,
-        start_frame=start_frame,
-        end_frame=end_frame
-    )
 
-    # Since the root bone motion is applied 1st, the baker will ensure that hips
-    # have proper anim curves considering the root as parent.
-    apply_baker_to_bone(
-        baker=hips_baker,
-        armature=armature,
-        action=action,
-        target_bone_name=hip_bone_name,
-        start_frame=start_frame,
-        end_frame=end_frame
-    )
+class RootmotionBakers:
+    """
+    The helper objects of the constraint based rootmotion bake. They are
+    created once and rebaked for every action, so that a batch does not
+    create and delete objects and constraints per clip.
+    """
 
-    # Delete helpers
-    bpy.ops.object.mode_set(mode='OBJECT')
-    bpy.ops.object.select_all(action='DESELECT')
+    def __init__(
+        self,
+        armature,
+        hip_bone_name,
+        root_bone_name,
+        use_x,
+        use_y,
+        use_z,
+        on_ground,
+        use_rot
+    ):
+        self.armature = armature
+        self.hip_bone_name = hip_bone_name
+        self.root_bone_name = root_bone_name
+        # The helpers created here, rebaked for every action.
+        self.bakers = []
 
-    hips_baker.select_set(True)
-    root_baker.select_set(True)
+        # Check if root_baker exists (To allow custom constraints on root)
+        self.root_baker = bpy.data.objects.get('NKT_root_baker')
+        if not self.root_baker:
+            self.root_baker = add_baker('NKT_root_baker')
+            add_rootmotion_constraints(
+                baker=self.root_baker,
+                armature=armature,
+                bone_name=hip_bone_name,
+                use_x=use_x,
+                use_y=use_y,
+                use_z=use_z,
+                on_ground=on_ground,
+                use_rot=use_rot
+            )
+            self.bakers.append(self.root_baker)
 
-    bpy.data.actions.remove(hips_baker.animation_data.action)
-    bpy.data.actions.remove(root_baker.animation_data.action)
+        # Helper to bake hipmotion in Worldspace
+        self.hips_baker = add_baker('NKT_{}_baker'.format(hip_bone_name))
+        add_loc_rot_constraints(self.hips_baker, armature, hip_bone_name)
+        self.bakers.append(self.hips_baker)
 
-    bpy.ops.object.delete(use_global=False)
+        self.locations = [baker.location.copy() for baker in self.bakers]
+
+    def bake(self, action, start_frame, end_frame):
+        """Bakes the rootmotion of action into its root and hip bones"""
+        self.armature.animation_data.action = action
+
+        # Reset the helpers to their unbaked state.
+        for baker, location in zip(self.bakers, self.locations):
+            if baker.animation_data and baker.animation_data.action:
+                remove_action(baker.animation_data.action)
+            baker.location = location
+            for constraint in baker.constraints:
+                constraint.mute = False
+
+        bake_objects(
+            self.bakers, start_frame, end_frame, clear_constraints=False)
+
+        # The baked keys already hold the constrained transforms, offset
+        # constraints would apply twice.
+        for baker in self.bakers:
+            for constraint in baker.constraints:
+                constraint.mute = True
+
+        # Both bones are keyed in one pass. The hips are keyed from their
+        # visual transform relative to the constrained root, so they get
+        # proper anim curves considering the root as parent.
+        apply_bakers_to_bones(
+            armature=self.armature,
+            action=action,
+            bone_bakers=[
+                (self.root_bone_name, self.root_baker),
+                (self.hip_bone_name, self.hips_baker)
+            ],
+            start_frame=start_frame,
+            end_frame=end_frame
+        )
+
+    def remove(self):
+        """Deletes the helpers and their actions"""
+        delete_bakers([self.hips_baker, self.root_baker])
+
+
+def get_rootmotion_options(rootmotion):
+    """Returns the bake arguments of the rootmotion settings as a dict"""
+    return {
+        'use_x': rootmotion.use_translation[0],
+        'use_y': rootmotion.use_translation[1],
+        'use_z': rootmotion.use_translation[2],
+        'on_ground': rootmotion.on_ground,
+        'use_rot': rootmotion.use_rotation,
+        'start_frame': rootmotion.start_frame,
+        'use_direct': rootmotion.use_direct_bake
+    }
+
+
+def iter_bake_rootmotion_actions(character, action_names, options):
+    """
+    Generator baking the rootmotion of the named character actions, one
+    action (or, for the direct bake, a chunk of sampled frames) per step.
+    The helpers of the constraint based bake are shared by all actions.
+    """
+    armature = character.armature
+    bone_names = {
+        'hip_bone_name': character.hip_bone_name,
+        'root_bone_name': character.root_bone_name
+    }
+    use_direct = options['use_direct'] and can_bake_rootmotion_direct(
+        armature, **bone_names)
+    bake_options = {
+        name: options[name]
+        for name in ('use_x', 'use_y', 'use_z', 'on_ground', 'use_rot')
+    }
+
+    # Check if root_baker exists (To allow custom constraints on root)
+    root_baker = bpy.data.objects.get('NKT_root_baker')
+    bakers = None
+    try:
+        for i, name in enumerate(action_names):
+            char_action = character.actions[character.get_action_index(name)]
+            action = char_action.action
+            start_frame = options['start_frame']
+            end_frame = int(action.frame_range[1])
+
+            if use_direct:
+                armature.animation_data.action = action
+                yield from scale_progress(
+                    iter_bake_rootmotion_direct(
+                        armature=armature,
+                        action=action,
+                        start_frame=start_frame,
+                        end_frame=end_frame,
+                        root_baker=root_baker,
+                        **bone_names,
+                        **bake_options
+                    ),
+                    i / len(action_names),
+                    (i + 1) / len(action_names)
+                )
+            else:
+                if bakers is None:
+                    bakers = RootmotionBakers(
+                        armature=armature, **bone_names, **bake_options)
+                bakers.bake(action, start_frame, end_frame)
+
+            char_action.rootmotion_type = 'ROOT_BONE'
+            yield (i + 1) / len(action_names)
+    finally:
+        if bakers:
+            bakers.remove()
+        elif root_baker:
+            delete_bakers([root_baker])
+
+
+@worker_task('bake_rootmotion')
+def bake_rootmotion_task(args):
+    """
+    Worker task that bakes the rootmotion of args['actions'] on the active
+    character of the opened file and writes the actions into the
+    args['library'] .blend file.
+    """
+    character = bpy.context.scene.nkt_settings.get_active_character()
+    run_steps(iter_bake_rootmotion_actions(
+        character, args['actions'], args['options']))
+
+    actions = {
+        character.actions[character.get_action_index(name)].action
+        for name in args['actions']
+    }
+    bpy.data.libraries.write(args['library'], actions, fake_user=True)
+    return {'actions': args['actions']}
+
+
+def iter_bake_rootmotion_parallel(
+    character,
+    action_names,
+    options,
+    worker_count
+):
+    """
+    Generator baking the rootmotion of the named actions of the active
+    character on background workers, replacing the actions with the baked
+    ones. Yields progress while the workers run and returns a list of error
+    messages.
+    """
+    with tempfile.TemporaryDirectory(prefix='nkt_rootmotion_') as temp_dir:
+        blend_file = os.path.join(temp_dir, 'scene.blend')
+        bpy.ops.wm.save_as_mainfile(filepath=blend_file, copy=True)
+
+        args_list = [
+            {
+                'actions': chunk,
+                'library': os.path.join(
+                    temp_dir, 'actions_{}.blend'.format(i)),
+                'options': options
+            }
+            for i, chunk in enumerate(split_jobs(action_names, worker_count))
+        ]
+
+        errors = []
+        results = yield from iter_worker_tasks(
+            'bake_rootmotion', args_list, blend_file)
+        for args, (result, log) in zip(args_list, results):
+            if result is None:
+                errors.append(
+                    "Rootmotion worker failed for {}:\n{}"
+                    .format(", ".join(args['actions']), log)
+                )
+                continue
+
+            with bpy.data.libraries.load(args['library']) as (
+                data_from, data_to
+            ):
+                data_to.actions = result['actions']
+            for name, baked in zip(result['actions'], data_to.actions):
+                char_action = character.actions[
+                    character.get_action_index(name)]
+                old_action = char_action.action
+                char_action.action = baked
+                old_action.user_remap(baked)
+                remove_action(old_action)
+                baked.use_fake_user = False
+                baked.name = name
+                char_action.rootmotion_type = 'ROOT_BONE'
+
+    # The workers used up their copies of the root baker.
+    root_baker = bpy.data.objects.get('NKT_root_baker')
+    if root_baker:
+        delete_bakers([root_baker])
+    return errors
 
 
 class NKT_RootmotionSettings(PropertyGroup):
@@ -116,6 +456,38 @@ class NKT_RootmotionSettings(PropertyGroup):
         description="Process the rotation about Z axis for rootmotion bake.",
         default=True
     )
+    use_direct_bake: BoolProperty(
+        name="Direct Bake",
+        description=(
+            "Compute the rootmotion from sampled bone matrices instead of " +
+            "baking helper objects, in a single pass over the frames. " +
+            "Needs quaternion rotation on the hip and root bones."
+        ),
+        default=True
+    )
+    use_isolation: BoolProperty(
+        name="Skip Mesh Deformation",
+        description=(
+            "Turn off the modifiers of the meshes deformed by the armature " +
+            "while baking, so that only the bones are evaluated."
+        ),
+        default=True
+    )
+    use_workers: BoolProperty(
+        name="Bake on Workers",
+        description=(
+            "Spread the actions of a batch bake over background Blender " +
+            "processes."
+        ),
+        default=False
+    )
+    worker_count: IntProperty(
+        name="Workers",
+        description="The number of background Blender processes to use.",
+        default=max(1, (os.cpu_count() or 2) // 2),
+        min=1,
+        max=64
+    )
 
 
 class NKT_OT_add_rootbone(Operator):
@@ -147,37 +519,87 @@ class NKT_OT_add_rootbone(Operator):
         return {'FINISHED'}
 
 
+def iter_add_rootmotion(report, action_names=None):
+    """
+    Generator baking the rootmotion of the named character actions (the
+    active one by default) with the rootmotion settings of the scene, see
+    iter_bake_rootmotion_actions for the steps.
+    """
+    context = bpy.context
+    settings = context.scene.nkt_settings
+    character = settings.get_active_character()
+    if action_names is None:
+        action_names = character.get_target_action_names('ACTIVE')
+    if not action_names:
+        report({'ERROR'}, "No character actions to bake.")
+        return
+
+    context.view_layer.objects.active = character.armature
+    current_mode = context.object.mode
+
+    if not character.root_bone_name in character.armature.pose.bones.keys():
+        bpy.ops.nkt.character_add_rootbone()
+
+    start = time.perf_counter()
+    options = get_rootmotion_options(settings.rootmotion)
+    isolation = nullcontext(0)
+    if settings.rootmotion.use_isolation:
+        isolation = isolated_evaluation(character.armature)
+
+    with isolation as isolated_count:
+        if settings.rootmotion.use_workers and len(action_names) > 1:
+            errors = yield from iter_bake_rootmotion_parallel(
+                character=character,
+                action_names=action_names,
+                options=options,
+                worker_count=settings.rootmotion.worker_count
+            )
+            for error in errors:
+                report({'ERROR'}, error)
+        else:
+            yield from iter_bake_rootmotion_actions(
+                character, action_names, options)
+
+    bpy.ops.object.mode_set(mode=current_mode)
+
+    report(
+        {'INFO'},
+        "Root Motion Updated on {} action(s) in {:.2f}s, mesh deformation "
+        "skipped on {} object(s).".format(
+            len(action_names), time.perf_counter() - start, isolated_count)
+    )
+
+
 class NKT_OT_add_rootmotion(Operator):
     bl_idname = 'nkt.character_add_rootmotion'
     bl_label = "Add Root Motion"
     bl_description = "Adds Root Motion to Animations"
 
+    target: EnumProperty(
+        items=[
+            ('ACTIVE', "Active", "Bake the active character action.", 0),
+            ('SELECTED', "Selected",
+             "Bake the selected character actions.", 1),
+            ('ALL', "All", "Bake all character actions.", 2)
+        ],
+        name="Target",
+        description="The character actions to bake the rootmotion of."
+    )
+
     def execute(self, context):
         settings = context.scene.nkt_settings
         character = settings.get_active_character()
+        action_names = character.get_target_action_names(self.target)
+        if not action_names:
+            self.report({'ERROR'}, "No character actions to bake.")
+            return {'CANCELLED'}
 
-        context.view_layer.objects.active = character.armature
-        current_mode = context.object.mode
-
-        if not character.root_bone_name in character.armature.pose.bones.keys():
-            bpy.ops.nkt.character_add_rootbone()
-
-        bake_rootmotion(
-            armature=character.armature,
-            action=character.get_active_action().action,
-            hip_bone_name=character.hip_bone_name,
-            root_bone_name=character.root_bone_name,
-            use_x=settings.rootmotion.use_translation[0],
-            use_y=settings.rootmotion.use_translation[1],
-            use_z=settings.rootmotion.use_translation[2],
-            on_ground=settings.rootmotion.on_ground,
-            use_rot=settings.rootmotion.use_rotation,
-            start_frame=settings.rootmotion.start_frame
-        )
-
-        character.get_active_action().rootmotion_type = 'ROOT_BONE'
-
-        bpy.ops.object.mode_set(mode=current_mode)
-
-        self.report({'INFO'}, 'Root Motion Updated')
+        if settings.use_background_jobs:
+            submit_job(
+                "Add Root Motion",
+                lambda report: iter_add_rootmotion(report, action_names)
+            )
+            bpy.ops.nkt.job_monitor('INVOKE_DEFAULT')
+        else:
+            run_steps(iter_add_rootmotion(self.report, action_names))
         return {'FINISHED'}
@@ -1,9 +1,16 @@
 import bpy
 
 from bpy.types import PropertyGroup
-from bpy.props import EnumProperty, IntProperty, PointerProperty
+from bpy.props import (
+    BoolProperty,
+    EnumProperty,
+    IntProperty,
+    PointerProperty,
+    StringProperty
+)
 
 from .character import NKT_Character
+from .profiles import bone_map_profiles
 from .rootmotion import NKT_RootmotionSettings
 
 
@@ -37,3 +44,34 @@ class NKT_Settings(PropertyGroup):
         type=NKT_RootmotionSettings,
         name="Rootmotion Settings"
     )
+
+    use_background_jobs: BoolProperty(
+        name="Run in Background",
+        description=(
+            "Run rootmotion bakes and exports as jobs that keep the " +
+            "interface responsive and can be cancelled."
+        ),
+        default=False
+    )
+
+    bone_map_profile: EnumProperty(
+        items=[
+            (key, profile.name, "Rename bones with the {} mapping.".format(
+                profile.name), i)
+            for i, (key, profile) in enumerate(bone_map_profiles.items())
+        ] + [
+            ('CUSTOM', "Custom", "Rename bones with the mapping of a JSON " +
+             "file.", len(bone_map_profiles))
+        ],
+        name="Bone Map",
+        description="The bone naming used for characters and animations."
+    )
+
+    bone_map_file: StringProperty(
+        name="Bone Map File",
+        description=(
+            "JSON file with a bone_map object from source to target bone " +
+            "names and an optional hip_names list."
+        ),
+        subtype='FILE_PATH'
+    )
@@ -0,0 +1,113 @@
+import os
+import json
+import struct
+import hashlib
+
+import numpy as np
+
+from .fbxreader import read_fbx_skeleton
+
+# Raw file hierarchies keyed by (path, modification time, size).
+file_skeletons = {}
+# Compatibility decisions keyed by the fingerprints of both skeletons.
+skeleton_checks = {}
+
+
+def hash_rest_pose(armature):
+    """Returns a sha1 hex digest of the rest matrices of armature's bones"""
+    bones = armature.data.bones
+    matrices = np.empty(len(bones) * 16, dtype=np.float32)
+    bones.foreach_get('matrix_local', matrices)
+    return hashlib.sha1(matrices.tobytes()).hexdigest()
+
+
+class Skeleton:
+    """
+    A bone hierarchy as a dict of bone name to parent name (None for root
+    bones), identified by a fingerprint of the names and the topology.
+    """
+
+    def __init__(self, parents):
+        self.parents = parents
+        digest = hashlib.sha1(json.dumps(
+            sorted(parents.items(), key=lambda item: item[0])).encode())
+        self.fingerprint = digest.hexdigest()
+
+    @classmethod
+    def from_parents(cls, parents, profile=None):
+        """Builds a skeleton from raw names, resolved with profile if set"""
+        if profile is None:
+            return cls(dict(parents))
+        return cls({
+            profile.resolve(name):
+            profile.resolve(parent) if parent is not None else None
+            for name, parent in parents.items()
+        })
+
+    @classmethod
+    def from_armature(cls, armature, profile=None, ignored=()):
+        """
+        Builds the skeleton of armature. Ignored bones (like an added root
+        bone) are skipped, their children get the next parent up.
+        """
+        parents = {}
+        for bone in armature.data.bones:
+            if bone.name in ignored:
+                continue
+            parent = bone.parent
+            while parent and parent.name in ignored:
+                parent = parent.parent
+            parents[bone.name] = parent.name if parent else None
+        return cls.from_parents(parents, profile)
+
+    @classmethod
+    def from_fbx(cls, filepath, profile):
+        """
+        Builds the skeleton of a binary FBX file without importing it.
+        Raises ValueError for files that can not be read.
+        """
+        stat = os.stat(filepath)
+        key = (os.path.abspath(filepath), stat.st_mtime, stat.st_size)
+        if key not in file_skeletons:
+            file_skeletons[key] = read_fbx_skeleton(filepath)
+        return cls.from_parents(file_skeletons[key], profile)
+
+    def get_mismatch(self, other):
+        """
+        Returns why the animation of the other skeleton does not fit this
+        one, None if every bone of other exists here with the same parent.
+        """
+        missing = sorted(
+            name for name in other.parents if name not in self.parents)
+        if missing:
+            return "{} bone(s) missing on the character ({})".format(
+                len(missing), ", ".join(missing[:3]))
+
+        for name, parent in other.parents.items():
+            if self.parents[name] != parent:
+                return "bone {} has parent {}, on the character {}".format(
+                    name, parent, self.parents[name])
+        return None
+
+
+def check_skeleton(character_skeleton, skeleton):
+    """
+    Returns the mismatch of skeleton against the character's, reusing the
+    decision for skeletons checked before.
+    """
+    key = (character_skeleton.fingerprint, skeleton.fingerprint)
+    if key not in skeleton_checks:
+        skeleton_checks[key] = character_skeleton.get_mismatch(skeleton)
+    return skeleton_checks[key]
+
+
+def check_file_skeleton(filepath, character_skeleton, profile):
+    """
+    Returns the mismatch of an animation file against the character's
+    skeleton, None if it fits or the file can not be checked before import.
+    """
+    try:
+        skeleton = Skeleton.from_fbx(filepath, profile)
+    except (OSError, ValueError, struct.error):
+        return None
+    return check_skeleton(character_skeleton, skeleton)
@@ -0,0 +1,11 @@
+import os
+import sys
+import types
+
+# The add-on's __init__ registers Blender classes, so the modules that only
+# need numpy are imported from a bare package of the source directory.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+package = types.ModuleType('nkt')
+package.__path__ = [ROOT]
+sys.modules.setdefault('nkt', package)
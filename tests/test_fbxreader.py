@@ -0,0 +1,220 @@
+import zlib
+import struct
+
+import numpy as np
+import pytest
+
+from nkt.fbxreader import (
+    CONSTANT_NEXT,
+    FBX_KTIME,
+    FBX_MAGIC,
+    INTERPOLATION_CONSTANT,
+    INTERPOLATION_CUBIC,
+    INTERPOLATION_LINEAR,
+    SKELETON_NODES,
+    read_fbx,
+    read_fbx_skeleton,
+    sample_curve
+)
+
+ARRAY_CODES = {'f': '<f4', 'd': '<f8', 'l': '<i8', 'i': '<i4'}
+
+
+def encode_property(value):
+    """Encodes a property, tuples being (array type, values, compress)"""
+    if isinstance(value, bytes):
+        return b'S' + struct.pack('<I', len(value)) + value
+    if isinstance(value, str):
+        return encode_property(value.encode())
+    if isinstance(value, bool):
+        return b'C' + struct.pack('<?', value)
+    if isinstance(value, int):
+        return b'L' + struct.pack('<q', value)
+    if isinstance(value, float):
+        return b'D' + struct.pack('<d', value)
+    code, values, compress = value
+    raw = np.asarray(values, dtype=ARRAY_CODES[code]).tobytes()
+    if compress:
+        raw = zlib.compress(raw)
+    return code.encode() + struct.pack(
+        '<III', len(values), int(compress), len(raw)) + raw
+
+
+def encode_node(node, offset, wide):
+    """
+    Encodes a (name, props, children) node starting at offset of the file,
+    children being None for nodes without a child list.
+    """
+    name, props, children = node
+    header = '<QQQ' if wide else '<III'
+    null_size = struct.calcsize(header) + 1
+    prop_data = b''.join(encode_property(prop) for prop in props)
+    body_offset = (
+        offset + struct.calcsize(header) + 1 + len(name) + len(prop_data))
+    body = b''
+    if children is not None:
+        for child in children:
+            body += encode_node(child, body_offset + len(body), wide)
+        body += b'\x00' * null_size
+    end = body_offset + len(body)
+    return (
+        struct.pack(header, end, len(props), len(prop_data)) +
+        bytes([len(name)]) + name.encode() + prop_data + body
+    )
+
+
+def write_fbx(filepath, nodes, version=7400):
+    wide = version >= 7500
+    data = FBX_MAGIC + b'\x1a\x00' + struct.pack('<I', version)
+    for node in nodes:
+        data += encode_node(node, len(data), wide)
+    data += b'\x00' * (25 if wide else 13)
+    with open(filepath, 'wb') as file:
+        file.write(data)
+
+
+def model(model_id, name, kind=b'LimbNode'):
+    return ('Model', [model_id, name.encode() + b'\x00\x01Model', kind], [
+        ('Version', [232], None)
+    ])
+
+
+def connection(child, parent):
+    return ('C', [b'OO', child, parent], None)
+
+
+def get_skeleton_nodes(compress=False):
+    """Hips > Spine > Spine_end, with a mesh and an unknown top level node"""
+    return [
+        ('FileId', [('i', [7, 4, 0, 0], compress)], None),
+        ('Objects', [], [
+            ('Geometry', [10, b'Body\x00\x01Geometry', b'Mesh'], [
+                ('Vertices', [('d', np.arange(9.0), compress)], None)
+            ]),
+            model(1, 'Hips'),
+            model(2, 'Spine'),
+            model(3, 'Spine_end'),
+            model(4, 'Body', b'Mesh')
+        ]),
+        ('Connections', [], [
+            connection(1, 0),
+            connection(2, 1),
+            connection(3, 2),
+            connection(4, 0),
+            connection(10, 4)
+        ])
+    ]
+
+
+def curve_node(key_frames, key_values, flags=None, slopes=None,
+               ref_counts=None, fps=30.0):
+    """AnimationCurve node keyed at the given frames of an anim_offset of 0"""
+    key_times = np.round(np.asarray(key_frames) / fps * FBX_KTIME)
+    children = [
+        ('KeyTime', [('l', key_times.astype(np.int64), True)], None),
+        ('KeyValueFloat', [('f', key_values, False)], None)
+    ]
+    if flags is not None:
+        data = np.zeros((len(flags), 4))
+        if slopes is not None:
+            data[:, :2] = slopes
+        children += [
+            ('KeyAttrFlags', [('i', flags, False)], None),
+            ('KeyAttrDataFloat', [('f', data.ravel(), False)], None),
+            ('KeyAttrRefCount', [('i', ref_counts, False)], None)
+        ]
+    return ('AnimationCurve', [20, b'\x00\x01AnimCurve', b''], children)
+
+
+def read_curve(tmp_path, curve):
+    filepath = str(tmp_path / 'curve.fbx')
+    write_fbx(filepath, [('Objects', [], [curve])])
+    nodes = read_fbx(filepath, {'Objects': {'AnimationCurve': None}})
+    return nodes['Objects'].find('AnimationCurve')
+
+
+@pytest.mark.parametrize('version', [7400, 7500])
+def test_read_fbx_skeleton(tmp_path, version):
+    filepath = str(tmp_path / 'skeleton.fbx')
+    write_fbx(filepath, get_skeleton_nodes(), version)
+    assert read_fbx_skeleton(filepath) == {'Hips': None, 'Spine': 'Hips'}
+
+
+def test_read_fbx_filters_nodes(tmp_path):
+    filepath = str(tmp_path / 'skeleton.fbx')
+    write_fbx(filepath, get_skeleton_nodes())
+    nodes = read_fbx(filepath, SKELETON_NODES)
+
+    assert set(nodes) == {'Objects', 'Connections'}
+    models = nodes['Objects'].children
+    assert [node.name for node in models] == ['Model'] * 4
+    assert [node.props[0] for node in models] == [1, 2, 3, 4]
+    # Children of filtered nodes are skipped without being decoded.
+    assert all(node.children == [] for node in models)
+    assert [node.props[:3] for node in nodes['Connections'].children][1] == \
+        [b'OO', 2, 1]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_read_fbx_arrays(tmp_path, compress):
+    filepath = str(tmp_path / 'arrays.fbx')
+    write_fbx(filepath, get_skeleton_nodes(compress))
+    nodes = read_fbx(filepath, None)
+
+    assert list(nodes['FileId'].props[0]) == [7, 4, 0, 0]
+    geometry = nodes['Objects'].find('Geometry')
+    np.testing.assert_array_equal(
+        geometry.find('Vertices').props[0], np.arange(9.0))
+
+
+def test_read_fbx_rejects_text_files(tmp_path):
+    filepath = tmp_path / 'text.fbx'
+    filepath.write_text('; FBX 7.4.0 project file\n')
+    with pytest.raises(ValueError):
+        read_fbx(str(filepath))
+
+
+def test_sample_curve_defaults_to_linear(tmp_path):
+    curve = read_curve(tmp_path, curve_node([0, 10], [0.0, 10.0]))
+    frames = np.arange(-2, 13)
+    np.testing.assert_allclose(
+        sample_curve(curve, frames, 30.0, 0.0), np.clip(frames, 0, 10))
+
+
+def test_sample_curve_constant(tmp_path):
+    curve = read_curve(tmp_path, curve_node(
+        [0, 4, 8],
+        [1.0, 2.0, 3.0],
+        flags=[INTERPOLATION_CONSTANT, INTERPOLATION_CONSTANT | CONSTANT_NEXT],
+        ref_counts=[1, 2]
+    ))
+    values = sample_curve(curve, np.arange(10), 30.0, 0.0)
+    # The first key holds its value, the second jumps to the next key.
+    np.testing.assert_allclose(
+        values, [1, 1, 1, 1, 2, 3, 3, 3, 3, 3])
+
+
+def test_sample_curve_cubic(tmp_path):
+    fps = 30.0
+    # The cubic with value t^3 - t over the segment, its slopes being in
+    # value per second.
+    duration = 10 / fps
+    curve = read_curve(tmp_path, curve_node(
+        [0, 10, 20],
+        [0.0, 0.0, 5.0],
+        flags=[INTERPOLATION_CUBIC, INTERPOLATION_LINEAR],
+        slopes=[[-1.0 / duration, 2.0 / duration], [0.0, 0.0]],
+        ref_counts=[1, 2],
+        fps=fps
+    ))
+    frames = np.arange(21)
+    t = frames[:11] / 10
+    expected = np.concatenate((t ** 3 - t, np.linspace(0.5, 5.0, 10)))
+    np.testing.assert_allclose(
+        sample_curve(curve, frames, fps, 0.0), expected, atol=1e-6)
+
+
+def test_sample_curve_offset(tmp_path):
+    curve = read_curve(tmp_path, curve_node([0, 2], [0.0, 4.0]))
+    np.testing.assert_allclose(
+        sample_curve(curve, [1, 2, 3], 30.0, 1.0), [0.0, 2.0, 4.0])
@@ -0,0 +1,215 @@
+import json
+import base64
+
+import numpy as np
+import pytest
+
+from nkt.gltfmerge import (
+    DATA_URI_PREFIX,
+    merge_animations,
+    read_gltf,
+    write_gltf
+)
+
+FLOAT = 5126
+
+
+def add_accessor(gltf, blob, values, accessor_type):
+    """Appends values as a float accessor in its own view of blob"""
+    data = np.asarray(values, dtype=np.float32)
+    gltf.setdefault('bufferViews', []).append({
+        'buffer': 0,
+        'byteOffset': len(blob),
+        'byteLength': data.nbytes
+    })
+    gltf.setdefault('accessors', []).append({
+        'bufferView': len(gltf['bufferViews']) - 1,
+        'componentType': FLOAT,
+        'count': len(data),
+        'type': accessor_type
+    })
+    blob += data.tobytes()
+    return len(gltf['accessors']) - 1
+
+
+def get_curve(seed, count=3):
+    rng = np.random.default_rng(seed)
+    return np.arange(count) / 24.0, rng.normal(size=(count, 4))
+
+
+def make_shard(node_names, animations):
+    """
+    Builds a glTF document and its buffer with one sampler per (node name,
+    seed) channel of every animation, channels sharing a seed sharing the
+    sampler.
+    """
+    gltf = {
+        'asset': {'version': '2.0'},
+        'nodes': [{'name': name} for name in node_names],
+        'animations': []
+    }
+    blob = bytearray()
+    for name, channels in animations:
+        samplers = {}
+        animation = {'name': name, 'channels': [], 'samplers': []}
+        for node_name, seed in channels:
+            if seed not in samplers:
+                times, values = get_curve(seed)
+                animation['samplers'].append({
+                    'input': add_accessor(gltf, blob, times, 'SCALAR'),
+                    'output': add_accessor(gltf, blob, values, 'VEC4'),
+                    'interpolation': 'LINEAR'
+                })
+                samplers[seed] = len(animation['samplers']) - 1
+            animation['channels'].append({
+                'sampler': samplers[seed],
+                'target': {
+                    'node': node_names.index(node_name),
+                    'path': 'rotation'
+                }
+            })
+        gltf['animations'].append(animation)
+    return gltf, blob
+
+
+def make_base(filepath, export_format):
+    """A rig without animation whose buffer ends off 4 byte alignment"""
+    gltf = {
+        'asset': {'version': '2.0'},
+        'nodes': [{'name': 'Body'}, {'name': 'Hips'}, {'name': 'Spine'}],
+        'bufferViews': [{'buffer': 0, 'byteOffset': 0, 'byteLength': 6}]
+    }
+    write_gltf(filepath, gltf, bytearray(b'abcdef'), export_format)
+
+
+def read_accessor(gltf, buffers, index):
+    accessor = gltf['accessors'][index]
+    view = gltf['bufferViews'][accessor['bufferView']]
+    start = view['byteOffset']
+    data = buffers[view['buffer']][start:start + view['byteLength']]
+    values = np.frombuffer(data, dtype=np.float32)
+    if accessor['type'] == 'SCALAR':
+        return values
+    return values.reshape(accessor['count'], -1)
+
+
+def get_channel_curves(gltf, buffers, animation):
+    """Returns the (times, values) of every channel keyed by node name"""
+    curves = {}
+    for channel in animation['channels']:
+        sampler = animation['samplers'][channel['sampler']]
+        node_name = gltf['nodes'][channel['target']['node']]['name']
+        curves[node_name] = (
+            read_accessor(gltf, buffers, sampler['input']),
+            read_accessor(gltf, buffers, sampler['output'])
+        )
+    return curves
+
+
+@pytest.fixture
+def shards(tmp_path):
+    """
+    A .glb shard with its nodes in another order than the base and an
+    extra node, and a .gltf shard with two embedded buffers.
+    """
+    walk = make_shard(
+        ['Spine', 'Hips', 'Extra'],
+        [
+            ('Walk', [('Hips', 1), ('Spine', 2), ('Extra', 3)]),
+            ('Extra only', [('Extra', 4)])
+        ]
+    )
+    write_gltf(str(tmp_path / 'walk.glb'), walk[0], walk[1], 'GLB')
+
+    run, run_blob = make_shard(
+        ['Hips', 'Spine'], [('Run', [('Hips', 5), ('Spine', 5)])])
+    # The second buffer holds everything past the first view, so both
+    # buffers have to be joined.
+    split = run['bufferViews'][1]['byteOffset']
+    for view in run['bufferViews'][1:]:
+        view['buffer'] = 1
+        view['byteOffset'] -= split
+    run['buffers'] = [
+        {'uri': DATA_URI_PREFIX + base64.b64encode(data).decode()}
+        for data in (bytes(run_blob[:split]), bytes(run_blob[split:]))
+    ]
+    with open(str(tmp_path / 'run.gltf'), 'w') as gltf_file:
+        json.dump(run, gltf_file)
+
+    return [str(tmp_path / 'walk.glb'), str(tmp_path / 'run.gltf')]
+
+
+@pytest.mark.parametrize('export_format, extension', [
+    ('GLB', '.glb'),
+    ('GLTF_SEPARATE', '.gltf'),
+    ('GLTF_EMBEDDED', '.gltf')
+])
+def test_merge_animations(tmp_path, shards, export_format, extension):
+    base_path = str(tmp_path / ('base' + extension))
+    make_base(base_path, export_format)
+    filepath = str(tmp_path / ('merged' + extension))
+
+    names = merge_animations(base_path, shards, filepath, export_format)
+    gltf, buffers = read_gltf(filepath)
+
+    # Animations without any channel on a base node are left out.
+    assert names == ['Walk', 'Run']
+    assert [animation['name'] for animation in gltf['animations']] == names
+    assert len(buffers) == 1
+    # The binary chunk of .glb files may be padded past the buffer.
+    assert gltf['buffers'][0]['byteLength'] <= len(buffers[0])
+    assert all(view['buffer'] == 0 for view in gltf['bufferViews'])
+    assert all(view['byteOffset'] % 4 == 0 for view in gltf['bufferViews'])
+    for view in gltf['bufferViews']:
+        assert view['byteOffset'] + view['byteLength'] <= len(buffers[0])
+    assert bytes(buffers[0][:6]) == b'abcdef'
+
+    walk, run = gltf['animations']
+    nodes = {node['name']: i for i, node in enumerate(gltf['nodes'])}
+    assert [channel['target']['node'] for channel in walk['channels']] == \
+        [nodes['Hips'], nodes['Spine']]
+    assert [channel['target']['node'] for channel in run['channels']] == \
+        [nodes['Hips'], nodes['Spine']]
+
+    # Only the samplers of kept channels are copied, shared ones once.
+    assert len(walk['samplers']) == 2
+    assert len(run['samplers']) == 1
+    assert run['channels'][0]['sampler'] == run['channels'][1]['sampler']
+    accessor_count = len(gltf['accessors'])
+    for animation in (walk, run):
+        for sampler in animation['samplers']:
+            assert 0 <= sampler['input'] < accessor_count
+            assert 0 <= sampler['output'] < accessor_count
+    assert accessor_count == 6
+
+    for animation, seeds in ((walk, {'Hips': 1, 'Spine': 2}),
+                             (run, {'Hips': 5, 'Spine': 5})):
+        curves = get_channel_curves(gltf, buffers, animation)
+        assert set(curves) == set(seeds)
+        for node_name, seed in seeds.items():
+            times, values = get_curve(seed)
+            np.testing.assert_array_equal(
+                curves[node_name][0], times.astype(np.float32))
+            np.testing.assert_array_equal(
+                curves[node_name][1], values.astype(np.float32))
+
+
+def test_merge_missing_nodes(tmp_path, shards):
+    base_path = str(tmp_path / 'base.glb')
+    write_gltf(base_path, {
+        'asset': {'version': '2.0'},
+        'nodes': [{'name': 'Body'}, {'name': 'Spine'}]
+    }, bytearray(), 'GLB')
+    filepath = str(tmp_path / 'merged.glb')
+
+    names = merge_animations(base_path, shards, filepath, 'GLB')
+    gltf, buffers = read_gltf(filepath)
+
+    assert names == ['Walk', 'Run']
+    for animation in gltf['animations']:
+        assert [channel['target']['node'] for channel in
+                animation['channels']] == [1]
+        assert len(animation['samplers']) == 1
+    walk = get_channel_curves(gltf, buffers, gltf['animations'][0])
+    np.testing.assert_array_equal(
+        walk['Spine'][1], get_curve(2)[1].astype(np.float32))
@@ -0,0 +1,172 @@
+from nkt.nla import STRIP_SETTINGS, get_longest_increasing, sync_nla_tracks
+
+
+class Action:
+    def __init__(self, name, frame_range=(1.0, 10.0)):
+        self.name = name
+        self.frame_range = frame_range
+
+
+class CharacterAction:
+    def __init__(self, action):
+        self.action = action
+
+    @property
+    def name(self):
+        return self.action.name
+
+
+class Strip:
+    def __init__(self, name, start, action):
+        self.name = name
+        self.action = action
+        self.action_frame_start, self.action_frame_end = action.frame_range
+        self.frame_start = start
+        length = self.action_frame_end - self.action_frame_start
+        self.frame_end = start + length
+        for setting in STRIP_SETTINGS[2:]:
+            setattr(self, setting, 0)
+
+
+class Strips(list):
+    def __init__(self, anim_data):
+        super().__init__()
+        self.anim_data = anim_data
+
+    def new(self, name, start, action):
+        assert isinstance(start, int)
+        strip = Strip(name, start, action)
+        if any(
+            other.frame_start < strip.frame_end and
+            other.frame_end > strip.frame_start
+            for other in self
+        ):
+            raise RuntimeError("Unable to add strip")
+        # Strip names are unique per AnimData, like in Blender.
+        names = {
+            other.name
+            for track in self.anim_data.nla_tracks for other in track.strips
+        }
+        unique, count = name, 0
+        while unique in names:
+            count += 1
+            unique = "{}.{:03d}".format(name, count)
+        strip.name = unique
+        self.append(strip)
+        return strip
+
+
+class Track:
+    def __init__(self, anim_data):
+        self.name = "NlaTrack"
+        self.mute = False
+        self.lock = False
+        self.strips = Strips(anim_data)
+
+
+class Tracks(list):
+    def __init__(self, anim_data):
+        super().__init__()
+        self.anim_data = anim_data
+
+    def new(self, prev=None):
+        track = Track(self.anim_data)
+        if prev is None:
+            self.append(track)
+        else:
+            self.insert(self.index(prev) + 1, track)
+        return track
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return next(track for track in self if track.name == key)
+        return super().__getitem__(key)
+
+
+class AnimData:
+    def __init__(self):
+        self.action = None
+        self.nla_tracks = Tracks(self)
+
+
+def get_layout(anim_data):
+    return [
+        (track.name, [strip.action.name for strip in track.strips])
+        for track in anim_data.nla_tracks
+    ]
+
+
+def make_actions(names):
+    return [CharacterAction(Action(name)) for name in names]
+
+
+def test_longest_increasing():
+    assert get_longest_increasing([]) == []
+    assert get_longest_increasing([3, 1, 2, 0, 4]) == [1, 2, 4]
+
+
+def test_sync_is_stable():
+    anim_data = AnimData()
+    char_actions = make_actions(['walk', 'run', 'jump'])
+    stats = sync_nla_tracks(anim_data, char_actions)
+    assert stats['added'] == 3
+    assert get_layout(anim_data) == [
+        ('walk', ['walk']), ('run', ['run']), ('jump', ['jump'])]
+
+    stats = sync_nla_tracks(anim_data, char_actions)
+    assert stats == {'added': 0, 'removed': 0, 'moved': 0, 'updated': 0}
+
+
+def test_resync_after_action_swap():
+    anim_data = AnimData()
+    originals = make_actions(['walk', 'run'])
+    sync_nla_tracks(anim_data, originals)
+    anim_data.nla_tracks['run'].strips[0].scale = 2.0
+
+    # Like prepared copies: new actions with the same names and ranges.
+    copies = make_actions(['walk', 'run'])
+    copies[1].action.frame_range = (1.0, 20.0)
+    stats = sync_nla_tracks(anim_data, copies)
+    assert stats['updated'] == 2
+    assert stats['added'] == stats['removed'] == 0
+
+    strip = anim_data.nla_tracks['run'].strips[0]
+    assert strip.action is copies[1].action
+    assert (strip.action_frame_start, strip.action_frame_end) == (1.0, 20.0)
+    assert strip.scale == 2.0
+
+    stats = sync_nla_tracks(anim_data, originals)
+    assert stats['updated'] == 2
+    assert anim_data.nla_tracks['walk'].strips[0].action is (
+        originals[0].action)
+
+
+def test_unrelated_tracks_are_kept():
+    anim_data = AnimData()
+    manual = anim_data.nla_tracks.new()
+    manual.name = 'idle'
+    manual.strips.new(name='idle', start=1, action=Action('idle'))
+
+    sync_nla_tracks(anim_data, make_actions(['walk']))
+    assert get_layout(anim_data) == [('idle', ['idle']), ('walk', ['walk'])]
+
+
+def test_moved_tracks_keep_names():
+    anim_data = AnimData()
+    char_actions = make_actions(['walk', 'run', 'jump'])
+    sync_nla_tracks(anim_data, char_actions)
+    strip = anim_data.nla_tracks['walk'].strips[0]
+    strip.frame_start += 0.5
+    strip.frame_end += 0.5
+
+    order = [char_actions[i] for i in (1, 2, 0)]
+    stats = sync_nla_tracks(anim_data, order)
+    assert stats['moved'] == 1
+    assert get_layout(anim_data) == [
+        ('run', ['run']), ('jump', ['jump']), ('walk', ['walk'])]
+    strip = anim_data.nla_tracks['walk'].strips[0]
+    assert strip.name == 'walk'
+    assert strip.frame_start == 1.5
+
+    stats = sync_nla_tracks(anim_data, order)
+    assert stats == {'added': 0, 'removed': 0, 'moved': 0, 'updated': 0}
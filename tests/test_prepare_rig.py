@@ -0,0 +1,166 @@
+"""
+Checks the vectorized hip transform of armature.prepare_anim_rig_direct
+against a per frame reference of what the bake path does: a helper copying
+the world location and rotation of the hip on every frame, copied back
+into the hip once the object transform is applied.
+"""
+import math
+
+import numpy as np
+
+from nkt.transforms import (
+    compose_matrices,
+    decompose_matrices,
+    fix_quaternion_inverts,
+    get_basis_matrices,
+    remove_scale
+)
+
+LOCATION_TOLERANCE = 1e-9
+ROTATION_TOLERANCE = 1e-9
+
+
+def quaternion_from_rotation(rot):
+    """Per matrix conversion, the way mathutils' to_quaternion does it"""
+    trace = rot[0, 0] + rot[1, 1] + rot[2, 2]
+    if trace > 0.0:
+        s = 2.0 * math.sqrt(1.0 + trace)
+        quat = (
+            0.25 * s,
+            (rot[2, 1] - rot[1, 2]) / s,
+            (rot[0, 2] - rot[2, 0]) / s,
+            (rot[1, 0] - rot[0, 1]) / s
+        )
+    elif rot[0, 0] > rot[1, 1] and rot[0, 0] > rot[2, 2]:
+        s = 2.0 * math.sqrt(1.0 + rot[0, 0] - rot[1, 1] - rot[2, 2])
+        quat = (
+            (rot[2, 1] - rot[1, 2]) / s,
+            0.25 * s,
+            (rot[0, 1] + rot[1, 0]) / s,
+            (rot[0, 2] + rot[2, 0]) / s
+        )
+    elif rot[1, 1] > rot[2, 2]:
+        s = 2.0 * math.sqrt(1.0 + rot[1, 1] - rot[0, 0] - rot[2, 2])
+        quat = (
+            (rot[0, 2] - rot[2, 0]) / s,
+            (rot[0, 1] + rot[1, 0]) / s,
+            0.25 * s,
+            (rot[1, 2] + rot[2, 1]) / s
+        )
+    else:
+        s = 2.0 * math.sqrt(1.0 + rot[2, 2] - rot[0, 0] - rot[1, 1])
+        quat = (
+            (rot[1, 0] - rot[0, 1]) / s,
+            (rot[0, 2] + rot[2, 0]) / s,
+            (rot[1, 2] + rot[2, 1]) / s,
+            0.25 * s
+        )
+    return np.array(quat)
+
+
+def get_loc_rot(matrix):
+    """The location and rotation of one matrix, without its scale"""
+    loc_rot = np.identity(4)
+    loc_rot[:3, :3] = matrix[:3, :3] / np.linalg.norm(
+        matrix[:3, :3], axis=0)
+    loc_rot[:3, 3] = matrix[:3, 3]
+    return loc_rot
+
+
+def get_random_transforms(rng, count, scale=1.0):
+    quats = rng.normal(size=(count, 4))
+    quats /= np.linalg.norm(quats, axis=1, keepdims=True)
+    locs = rng.uniform(-1.0, 1.0, size=(count, 3)) * scale
+    return compose_matrices(locs, quats)
+
+
+def get_rig(seed=0, frame_count=40):
+    """
+    A Mixamo like import: the armature object is turned 90 degrees about X
+    and scaled to 0.01, the hip has a parent, both are animated.
+    """
+    rng = np.random.default_rng(seed)
+    angle = math.radians(90.0)
+    object_matrix = compose_matrices(
+        np.array((1.0, 2.0, 3.0)),
+        np.array((math.cos(angle / 2), math.sin(angle / 2), 0.0, 0.0)),
+        np.full(3, 0.01)
+    )
+    parent_rest, rest = get_random_transforms(rng, 2, 50.0)
+    parent_basis = get_random_transforms(rng, frame_count, 10.0)
+    basis = get_random_transforms(rng, frame_count, 10.0)
+    parent_pose = parent_rest @ parent_basis
+    pose = parent_pose @ np.linalg.inv(parent_rest) @ rest @ basis
+    return object_matrix, parent_rest, rest, parent_basis, pose
+
+
+def prepare_direct(object_matrix, parent_rest, rest, parent_basis, pose):
+    """The steps of prepare_anim_rig_direct, without Blender"""
+    hip_world = remove_scale(object_matrix @ pose)
+    # Applying the object transform moves it into the rest matrices, the
+    # object matrix becomes the identity.
+    applied_parent_rest = remove_scale(object_matrix @ parent_rest)
+    applied_rest = remove_scale(object_matrix @ rest)
+    basis = get_basis_matrices(
+        pose_matrices=hip_world,
+        rest=applied_rest,
+        parent_rest=applied_parent_rest,
+        parent_pose=applied_parent_rest @ parent_basis
+    )
+    locs, quats, scales = decompose_matrices(basis)
+    return locs, fix_quaternion_inverts(quats), scales
+
+
+def prepare_reference(object_matrix, parent_rest, rest, parent_basis, pose):
+    """The bake path, one frame at a time"""
+    applied_parent_rest = get_loc_rot(object_matrix @ parent_rest)
+    applied_rest = get_loc_rot(object_matrix @ rest)
+    offset = np.linalg.inv(applied_parent_rest) @ applied_rest
+
+    locs, quats = [], []
+    for frame_parent_basis, frame_pose in zip(parent_basis, pose):
+        # The baker empty copies the world location and rotation of the hip.
+        target = get_loc_rot(object_matrix @ frame_pose)
+        # The hip copies the baker back, visual keying solves the basis.
+        parent_pose = applied_parent_rest @ frame_parent_basis
+        basis = np.linalg.inv(parent_pose @ offset) @ target
+        locs.append(basis[:3, 3])
+        quats.append(quaternion_from_rotation(basis[:3, :3]))
+    return np.array(locs), np.array(quats)
+
+
+def get_angles(a, b):
+    """Angles between quaternions, without arccos' loss of precision"""
+    b = b * np.sign(np.einsum('ij,ij->i', a, b))[:, np.newaxis]
+    return 4.0 * np.arctan2(
+        np.linalg.norm(a - b, axis=1), np.linalg.norm(a + b, axis=1))
+
+
+def test_direct_hip_matches_bake():
+    for seed in range(3):
+        rig = get_rig(seed)
+        locs, quats, scales = prepare_direct(*rig)
+        ref_locs, ref_quats = prepare_reference(*rig)
+
+        np.testing.assert_allclose(locs, ref_locs, atol=LOCATION_TOLERANCE)
+        assert get_angles(quats, ref_quats).max() <= ROTATION_TOLERANCE
+        np.testing.assert_allclose(scales, 1.0, atol=1e-12)
+        # Continuous signs, as the keys are interpolated.
+        assert (np.einsum('ij,ij->i', quats[1:], quats[:-1]) >= 0.0).all()
+
+
+def test_direct_hip_keeps_world_motion():
+    object_matrix, parent_rest, rest, parent_basis, pose = get_rig()
+    locs, quats, _ = prepare_direct(
+        object_matrix, parent_rest, rest, parent_basis, pose)
+
+    applied_parent_rest = remove_scale(object_matrix @ parent_rest)
+    applied_rest = remove_scale(object_matrix @ rest)
+    new_pose = (
+        applied_parent_rest @ parent_basis @
+        np.linalg.inv(applied_parent_rest) @ applied_rest @
+        compose_matrices(locs, quats)
+    )
+    np.testing.assert_allclose(
+        new_pose, remove_scale(object_matrix @ pose),
+        atol=LOCATION_TOLERANCE)
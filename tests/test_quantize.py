@@ -0,0 +1,104 @@
+import math
+
+import numpy as np
+
+from nkt.quantize import (
+    decode_smallest_three,
+    encode_smallest_three,
+    fit_property,
+    get_sample_frames,
+    quantize_grid,
+    resample_property
+)
+from nkt.transforms import get_angular_error
+
+# Half a 15 bit step on each stored component is at most sqrt(3) steps in
+# length, the derived largest component (at least 1/2) adds up to sqrt(3)
+# times that, and the angle is twice the length of the difference.
+HALF_STEP = (1.0 / math.sqrt(2.0)) / (2 ** 15 - 1)
+ROUND_TRIP_ERROR = 2.0 * 2.0 * math.sqrt(3.0) * HALF_STEP
+
+
+def get_random_quaternions(count, seed=0):
+    quats = np.random.default_rng(seed).normal(size=(count, 4))
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def get_x_rotation(frames, angle):
+    """Quaternions turning linearly from 0 to angle around X over frames"""
+    angles = angle * (frames - frames[0]) / (frames[-1] - frames[0])
+    quats = np.zeros((len(frames), 4))
+    quats[:, 0] = np.cos(angles * 0.5)
+    quats[:, 1] = np.sin(angles * 0.5)
+    return quats
+
+
+def test_smallest_three_round_trip():
+    quats = get_random_quaternions(10000)
+    packed = encode_smallest_three(quats)
+    assert packed.max() < 1 << 48
+
+    decoded = decode_smallest_three(packed)
+    np.testing.assert_allclose(np.linalg.norm(decoded, axis=1), 1.0, atol=1e-4)
+    assert get_angular_error(decoded, quats).max() <= ROUND_TRIP_ERROR
+
+
+def test_decoding_keeps_the_sign_of_the_track():
+    frames = np.arange(61, dtype=np.float64)
+    quats = get_x_rotation(frames, math.radians(-150.0))
+    # The largest component changes from w to x along the way.
+    assert decode_smallest_three(encode_smallest_three(quats))[-1, 1] > 0.0
+
+    keys = get_sample_frames(0, 60, 4)
+    keyed, error = resample_property(
+        frames, quats, keys, 'rotation_quaternion', 0.0)
+    assert (np.einsum('ij,ij->i', keyed[1:], keyed[:-1]) > 0.0).all()
+    assert error.max() <= math.radians(0.01)
+
+
+def test_location_precision_holds():
+    frames = np.arange(31, dtype=np.float64)
+    values = np.random.default_rng(1).uniform(-2.0, 2.0, size=(31, 3))
+    precision = 1e-3
+
+    keyed, error = resample_property(
+        frames, values, frames, 'location', precision)
+    np.testing.assert_allclose(
+        keyed / precision, np.rint(keyed / precision), atol=1e-6)
+    assert error.max() <= 0.5 * precision * math.sqrt(3.0) + 1e-12
+    np.testing.assert_array_equal(
+        quantize_grid(values, 0.0), values)
+
+
+def test_rotation_error_holds():
+    frames = np.arange(121, dtype=np.float64)
+    # A wobble resampling every 4 frames cannot follow within the limit.
+    angles = np.sin(frames * 0.9) * 0.3 + frames * 0.05
+    quats = np.zeros((len(frames), 4))
+    quats[:, 0] = np.cos(angles * 0.5)
+    quats[:, 2] = np.sin(angles * 0.5)
+    samples = get_sample_frames(0, 120, 4)
+    max_error = math.radians(0.1)
+
+    _, error = resample_property(
+        frames, quats, samples, 'rotation_quaternion', 0.0)
+    assert error.max() > max_error
+
+    keys, keyed = fit_property(
+        frames, quats, [samples, frames], 'rotation_quaternion', 0.0,
+        max_error)
+    assert keys is frames
+    _, error = resample_property(
+        frames, quats, keys, 'rotation_quaternion', 0.0)
+    assert error.max() <= max_error
+
+    smooth = get_x_rotation(frames, math.radians(90.0))
+    keys, keyed = fit_property(
+        frames, smooth, [samples, frames], 'rotation_quaternion', 0.0,
+        max_error)
+    assert keys is samples
+    assert len(keyed) == len(samples)
+
+    keys, keyed = fit_property(
+        frames, quats, [samples, frames], 'rotation_quaternion', 0.0, 0.0)
+    assert keys is None and keyed is None
@@ -0,0 +1,127 @@
+"""
+Checks the array based quaternion cleanup of baker.quaternion_cleanup
+against a port of the per-keyframe loop it replaced. Run as a script to
+benchmark both:
+
+    python tests/test_quaternion_cleanup.py
+"""
+import math
+import time
+
+import numpy as np
+
+import conftest  # noqa: F401, sets up the nkt package when run as a script
+from nkt.transforms import (
+    fix_quaternion_flips,
+    fix_quaternion_inverts,
+    quaternion_product
+)
+
+
+def cleanup_loop(quats, prevent_flips=True, prevent_inverts=True):
+    """
+    The previous quaternion_cleanup loop over keyframes, with mathutils'
+    rotation_difference, angle, axis and rotate written out.
+    """
+    quats = [np.array(quat, dtype=np.float64) for quat in quats]
+    for i in range(1, len(quats)):
+        if prevent_flips:
+            prev = quats[i - 1] / np.linalg.norm(quats[i - 1])
+            cur = quats[i] / np.linalg.norm(quats[i])
+            diff = quaternion_product(prev * (1.0, -1.0, -1.0, -1.0), cur)
+            angle = 2.0 * math.acos(max(-1.0, min(1.0, diff[0])))
+            if abs(angle - math.pi) < 0.5:
+                length = np.linalg.norm(diff[1:])
+                axis = diff[1:] / length if length > 0.0 else diff[1:]
+                half_turn = np.concatenate(([0.0], axis))
+                quats[i] = quaternion_product(half_turn, quats[i])
+        if prevent_inverts:
+            change_amount = np.abs(quats[i - 1] - quats[i]).sum()
+            if change_amount > 1.0:
+                quats[i] = -quats[i]
+    return np.array(quats)
+
+
+def cleanup_arrays(quats, prevent_flips=True, prevent_inverts=True):
+    quats = np.array(quats, dtype=np.float64)
+    if prevent_flips:
+        fix_quaternion_flips(quats)
+    if prevent_inverts:
+        fix_quaternion_inverts(quats)
+    return quats
+
+
+def get_sampled_track(count, seed=0, max_step=0.1, flip_rate=0.02):
+    """
+    A random rotation sampled on every frame, turning at most max_step
+    radians per frame, with the sign inversions and half turn flips baked
+    tracks show.
+    """
+    rng = np.random.default_rng(seed)
+    axes = rng.normal(size=(count, 3))
+    axes /= np.linalg.norm(axes, axis=1, keepdims=True)
+    angles = rng.uniform(0.0, max_step, size=count)
+    steps = np.zeros((count, 4))
+    steps[:, 0] = np.cos(angles * 0.5)
+    steps[:, 1:] = axes * np.sin(angles * 0.5)[:, np.newaxis]
+
+    quats = np.empty((count, 4))
+    quats[0] = (1.0, 0.0, 0.0, 0.0)
+    for i in range(1, count):
+        quats[i] = quaternion_product(steps[i], quats[i - 1])
+
+    inverted = rng.random(count) < 0.1
+    inverted[0] = False
+    quats[inverted] *= -1.0
+    # A flip adds half a turn about the rotation's own axis.
+    flipped = np.flatnonzero(rng.random(count) < flip_rate)
+    for i in flipped[flipped > 0]:
+        half_turn = np.zeros(4)
+        half_turn[1:] = quats[i, 1:] / np.linalg.norm(quats[i, 1:])
+        quats[i] = quaternion_product(half_turn, quats[i])
+    return quats
+
+
+def test_inverts_match_loop():
+    quats = get_sampled_track(500, flip_rate=0.0)
+    np.testing.assert_allclose(
+        cleanup_arrays(quats, prevent_flips=False),
+        cleanup_loop(quats, prevent_flips=False),
+        atol=1e-12
+    )
+
+
+def test_flips_and_inverts_match_loop():
+    for seed in range(5):
+        quats = get_sampled_track(500, seed)
+        np.testing.assert_allclose(
+            cleanup_arrays(quats), cleanup_loop(quats), atol=1e-9)
+
+
+def test_inverts_follow_the_short_path():
+    # Fast turns, where the old sum of differences rule can disagree with
+    # the dot product: the array version always takes the short path.
+    quats = get_sampled_track(500, max_step=1.2, flip_rate=0.0)
+    fixed = cleanup_arrays(quats, prevent_flips=False)
+    assert (np.einsum('ij,ij->i', fixed[1:], fixed[:-1]) >= 0.0).all()
+    fixed = cleanup_loop(quats, prevent_flips=False)
+    assert (np.einsum('ij,ij->i', fixed[1:], fixed[:-1]) < 0.0).any()
+
+
+def benchmark(count=5000, repeat=5):
+    quats = get_sampled_track(count)
+    for name, cleanup in (('loop', cleanup_loop), ('arrays', cleanup_arrays)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            cleanup(quats)
+        elapsed = (time.perf_counter() - start) / repeat
+        print("{:>6}: {:8.2f} ms for {} frames".format(
+            name, elapsed * 1000, count))
+
+    disagreements = np.any(np.abs(
+        cleanup_arrays(quats) - cleanup_loop(quats)) > 1e-9, axis=1).sum()
+    print("frames differing: {}".format(disagreements))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,255 @@
+import numpy as np
+
+
+def quaternion_product(a, b):
+    """Hamilton product of two (..., 4) arrays of WXYZ quaternions"""
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack((
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw
+    ), axis=-1)
+
+
+def fix_quaternion_flips(quats):
+    """
+    Rotates every quaternion that is about half a turn away from its
+    predecessor by half a turn about the difference axis. Only the pairs
+    following a fixed frame need to be re-tested, so the scan restarts from
+    there instead of walking every frame in Python.
+    """
+    # Equivalent to abs(rotation_difference(prev, cur).angle - pi) < 0.5
+    threshold = np.sin(0.25)
+    i = 1
+    while i < len(quats):
+        dots = np.einsum('ij,ij->i', quats[i-1:-1], quats[i:])
+        hits = np.flatnonzero(np.abs(dots) < threshold)
+        if len(hits) == 0:
+            break
+        i += hits[0]
+
+        prev = quats[i-1]
+        diff = quaternion_product(prev * (1.0, -1.0, -1.0, -1.0), quats[i])
+        axis = diff[1:]
+        length = np.linalg.norm(axis)
+        if length > 0.0:
+            half_turn = np.zeros(4)
+            half_turn[1:] = axis / length
+            quats[i] = quaternion_product(half_turn, quats[i])
+        i += 1
+
+    return quats
+
+
+def fix_quaternion_inverts(quats):
+    """
+    Keeps the sign of consecutive quaternions continuous, so that q and -q
+    never alternate between frames.
+    """
+    dots = np.einsum('ij,ij->i', quats[:-1], quats[1:])
+    signs = np.ones(len(quats))
+    signs[1:] = np.cumprod(np.where(dots < 0.0, -1.0, 1.0))
+    quats *= signs[:, np.newaxis]
+    return quats
+
+
+def quaternion_to_matrix(quats):
+    """Converts (..., 4) WXYZ quaternions to (..., 3, 3) rotation matrices"""
+    quats = quats / np.linalg.norm(quats, axis=-1, keepdims=True)
+    w, x, y, z = np.moveaxis(quats, -1, 0)
+    return np.stack((
+        np.stack((
+            1.0 - 2.0 * (y * y + z * z),
+            2.0 * (x * y - w * z),
+            2.0 * (x * z + w * y)
+        ), axis=-1),
+        np.stack((
+            2.0 * (x * y + w * z),
+            1.0 - 2.0 * (x * x + z * z),
+            2.0 * (y * z - w * x)
+        ), axis=-1),
+        np.stack((
+            2.0 * (x * z - w * y),
+            2.0 * (y * z + w * x),
+            1.0 - 2.0 * (x * x + y * y)
+        ), axis=-1)
+    ), axis=-2)
+
+
+def matrix_to_quaternion(rots):
+    """
+    Converts (..., 3, 3) orthonormal rotation matrices to WXYZ quaternions
+    with a non-negative W component.
+    """
+    m = rots
+    trace = m[..., 0, 0] + m[..., 1, 1] + m[..., 2, 2]
+    candidates = np.stack((
+        np.stack((
+            1.0 + trace,
+            m[..., 2, 1] - m[..., 1, 2],
+            m[..., 0, 2] - m[..., 2, 0],
+            m[..., 1, 0] - m[..., 0, 1]
+        ), axis=-1),
+        np.stack((
+            m[..., 2, 1] - m[..., 1, 2],
+            1.0 + m[..., 0, 0] - m[..., 1, 1] - m[..., 2, 2],
+            m[..., 0, 1] + m[..., 1, 0],
+            m[..., 0, 2] + m[..., 2, 0]
+        ), axis=-1),
+        np.stack((
+            m[..., 0, 2] - m[..., 2, 0],
+            m[..., 0, 1] + m[..., 1, 0],
+            1.0 - m[..., 0, 0] + m[..., 1, 1] - m[..., 2, 2],
+            m[..., 1, 2] + m[..., 2, 1]
+        ), axis=-1),
+        np.stack((
+            m[..., 1, 0] - m[..., 0, 1],
+            m[..., 0, 2] + m[..., 2, 0],
+            m[..., 1, 2] + m[..., 2, 1],
+            1.0 - m[..., 0, 0] - m[..., 1, 1] + m[..., 2, 2]
+        ), axis=-1)
+    ), axis=-2)
+    # Pick the numerically largest of the four formulations per matrix
+    diagonal = np.stack((
+        trace,
+        m[..., 0, 0],
+        m[..., 1, 1],
+        m[..., 2, 2]
+    ), axis=-1)
+    best = np.argmax(diagonal, axis=-1)
+    quats = np.take_along_axis(
+        candidates, best[..., np.newaxis, np.newaxis], axis=-2
+    )[..., 0, :]
+    quats /= np.linalg.norm(quats, axis=-1, keepdims=True)
+    return np.where(quats[..., :1] < 0.0, -quats, quats)
+
+
+def compose_matrices(locs, quats, scales=None):
+    """Builds (..., 4, 4) matrices from locations, quaternions and scales"""
+    rots = quaternion_to_matrix(quats)
+    if scales is not None:
+        rots = rots * scales[..., np.newaxis, :]
+    matrices = np.zeros(rots.shape[:-2] + (4, 4))
+    matrices[..., :3, :3] = rots
+    matrices[..., :3, 3] = locs
+    matrices[..., 3, 3] = 1.0
+    return matrices
+
+
+def decompose_matrices(matrices):
+    """
+    Splits (..., 4, 4) matrices into locations, WXYZ quaternions and scales
+    """
+    locs = matrices[..., :3, 3]
+    scales = np.linalg.norm(matrices[..., :3, :3], axis=-2)
+    rots = matrices[..., :3, :3] / scales[..., np.newaxis, :]
+    return locs, matrix_to_quaternion(rots), scales
+
+
+def remove_scale(matrices):
+    """Returns (..., 4, 4) matrices with only the location and rotation"""
+    locs, quats, _ = decompose_matrices(matrices)
+    return compose_matrices(locs, quats)
+
+
+def get_basis_matrices(
+    pose_matrices,
+    rest,
+    parent_rest=None,
+    parent_pose=None
+):
+    """
+    Converts armature space pose matrices of a bone with the given rest
+    matrix to its local basis (the matrices its loc/rot/scale channels
+    describe), given the rest and armature space pose matrices of its
+    parent, if any.
+    """
+    if parent_rest is not None:
+        offset = np.linalg.inv(parent_rest) @ rest
+        return np.linalg.inv(parent_pose @ offset) @ pose_matrices
+    return np.linalg.inv(rest) @ pose_matrices
+
+
+def matrix_to_euler_z(rots):
+    """
+    Returns the Z component of the XYZ euler decomposition of (..., 3, 3)
+    rotation matrices, choosing the smaller of the two equivalent eulers the
+    same way Blender does for the Copy Rotation constraint.
+    """
+    cy = np.hypot(rots[..., 0, 0], rots[..., 1, 0])
+    degenerate = cy <= 16.0 * np.finfo(np.float32).eps
+
+    x1 = np.arctan2(rots[..., 2, 1], rots[..., 2, 2])
+    y1 = np.arctan2(-rots[..., 2, 0], cy)
+    z1 = np.arctan2(rots[..., 1, 0], rots[..., 0, 0])
+    x2 = np.arctan2(-rots[..., 2, 1], -rots[..., 2, 2])
+    y2 = np.arctan2(-rots[..., 2, 0], -cy)
+    z2 = np.arctan2(-rots[..., 1, 0], -rots[..., 0, 0])
+
+    size1 = np.abs(x1) + np.abs(y1) + np.abs(z1)
+    size2 = np.abs(x2) + np.abs(y2) + np.abs(z2)
+    z = np.where(size1 > size2, z2, z1)
+    return np.where(degenerate, 0.0, z)
+
+
+def z_rotation_quaternions(angles):
+    """Returns WXYZ quaternions for rotations of angles about the Z axis"""
+    quats = np.zeros(np.shape(angles) + (4,))
+    quats[..., 0] = np.cos(angles * 0.5)
+    quats[..., 3] = np.sin(angles * 0.5)
+    return quats
+
+
+def euler_to_matrix(eulers, order='XYZ'):
+    """
+    Converts (..., 3) euler angles to (..., 3, 3) rotation matrices, using
+    Blender's convention that the first axis of order is applied first.
+    """
+    matrices = np.broadcast_to(np.eye(3), np.shape(eulers)[:-1] + (3, 3))
+    for axis in order:
+        i = 'XYZ'.index(axis)
+        angles = eulers[..., i]
+        c, s = np.cos(angles), np.sin(angles)
+        j, k = (i + 1) % 3, (i + 2) % 3
+        rot = np.zeros(np.shape(angles) + (3, 3))
+        rot[..., i, i] = 1.0
+        rot[..., j, j] = c
+        rot[..., j, k] = -s
+        rot[..., k, j] = s
+        rot[..., k, k] = c
+        matrices = rot @ matrices
+    return matrices
+
+
+def axis_angle_to_quaternion(axis_angles):
+    """Converts (..., 4) angle + XYZ axis rotations to WXYZ quaternions"""
+    angles = axis_angles[..., 0]
+    axes = axis_angles[..., 1:]
+    lengths = np.linalg.norm(axes, axis=-1, keepdims=True)
+    axes = np.divide(
+        axes, lengths, out=np.zeros_like(axes), where=lengths > 0.0
+    )
+    quats = np.empty(np.shape(axis_angles))
+    quats[..., 0] = np.cos(angles * 0.5)
+    quats[..., 1:] = axes * np.sin(angles * 0.5)[..., np.newaxis]
+    return quats
+
+
+def get_positional_error(approx, values):
+    return np.linalg.norm(approx - values, axis=1)
+
+
+def get_angular_error(approx, values):
+    """Returns the angle between the interpolated and exact quaternions"""
+    # Interpolating across a sign flip can pass through a null quaternion.
+    approx = approx / np.fmax(
+        np.linalg.norm(approx, axis=1, keepdims=True), 1e-12)
+    values = values / np.linalg.norm(values, axis=1, keepdims=True)
+    dot = np.abs(np.einsum('ij,ij->i', approx, values))
+    return 2.0 * np.arccos(np.clip(dot, 0.0, 1.0))
+
+
+def get_component_error(approx, values):
+    return np.abs(approx - values).max(axis=1)
@@ -1,5 +1,7 @@
 from bpy.types import UILayout, UIList, Panel
 
+from .jobs import job_queue
+
 
 class NKT_PT_toolshelf(Panel):
     bl_label = "Novkreed Tools"
@@ -26,8 +28,10 @@ class ACTION_UL_character_actions(UIList):
     ):
         rootmotion_icon = UILayout.enum_item_icon(
             item, 'rootmotion_type', item.rootmotion_type)
-        layout.prop(data=item, property='name', emboss=False,
-                    text="", icon_value=rootmotion_icon)
+        row = layout.row(align=True)
+        row.prop(data=item, property='selected', text="")
+        row.prop(data=item, property='name', emboss=False,
+                 text="", icon_value=rootmotion_icon)
 
 
 class NKT_PT_character_panel(Panel):
@@ -46,6 +50,9 @@ class NKT_PT_character_panel(Panel):
             property='menu_options',
             icon='COMMUNITY'
         )
+        layout.prop(settings, 'bone_map_profile')
+        if settings.bone_map_profile == 'CUSTOM':
+            layout.prop(settings, 'bone_map_file')
 
         if len(settings.characters) == 0:
             return
@@ -94,6 +101,12 @@ class NKT_PT_character_panel(Panel):
             if settings.rootmotion.use_translation[2]:
                 box.prop(settings.rootmotion, 'on_ground', toggle=True)
             box.prop(settings.rootmotion, 'use_rotation', toggle=True)
+            box.prop(settings.rootmotion, 'use_direct_bake')
+            box.prop(settings.rootmotion, 'use_isolation')
+            row = box.row(align=True)
+            row.prop(settings.rootmotion, 'use_workers')
+            if settings.rootmotion.use_workers:
+                row.prop(settings.rootmotion, 'worker_count')
 
             box.separator()
             column = box.column(align=True)
@@ -107,6 +120,15 @@ class NKT_PT_character_panel(Panel):
             )
             box.operator(
                 operator='nkt.character_add_rootmotion', icon='BONE_DATA')
+            row = box.row(align=True)
+            row.operator(
+                operator='nkt.character_add_rootmotion',
+                text="Bake Selected"
+            ).target = 'SELECTED'
+            row.operator(
+                operator='nkt.character_add_rootmotion',
+                text="Bake All"
+            ).target = 'ALL'
 
         layout.separator()
 
@@ -115,5 +137,56 @@ class NKT_PT_character_panel(Panel):
         box.prop(character, 'export_name')
         box.prop(character, 'export_path')
         box.prop(character, 'export_format')
+        box.prop(character, 'use_export_preparation')
+        if character.use_export_preparation:
+            column = box.column(align=True)
+            column.prop(character, 'export_sample_rate')
+            column.prop(character, 'export_location_precision')
+            column.prop(character, 'export_location_error')
+            column.prop(character, 'export_rotation_error')
+        if character.export_format != 'CLIPS':
+            box.prop(character, 'export_mode')
+            row = box.row(align=True)
+            row.prop(character, 'use_export_workers')
+            if character.use_export_workers:
+                row.prop(character, 'export_worker_count')
+                if character.export_mode == 'SINGLE':
+                    box.prop(character, 'merge_export_shards')
         if character.export_path and character.export_name:
             box.operator("nkt.character_quick_export", icon='EXPORT')
+
+
+class NKT_PT_jobs_panel(Panel):
+    bl_label = "Jobs"
+    bl_parent_id = 'NKT_PT_toolshelf'
+    bl_space_type = "VIEW_3D"
+    bl_region_type = "UI"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        settings = context.scene.nkt_settings
+
+        layout = self.layout
+        layout.prop(settings, 'use_background_jobs')
+
+        for i, job in enumerate(job_queue):
+            box = layout.box()
+            row = box.row(align=True)
+            row.label(
+                text="{} ({:.0%})".format(job.name, job.progress),
+                icon='SORTTIME' if job.is_active else 'CHECKMARK'
+            )
+            if job.state == 'PAUSED':
+                op = row.operator('nkt.job_control', text="", icon='PLAY')
+                op.job_index = i
+                op.action = 'RESUME'
+            if job.is_active:
+                op = row.operator('nkt.job_control', text="", icon='PAUSE')
+                op.job_index = i
+                op.action = 'PAUSE'
+            if job.is_active or job.state == 'PAUSED':
+                op = row.operator('nkt.job_control', text="", icon='CANCEL')
+                op.job_index = i
+                op.action = 'CANCEL'
+            for _, message in job.messages[-3:]:
+                box.label(text=message.strip().split('\n')[-1])
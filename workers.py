@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+import bpy
+
+worker_tasks = {}
+
+
+def worker_task(name):
+    """
+    Registers the decorated function as a task that background workers can
+    run. The function gets the json arguments of the job and returns a json
+    serializable result.
+    """
+    def decorator(function):
+        worker_tasks[name] = function
+        return function
+    return decorator
+
+
+def get_worker_command(task, args, blend_file=None):
+    """
+    Returns the command line that runs a registered task in a background
+    Blender process with this add-on registered.
+    """
+    addon_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    expr = (
+        "import sys, importlib; sys.path.insert(0, {!r}); "
+        "addon = importlib.import_module({!r}); addon.register(); "
+        "importlib.import_module({!r}).run_worker()"
+    ).format(addon_root, __package__, __name__)
+
+    command = [bpy.app.binary_path, '-b', '--factory-startup']
+    if blend_file:
+        command.append(blend_file)
+    command.extend([
+        '--python-exit-code', '1',
+        '--python-expr', expr,
+        '--', json.dumps({'task': task, 'args': args})
+    ])
+    return command
+
+
+def run_worker():
+    """Entry point of background workers, see get_worker_command"""
+    job = json.loads(sys.argv[sys.argv.index('--') + 1])
+    args = job['args']
+    result = worker_tasks[job['task']](args)
+    if args.get('result_path'):
+        with open(args['result_path'], 'w') as result_file:
+            json.dump(result, result_file)
+
+
+def iter_worker_tasks(task, args_list, blend_file=None, poll_interval=0.02):
+    """
+    Generator running the task once per arguments in args_list, each in its
+    own background Blender process. Waits up to poll_interval seconds on the
+    workers per step, yields the fraction of finished workers and returns
+    one (result, log) pair per job, with result None if the worker failed.
+    """
+    with tempfile.TemporaryDirectory(prefix='nkt_workers_') as temp_dir:
+        processes = []
+        try:
+            for i, args in enumerate(args_list):
+                args = dict(args)
+                args['result_path'] = os.path.join(
+                    temp_dir, 'result_{}.json'.format(i))
+                log_path = os.path.join(temp_dir, 'log_{}.txt'.format(i))
+                with open(log_path, 'w') as log_file:
+                    process = subprocess.Popen(
+                        get_worker_command(task, args, blend_file),
+                        stdout=log_file,
+                        stderr=subprocess.STDOUT
+                    )
+                processes.append((process, args['result_path'], log_path))
+
+            while True:
+                running = [
+                    process for process, _, _ in processes
+                    if process.poll() is None
+                ]
+                if not running:
+                    break
+                try:
+                    running[0].wait(timeout=poll_interval)
+                except subprocess.TimeoutExpired:
+                    pass
+                yield 1.0 - len(running) / len(processes)
+        finally:
+            # Workers of a cancelled job must not outlive it.
+            for process, _, _ in processes:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+        results = []
+        for process, result_path, log_path in processes:
+            with open(log_path) as log_file:
+                log = log_file.read()
+            result = None
+            if process.returncode == 0 and os.path.exists(result_path):
+                with open(result_path) as result_file:
+                    result = json.load(result_file)
+            results.append((result, log))
+
+    return results
+
+
+def run_worker_tasks(task, args_list, blend_file=None, poll_interval=0.1):
+    """Runs iter_worker_tasks to completion, see there"""
+    tasks = iter_worker_tasks(task, args_list, blend_file, poll_interval)
+    while True:
+        try:
+            next(tasks)
+        except StopIteration as stop:
+            return stop.value
+
+
+def split_jobs(items, worker_count):
+    """Splits items into at most worker_count non empty interleaved chunks"""
+    worker_count = max(1, min(worker_count, len(items)))
+    return [items[i::worker_count] for i in range(worker_count)]